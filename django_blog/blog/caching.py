@@ -0,0 +1,60 @@
+"""Anonymous post detail pages cached under the post's modification, comments and likes versions."""
+import time
+
+from django.core.cache import cache
+from . import conf
+from .models import Post
+
+DEFAULTS = {
+    "TTL": 300,
+}
+PAGE_KEY = "post-page:{}:{}"
+MODIFIED_KEY = "post-modified:{}"
+COMMENTS_KEY = "post-comments:{}"
+LIKES_KEY = "post-likes:{}"
+
+
+def get_options():
+    return conf.get_options("POST_PAGE_CACHE", DEFAULTS)
+
+
+def set_modified(post_id, modified):
+    cache.set(MODIFIED_KEY.format(post_id), modified.isoformat(), None)
+
+
+def bump(key_format, post_id):
+    key = key_format.format(post_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Start from the clock so an evicted version cannot repeat an old one
+        cache.set(key, time.time_ns(), None)
+
+
+def forget(post_id):
+    cache.delete_many([key.format(post_id) for key in (MODIFIED_KEY, COMMENTS_KEY, LIKES_KEY)])
+
+
+def page_key(post_id):
+    """Cache key of the post's current page, or None if the post does not exist"""
+    keys = [key.format(post_id) for key in (MODIFIED_KEY, COMMENTS_KEY, LIKES_KEY)]
+    versions = cache.get_many(keys)
+    if keys[0] not in versions:
+        modified = Post.objects.filter(pk=post_id).values_list("updated_date", flat=True).first()
+        if modified is None:
+            return None
+        cache.add(keys[0], modified.isoformat(), None)
+    for key in keys[1:]:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+    if len(versions) < len(keys):
+        versions = cache.get_many(keys)
+    return PAGE_KEY.format(post_id, ":".join(str(versions.get(key)) for key in keys))
+
+
+def get_page(key):
+    return cache.get(key)
+
+
+def set_page(key, content):
+    cache.set(key, content, get_options()["TTL"])
@@ -0,0 +1,64 @@
+"""Category.post_count and TagCount, kept current with F() updates from blog.signals."""
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from taggit.models import Tag, TaggedItem
+from .models import Category, Post, TagCount
+
+
+def adjust_category(category_id, delta):
+    if category_id is not None:
+        Category.objects.filter(pk=category_id).update(post_count=F("post_count") + delta)
+
+
+def adjust_tags(tag_ids, delta):
+    tag_ids = set(tag_ids or ())
+    if not tag_ids:
+        return
+    if delta > 0:
+        # First use of a tag on a post creates its row
+        missing = tag_ids - set(TagCount.objects.filter(tag_id__in=tag_ids).values_list("tag_id", flat=True))
+        TagCount.objects.bulk_create(
+            [TagCount(tag_id=tag.pk, name=tag.name, slug=tag.slug) for tag in Tag.objects.filter(pk__in=missing)],
+            ignore_conflicts=True,
+        )
+    TagCount.objects.filter(tag_id__in=tag_ids).update(post_count=F("post_count") + delta)
+
+
+def rename_tag(tag):
+    TagCount.objects.filter(tag_id=tag.pk).update(name=tag.name, slug=tag.slug)
+
+
+def remember_tags(post):
+    """Note a post's tags before deleting it; its tagged items go without an m2m_changed signal"""
+    post._counted_tag_ids = set(post.tags.values_list("pk", flat=True))
+
+
+def forget_post(post):
+    """Uncount a deleted post"""
+    adjust_category(post.category_id, -1)
+    adjust_tags(getattr(post, "_counted_tag_ids", ()), -1)
+
+
+def rebuild_counts():
+    posts = (
+        Post.objects.filter(category=OuterRef("pk"))
+        .order_by()
+        .values("category")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    Category.objects.update(post_count=Coalesce(Subquery(posts), 0))
+    # Items whose post was removed without the ORM would otherwise be counted
+    items = TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post), object_id__in=Post.objects.values("pk")
+    )
+    counts = items.order_by().values("tag_id", "tag__name", "tag__slug").annotate(total=Count("pk"))
+    TagCount.objects.all().delete()
+    TagCount.objects.bulk_create(
+        [
+            TagCount(tag_id=row["tag_id"], name=row["tag__name"], slug=row["tag__slug"], post_count=row["total"])
+            for row in counts
+        ],
+        batch_size=1000,
+    )
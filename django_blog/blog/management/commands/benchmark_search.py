@@ -0,0 +1,98 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from taggit.models import Tag, TaggedItem
+from blog.models import Category, Post
+from blog.search import rebuild_index, search_posts
+
+VOCABULARY_SIZE = 20000
+TAG_COUNT = 500
+CATEGORY_COUNT = 20
+# In the content of every generated post, so searching for it ranks the whole corpus
+COMMON_WORD = 'everywhere'
+
+
+def build_vocabulary(rng):
+    """A fixed vocabulary of made-up words, large enough that any one of them matches few posts"""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choices(letters, k=rng.randint(4, 9))) for _ in range(VOCABULARY_SIZE)]
+
+
+class Command(BaseCommand):
+    help = 'Compare icontains search against the full-text index on a generated corpus (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=500000, help='Number of posts to generate')
+        parser.add_argument('--queries', type=int, default=20, help='Number of search terms to time')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        vocabulary = build_vocabulary(rng)
+        # icontains can stop at the first hit for words in the corpus, but must read every post for missing ones
+        term_sets = {
+            'present': [rng.choice(vocabulary) for _ in range(options['queries'])],
+            'common': [COMMON_WORD] * options['queries'],
+            'absent': [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=12)) for _ in range(options['queries'])],
+        }
+
+        # The generated corpus is rolled back at the end
+        with transaction.atomic():
+            started = time.perf_counter()
+            self.generate(options['posts'], options['batch_size'], rng, vocabulary)
+            self.stdout.write(f'Generated {options["posts"]} posts in {time.perf_counter() - started:.2f}s')
+            started = time.perf_counter()
+            rebuild_index()
+            self.stdout.write(f'Indexed {options["posts"]} posts in {time.perf_counter() - started:.2f}s')
+
+            for label, terms in term_sets.items():
+                # What PostSearchView used to run
+                legacy = self.time_queries(terms, lambda term: Post.objects.for_listing().filter(
+                    Q(title__icontains=term) | Q(content__icontains=term) | Q(tags__name__icontains=term)
+                ).distinct())
+                indexed = self.time_queries(terms, lambda term: search_posts(Post.objects.for_listing(), term))
+                self.stdout.write(f'{label} terms - icontains: {legacy * 1000:.1f} ms/query, '
+                                  f'full-text: {indexed * 1000:.1f} ms/query')
+            transaction.set_rollback(True)
+
+    def generate(self, total, batch_size, rng, vocabulary):
+        author, _ = User.objects.get_or_create(username='search_benchmark')
+        categories = Category.objects.bulk_create([
+            Category(name=f'Benchmark {word}', slug=f'benchmark-{i}')
+            for i, word in enumerate(rng.sample(vocabulary, CATEGORY_COUNT))
+        ])
+        tags = Tag.objects.bulk_create([
+            Tag(name=word, slug=f'benchmark-{i}') for i, word in enumerate(rng.sample(vocabulary, TAG_COUNT))
+        ])
+        content_type = ContentType.objects.get_for_model(Post)
+        created = 0
+        while created < total:
+            size = min(batch_size, total - created)
+            # bulk_create sends no signals, so the index is built once at the end
+            posts = Post.objects.bulk_create([
+                Post(
+                    author=author,
+                    category=rng.choice(categories),
+                    title=' '.join(rng.choices(vocabulary, k=6)),
+                    content=' '.join(rng.choices(vocabulary, k=59) + [COMMON_WORD]),
+                )
+                for _ in range(size)
+            ])
+            TaggedItem.objects.bulk_create([
+                TaggedItem(tag=tag, content_type=content_type, object_id=post.pk)
+                for post in posts
+                for tag in rng.sample(tags, 3)
+            ])
+            created += size
+
+    def time_queries(self, terms, build_queryset):
+        # First page of results, as the search page would serve it
+        started = time.perf_counter()
+        for term in terms:
+            list(build_queryset(term)[:5])
+        return (time.perf_counter() - started) / len(terms)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from blog import widgets
+from blog.counts import rebuild_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized per-category and per-tag post counts'
+
+    def handle(self, *args, **options):
+        rebuild_counts()
+        widgets.mark_stale(widgets.POPULAR_TAGS)
+        self.stdout.write(self.style.SUCCESS('Post counts rebuilt'))
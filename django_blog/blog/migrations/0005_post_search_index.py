@@ -0,0 +1,54 @@
+from django.db import migrations
+
+FTS_TABLE = "blog_post_fts"
+POST_CONTENT_TYPE = "SELECT id FROM django_content_type WHERE app_label = 'blog' AND model = 'post'"
+TAG_NAMES = (
+    "(SELECT {} FROM taggit_taggeditem ti JOIN taggit_tag t ON t.id = ti.tag_id "
+    f"WHERE ti.object_id = blog_post.id AND ti.content_type_id = ({POST_CONTENT_TYPE}))"
+)
+CATEGORY_NAME = "(SELECT name FROM blog_category WHERE blog_category.id = blog_post.category_id)"
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(blog_post.title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(" + TAG_NAMES.format("string_agg(t.name, ' ')") + ", '')), 'B') || "
+    f"setweight(to_tsvector('english', coalesce({CATEGORY_NAME}, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(blog_post.content, '')), 'C')"
+)
+SQLITE_DOCUMENTS = (
+    "SELECT id, title, content, coalesce(" + TAG_NAMES.format("group_concat(t.name, ' ')") + ", ''), "
+    f"coalesce({CATEGORY_NAME}, '') FROM blog_post"
+)
+
+
+def create_search_index(apps, schema_editor):
+    """Create the backend-specific full-text index and fill it from existing posts"""
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("ALTER TABLE blog_post ADD COLUMN search_vector tsvector")
+        schema_editor.execute("CREATE INDEX blog_post_search_vector_idx ON blog_post USING gin (search_vector)")
+        schema_editor.execute(f"UPDATE blog_post SET search_vector = {POSTGRES_VECTOR}")
+    elif vendor == "sqlite":
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, content, tags, category)")
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, content, tags, category) {SQLITE_DOCUMENTS}"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("ALTER TABLE blog_post DROP COLUMN search_vector")
+    elif vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("blog", "0004_category_alter_comment_options_alter_post_options_and_more"),
+        ("contenttypes", "0002_remove_content_type_name"),
+        ("taggit", "0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-18 07:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counts(apps, schema_editor):
+    Category = apps.get_model("blog", "Category")
+    Post = apps.get_model("blog", "Post")
+    TagCount = apps.get_model("blog", "TagCount")
+    TaggedItem = apps.get_model("taggit", "TaggedItem")
+    ContentType = apps.get_model("contenttypes", "ContentType")
+
+    posts = Post.objects.filter(category=OuterRef("pk")).order_by().values("category").annotate(
+        total=Count("pk")
+    ).values("total")
+    Category.objects.update(post_count=Coalesce(Subquery(posts), 0))
+
+    # A fresh database has no content types yet, and no tagged posts either
+    content_type = ContentType.objects.filter(app_label="blog", model="post").first()
+    if content_type is None:
+        return
+    counts = (
+        TaggedItem.objects.filter(content_type=content_type, object_id__in=Post.objects.values("pk"))
+        .order_by()
+        .values("tag_id", "tag__name", "tag__slug")
+        .annotate(total=Count("pk"))
+    )
+    TagCount.objects.bulk_create(
+        [
+            TagCount(tag_id=row["tag_id"], name=row["tag__name"], slug=row["tag__slug"], post_count=row["total"])
+            for row in counts
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_post_search_index'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='taggit.tag')),
+                ('name', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=100)),
+                ('post_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['name'],
+                'indexes': [models.Index(fields=['-post_count', 'name'], name='blog_tagcou_post_co_6bb812_idx')],
+            },
+        ),
+        migrations.RunPython(fill_counts, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from taggit.managers import TaggableManager
+from taggit.models import Tag
 
 
 class Category(models.Model):
@@ -9,6 +12,8 @@ class Category(models.Model):
     slug = models.SlugField(unique=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Maintained by blog.counts
+    post_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name_plural = "Categories"
@@ -16,11 +21,42 @@ class Category(models.Model):
     
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        # Never write back a post_count read before the counter last moved
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != "post_count"
+            ]
+        super().save(*args, **kwargs)
     
     def get_absolute_url(self):
         return reverse("posts-by-category", kwargs={"slug": self.slug})
 
 
+def related_count(model):
+    """Subquery counting the `model` rows of each post, 0 when there are none"""
+    counts = (
+        model.objects.filter(post=OuterRef("pk"))
+        .order_by()
+        .values("post")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Everything the post list templates show, in a constant number of queries per page"""
+        return (
+            self.select_related("author", "category")
+            .prefetch_related("tags")
+            .annotate(like_count=related_count(Like), comment_count=related_count(Comment))
+        )
+
+
 class Post(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
@@ -32,6 +68,8 @@ class Post(models.Model):
     is_featured = models.BooleanField(default=False)
     view_count = models.PositiveIntegerField(default=0)
 
+    objects = PostQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
@@ -81,3 +119,22 @@ class PostView(models.Model):
     
     class Meta:
         unique_together = ('user', 'post', 'ip_address')
+
+
+class TagCount(models.Model):
+    """Number of posts carrying a tag, maintained by blog.counts"""
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True)
+    # Copied from the tag so tag listings never join taggit's tables
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100)
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["name"]
+        indexes = [models.Index(fields=["-post_count", "name"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.post_count})"
+
+    def get_absolute_url(self):
+        return reverse("posts-by-tag", kwargs={"tag_slug": self.slug})
@@ -0,0 +1,200 @@
+"""Ranked full-text search over post titles, content, tags and category name (index built by migration 0005)."""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Substr
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+FTS_TABLE = "blog_post_fts"
+SEARCH_CONFIG = "english"
+# Per column weights: title, content, tags, category
+TITLE_WEIGHT = 4.0
+CONTENT_WEIGHT = 1.0
+TAGS_WEIGHT = 2.0
+CATEGORY_WEIGHT = 2.0
+SNIPPET_WORDS = 32
+RANK_FUNCTION = f"bm25({TITLE_WEIGHT}, {CONTENT_WEIGHT}, {TAGS_WEIGHT}, {CATEGORY_WEIGHT})"
+# Control characters never appear in post text, so they cannot be forged by authors
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+POST_CONTENT_TYPE = "SELECT id FROM django_content_type WHERE app_label = 'blog' AND model = 'post'"
+
+
+def _tag_names(aggregate):
+    return (
+        f"(SELECT {aggregate} FROM taggit_taggeditem ti JOIN taggit_tag t ON t.id = ti.tag_id "
+        f"WHERE ti.object_id = blog_post.id AND ti.content_type_id = ({POST_CONTENT_TYPE}))"
+    )
+
+
+SQLITE_TAG_NAMES = _tag_names("group_concat(t.name, ' ')")
+POSTGRES_TAG_NAMES = _tag_names("string_agg(t.name, ' ')")
+CATEGORY_NAME = "(SELECT name FROM blog_category WHERE blog_category.id = blog_post.category_id)"
+SQLITE_DOCUMENTS = (
+    f"SELECT id, title, content, coalesce({SQLITE_TAG_NAMES}, ''), "
+    f"coalesce({CATEGORY_NAME}, '') FROM blog_post"
+)
+POSTGRES_VECTOR = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(blog_post.title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({POSTGRES_TAG_NAMES}, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({CATEGORY_NAME}, '')), 'B') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(blog_post.content, '')), 'C')"
+)
+
+
+def _fts_expression(query):
+    """Turn the words of `query` into quoted prefix terms; FTS5 operators typed by users are never parsed"""
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def index_posts(post_ids):
+    """Add or refresh the search index entries of the given posts"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(post_ids))
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"UPDATE blog_post SET search_vector = {POSTGRES_VECTOR} WHERE id IN ({placeholders})", post_ids
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", post_ids)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, content, tags, category) "
+                f"{SQLITE_DOCUMENTS} WHERE id IN ({placeholders})",
+                post_ids,
+            )
+
+
+def index_post(post):
+    """Re-index a single post"""
+    index_posts([post.pk])
+
+
+def remove_post(post_id):
+    """Remove the FTS5 row of a deleted post"""
+    # Nothing to do on PostgreSQL: the tsvector column was deleted along with the post
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post_id])
+
+
+def rebuild_index():
+    """Re-index all posts, e.g. after bulk imports that bypass the signal handlers"""
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"UPDATE blog_post SET search_vector = {POSTGRES_VECTOR}")
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, title, content, tags, category) {SQLITE_DOCUMENTS}")
+
+
+def search_posts(queryset, query):
+    """
+    Posts of `queryset` matching `query`, most relevant first, with `search_rank`
+    (higher is more relevant), `search_title` and `search_snippet` (highlighted,
+    see mark_matches). On SQLite this is a RankedMatches sequence rather than a
+    queryset. Backends without an index fall back to icontains.
+    """
+    if connection.vendor == "postgresql":
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        options = f"StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords={SNIPPET_WORDS}, MinWords=12"
+        matches = RawSQL(f"SELECT id FROM blog_post WHERE search_vector @@ {tsquery}", [query])
+        # ts_headline re-parses the text, but only for the rows of the page being rendered
+        return queryset.filter(pk__in=matches).annotate(
+            search_rank=RawSQL(f'ts_rank("blog_post"."search_vector", {tsquery})', [query], output_field=FloatField()),
+            search_title=RawSQL(
+                f"ts_headline('{SEARCH_CONFIG}', \"blog_post\".\"title\", {tsquery}, %s)",
+                [query, f"{options}, HighlightAll=true"],
+                output_field=TextField(),
+            ),
+            search_snippet=RawSQL(
+                f"ts_headline('{SEARCH_CONFIG}', \"blog_post\".\"content\", {tsquery}, %s)",
+                [query, options],
+                output_field=TextField(),
+            ),
+        ).order_by("-search_rank", "-published_date")
+
+    if connection.vendor == "sqlite":
+        expression = _fts_expression(query)
+        if not expression:
+            return queryset.none()
+        return RankedMatches(queryset, expression)
+
+    matching = queryset.model.objects.filter(
+        Q(title__icontains=query)
+        | Q(content__icontains=query)
+        | Q(tags__name__icontains=query)
+        | Q(category__name__icontains=query)
+    )
+    return queryset.filter(pk__in=matching.values("pk")).annotate(
+        search_rank=Value(0.0, output_field=FloatField()),
+        search_title=F("title"),
+        search_snippet=Substr("content", 1, 200),
+    ).order_by("-published_date")
+
+
+class RankedMatches:
+    """
+    The SQLite hits of an FTS5 expression, best first, as a sequence Paginator
+    can count and slice. A slice ranks the hits in one FTS statement and runs
+    highlight()/snippet() only for its own posts, which `queryset` loads.
+    """
+
+    def __init__(self, queryset, expression):
+        self.queryset = queryset
+        self.expression = expression
+
+    def count(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [self.expression])
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        limit = -1 if index.stop is None else max(index.stop - start, 0)
+        match = f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        with connection.cursor() as cursor:
+            # rank is bm25(), lower-is-better; negated it sorts like ts_rank on PostgreSQL
+            cursor.execute(
+                f"SELECT rowid, -rank {match} AND rank MATCH '{RANK_FUNCTION}' "
+                f"ORDER BY rank, rowid DESC LIMIT %s OFFSET %s",
+                [self.expression, limit, start],
+            )
+            ranks = dict(cursor.fetchall())
+            if not ranks:
+                return []
+            placeholders = ", ".join(["%s"] * len(ranks))
+            cursor.execute(
+                f"SELECT rowid, highlight({FTS_TABLE}, 0, %s, %s), "
+                f"snippet({FTS_TABLE}, 1, %s, %s, '…', {SNIPPET_WORDS}) "
+                f"{match} AND rowid IN ({placeholders})",
+                [MATCH_START, MATCH_END, MATCH_START, MATCH_END, self.expression, *ranks],
+            )
+            highlights = {rowid: (title, snippet) for rowid, title, snippet in cursor.fetchall()}
+        posts = self.queryset.in_bulk(list(ranks))
+        page = []
+        for post_id, rank in ranks.items():
+            if post_id in posts and post_id in highlights:
+                post = posts[post_id]
+                post.search_rank = rank
+                post.search_title, post.search_snippet = highlights[post_id]
+                page.append(post)
+        return page
+
+
+def mark_matches(text):
+    """Escape highlighted search output and wrap its matches in <mark>"""
+    marked = escape(text or "").replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+    return mark_safe(marked)
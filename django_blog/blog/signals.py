@@ -0,0 +1,98 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from taggit.models import Tag
+from . import caching, counts, search, widgets
+from .models import Category, Comment, Like, Post
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, update_fields=None, **kwargs):
+    # The category counts need to know which category an edited post is leaving
+    if instance.pk is not None and (update_fields is None or "category" in update_fields):
+        instance._old_category_id = (
+            Post.objects.filter(pk=instance.pk).values_list("category_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    caching.set_modified(instance.pk, instance.updated_date)
+    search.index_post(instance)
+    old_category_id = None if created else getattr(instance, "_old_category_id", instance.category_id)
+    if old_category_id != instance.category_id:
+        counts.adjust_category(old_category_id, -1)
+        counts.adjust_category(instance.category_id, 1)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    counts.remember_tags(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    caching.forget(instance.pk)
+    search.remove_post(instance.pk)
+    counts.forget_post(instance)
+    widgets.mark_stale(widgets.POPULAR_TAGS)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_counted(sender, instance, action, pk_set, **kwargs):
+    if not isinstance(instance, Post):
+        return
+    # taggit only reports the tags actually added or removed; clear() reports none
+    if action == "pre_clear":
+        instance._cleared_tag_ids = set(instance.tags.values_list("pk", flat=True))
+    elif action == "post_clear":
+        counts.adjust_tags(getattr(instance, "_cleared_tag_ids", ()), -1)
+    elif action == "post_add":
+        counts.adjust_tags(pk_set, 1)
+    elif action == "post_remove":
+        counts.adjust_tags(pk_set, -1)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_changed(sender, instance, action, **kwargs):
+    # Tags are saved after the post itself, so its page changes once more
+    if isinstance(instance, Post) and action in ("post_add", "post_remove", "post_clear"):
+        caching.set_modified(instance.pk, timezone.now())
+        search.index_post(instance)
+        widgets.mark_stale(widgets.POPULAR_TAGS)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    # A renamed tag changes its count row and the indexed text of every post carrying it
+    if not created:
+        counts.rename_tag(instance)
+        search.index_posts(Post.objects.filter(tags=instance).values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    if not created:
+        search.index_posts(instance.post_set.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # Its posts are detached with a bulk UPDATE (SET_NULL), so remember them for post_delete
+    instance._search_post_ids = list(instance.post_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    search.index_posts(getattr(instance, "_search_post_ids", []))
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comments_changed(sender, instance, **kwargs):
+    caching.bump(caching.COMMENTS_KEY, instance.post_id)
+    widgets.mark_stale(widgets.RECENT_COMMENTS)
+
+
+@receiver([post_save, post_delete], sender=Like)
+def likes_changed(sender, instance, **kwargs):
+    caching.bump(caching.LIKES_KEY, instance.post_id)
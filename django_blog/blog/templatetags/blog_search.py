@@ -0,0 +1,10 @@
+from django import template
+from blog import search
+
+register = template.Library()
+
+
+@register.filter
+def highlight(text):
+    """Render a search_title/search_snippet annotation with its matches in <mark>"""
+    return search.mark_matches(text)
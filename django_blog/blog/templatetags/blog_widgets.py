@@ -0,0 +1,16 @@
+from django import template
+from blog import widgets
+
+register = template.Library()
+
+# Templates wrap these in {% cache %}, so a cached sidebar does not even read the widget cache
+
+
+@register.inclusion_tag("blog/widgets/popular_tags.html")
+def popular_tags_widget():
+    return {"popular_tags": widgets.get_widget(widgets.POPULAR_TAGS)}
+
+
+@register.inclusion_tag("blog/widgets/recent_comments.html")
+def recent_comments_widget():
+    return {"recent_comments": widgets.get_widget(widgets.RECENT_COMMENTS)}
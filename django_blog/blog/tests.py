@@ -1,3 +1,343 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from . import caching, tracking, widgets
+from .counts import rebuild_counts
+from .models import Category, Comment, Like, Post, PostView, TagCount
+
+
+class ListViewQueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Tech", slug="tech")
+
+    def create_posts(self, count):
+        # Each post gets its own author, tags, a comment and a like so per-row lookups would show up
+        for i in range(count):
+            author = User.objects.create(username=f"author{Post.objects.count()}")
+            post = Post.objects.create(
+                title=f"Searchable post {i}", content="Body", author=author, category=self.category
+            )
+            post.tags.add("django", f"tag{i}")
+            Comment.objects.create(post=post, author=author, content="Nice")
+            Like.objects.create(post=post, user=author)
+
+    def count_queries(self, url):
+        # The first request warms the cached sidebar so only the list itself is measured
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def assert_constant_queries(self, url, expected):
+        self.create_posts(1)
+        few, _ = self.count_queries(url)
+        self.create_posts(9)
+        many, response = self.count_queries(url)
+        self.assertEqual((few, many), (expected, expected))
+        return response
+
+    def test_post_list(self):
+        # COUNT for the paginator, the page of posts, their tags
+        response = self.assert_constant_queries(reverse("post-list"), 3)
+        post = response.context["posts"][0]
+        self.assertEqual((post.like_count, post.comment_count), (1, 1))
+
+    def test_posts_by_tag_are_paginated(self):
+        response = self.assert_constant_queries(reverse("posts-by-tag", args=["django"]), 3)
+        self.assertTrue(response.context["is_paginated"])
+        self.assertEqual(len(response.context["posts"]), 5)
+
+    def test_posts_by_category(self):
+        # Plus the category lookup
+        response = self.assert_constant_queries(reverse("posts-by-category", args=["tech"]), 4)
+        self.assertEqual(response.context["category"].post_count, 10)
+
+    def test_search(self):
+        # COUNT for the paginator, the ranked page of ids, their highlights, the posts, their tags
+        self.assert_constant_queries(reverse("post-search") + "?q=searchable", 5)
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username="author")
+        self.category = Category.objects.create(name="Gardening", slug="gardening")
+
+    def search(self, query, page=1):
+        response = self.client.get(reverse("post-search"), {"q": query, "page": page})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def titles(self, response):
+        return [post.title for post in response.context["posts"]]
+
+    def test_title_matches_rank_above_content_matches(self):
+        Post.objects.create(title="Weekly notes", content="A few words on python packaging", author=self.author)
+        Post.objects.create(title="Python tips", content="Assorted notes", author=self.author)
+        self.assertEqual(self.titles(self.search("python")), ["Python tips", "Weekly notes"])
+
+    def test_tags_and_category_are_indexed(self):
+        tagged = Post.objects.create(title="First", content="Body", author=self.author)
+        tagged.tags.add("kubernetes")
+        Post.objects.create(title="Second", content="Body", author=self.author, category=self.category)
+        self.assertEqual(self.titles(self.search("kubernetes")), ["First"])
+        self.assertEqual(self.titles(self.search("gardening")), ["Second"])
+
+    def test_index_follows_renames_and_deletes(self):
+        post = Post.objects.create(title="First", content="Body", author=self.author, category=self.category)
+        post.tags.add("kubernetes")
+        self.category.name = "Horticulture"
+        self.category.save()
+        tag = post.tags.get()
+        tag.name = "containers"
+        tag.save()
+        self.assertEqual(self.titles(self.search("horticulture")), ["First"])
+        self.assertEqual(self.titles(self.search("containers")), ["First"])
+        self.assertEqual(self.titles(self.search("gardening")), [])
+        self.category.delete()
+        self.assertEqual(self.titles(self.search("horticulture")), [])
+        post.delete()
+        self.assertEqual(self.titles(self.search("containers")), [])
+
+    def test_results_are_highlighted_and_escaped(self):
+        Post.objects.create(title="<b>Python</b> tips", content="Learn python today", author=self.author)
+        response = self.search("python")
+        self.assertContains(response, "&lt;b&gt;<mark>Python</mark>&lt;/b&gt; tips")
+        self.assertContains(response, "Learn <mark>python</mark> today")
+
+    def test_results_are_paginated(self):
+        for i in range(7):
+            Post.objects.create(title=f"Python {i}", content="Body", author=self.author)
+        self.assertEqual(len(self.search("python").context["posts"]), 5)
+        response = self.search("python", page=2)
+        self.assertEqual(len(response.context["posts"]), 2)
+        self.assertContains(response, "?q=python&amp;page=1")
+
+    def test_query_syntax_is_not_interpreted(self):
+        Post.objects.create(title="Python tips", content="Body", author=self.author)
+        self.assertEqual(self.titles(self.search('python" (')), ["Python tips"])
+        self.assertEqual(self.titles(self.search("***")), [])
+
+
+class PostCountsTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create(username="author")
+        self.tech = Category.objects.create(name="Tech", slug="tech")
+        self.food = Category.objects.create(name="Food", slug="food")
+
+    def counts(self):
+        categories = dict(Category.objects.values_list("slug", "post_count"))
+        tags = dict(TagCount.objects.filter(post_count__gt=0).values_list("name", "post_count"))
+        return categories, tags
+
+    def assert_counts(self, categories, tags):
+        self.assertEqual(self.counts(), (categories, tags))
+        # The incremental counts agree with a full recount
+        rebuild_counts()
+        self.assertEqual(self.counts(), (categories, tags))
+
+    def test_counts_follow_post_and_tag_changes(self):
+        first = Post.objects.create(title="First", content="Body", author=self.author, category=self.tech)
+        second = Post.objects.create(title="Second", content="Body", author=self.author, category=self.tech)
+        first.tags.add("django", "python")
+        second.tags.add("django")
+        self.assert_counts({"tech": 2, "food": 0}, {"django": 2, "python": 1})
+
+        second.category = self.food
+        second.save()
+        first.tags.remove("python")
+        second.tags.set(["python", "web"])
+        self.assert_counts({"tech": 1, "food": 1}, {"django": 1, "python": 1, "web": 1})
+
+        second.tags.clear()
+        first.delete()
+        self.assert_counts({"tech": 0, "food": 1}, {})
+
+    def test_saving_a_category_keeps_its_count(self):
+        Post.objects.create(title="First", content="Body", author=self.author, category=self.tech)
+        self.tech.description = "All about tech"
+        self.tech.save()
+        self.tech.refresh_from_db()
+        self.assertEqual(self.tech.post_count, 1)
+
+    def test_tag_index_reads_only_the_counts(self):
+        post = Post.objects.create(title="First", content="Body", author=self.author)
+        post.tags.add("django")
+        tag = post.tags.get()
+        tag.name = "Django"
+        tag.save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("tag-list"))
+        self.assertContains(response, "#Django</a> (1)")
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(any("taggit" in query["sql"] for query in queries))
+
+
+@override_settings(POST_VIEW_TRACKING={"FLUSH_INTERVAL": None, "BATCH_SIZE": 1000})
+class ViewTrackingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        tracking.reset_buffer(setting="POST_VIEW_TRACKING")
+        self.reader = User.objects.create_user(username="reader", password="testpass123")
+        self.post = Post.objects.create(title="First", content="Body", author=self.reader)
+        self.other = Post.objects.create(title="Second", content="Body", author=self.reader)
+
+    def view(self, post):
+        response = self.client.get(reverse("post-detail", args=[post.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def writes(self, queries):
+        return [query["sql"] for query in queries.captured_queries if query["sql"].startswith(("INSERT", "UPDATE"))]
+
+    def test_serving_a_page_writes_nothing(self):
+        self.client.force_login(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            self.view(self.post)
+        self.assertEqual(self.writes(queries), [])
+        self.assertFalse(PostView.objects.exists())
+
+    def test_flush_inserts_each_view_once_and_updates_counts_together(self):
+        for _ in range(3):
+            self.view(self.post)
+        self.view(self.other)
+        self.client.force_login(self.reader)
+        for post in [self.post, self.post, self.other]:
+            self.view(post)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(tracking.get_buffer().flush(), 4)
+        inserts, updates = [], []
+        for sql in self.writes(queries):
+            (inserts if sql.startswith("INSERT") else updates).append(sql)
+        # Both posts gained two views: one bulk insert and a single F() update
+        self.assertEqual((len(inserts), len(updates)), (1, 1))
+        self.assertEqual(PostView.objects.count(), 4)
+        self.assertEqual(
+            dict(Post.objects.values_list("title", "view_count")), {"First": 2, "Second": 2}
+        )
+
+    def test_repeat_and_orphaned_views_are_dropped(self):
+        self.view(self.post)
+        tracking.get_buffer().flush()
+        # Anonymous rows have no user, so the unique constraint cannot catch a repeat
+        self.view(self.post)
+        self.view(self.other)
+        self.other.delete()
+        self.assertEqual(tracking.get_buffer().flush(), 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.view_count, 1)
+        self.assertEqual(PostView.objects.count(), 1)
+
+
+@override_settings(POST_VIEW_TRACKING={"FLUSH_INTERVAL": None, "BATCH_SIZE": 1000})
+class PostPageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        tracking.reset_buffer(setting="POST_VIEW_TRACKING")
+        self.author = User.objects.create_user(username="author", password="testpass123")
+        self.post = Post.objects.create(title="Cached", content="Body", author=self.author)
+        self.url = reverse("post-detail", args=[self.post.pk])
+
+    def page(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_warm_anonymous_hit_needs_no_query(self):
+        first = self.page()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.page(), first)
+
+    def test_comments_likes_and_tags_invalidate_the_page(self):
+        self.page()
+        Comment.objects.create(post=self.post, author=self.author, content="Fresh comment")
+        self.assertIn("Fresh comment", self.page())
+
+        self.assertIn("0 likes", self.page())
+        Like.objects.create(post=self.post, user=self.author)
+        self.assertIn("1 likes", self.page())
+
+        self.post.tags.add("caching")
+        self.assertIn("caching</a>", self.page())
+
+    def test_edits_and_deletes_invalidate_the_page(self):
+        self.page()
+        self.post.title = "Renamed"
+        self.post.save()
+        self.assertIn("Renamed", self.page())
+
+        self.post.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertIsNone(caching.page_key(self.post.pk))
+
+    def test_signed_in_users_get_their_own_page(self):
+        self.page()
+        Like.objects.create(post=self.post, user=self.author)
+        self.client.force_login(self.author)
+        response = self.client.get(self.url)
+        self.assertTrue(response.context["user_has_liked"])
+
+
+@override_settings(BLOG_WIDGETS={"SOFT_TTL": 60, "HARD_TTL": 3600, "ASYNC": False})
+class SidebarWidgetTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="testpass123")
+        self.post = Post.objects.create(title="Tagged", content="Body", author=self.author)
+        self.post.tags.add("django")
+
+    def entry(self, name):
+        return cache.get(widgets.KEY.format(name))
+
+    def test_stale_widgets_are_served_while_one_refresh_runs(self):
+        widgets.get_widget(widgets.POPULAR_TAGS)
+        self.post.tags.add("python")
+        stale = self.entry(widgets.POPULAR_TAGS)[1]
+
+        # Another request already holds the refresh lock
+        cache.add(widgets.KEY.format(widgets.POPULAR_TAGS) + ":lock", True, widgets.LOCK_TTL)
+        with self.assertNumQueries(0):
+            self.assertEqual(widgets.get_widget(widgets.POPULAR_TAGS), stale)
+
+        cache.delete(widgets.KEY.format(widgets.POPULAR_TAGS) + ":lock")
+        names = [tag["name"] for tag in widgets.get_widget(widgets.POPULAR_TAGS)]
+        self.assertEqual(sorted(names), ["django", "python"])
+        self.assertGreater(self.entry(widgets.POPULAR_TAGS)[0], 0)
+
+    @override_settings(BLOG_WIDGETS={"SOFT_TTL": 60, "HARD_TTL": 3600, "ASYNC": True})
+    def test_async_refresh_does_not_block_the_request(self):
+        widgets.get_widget(widgets.RECENT_COMMENTS)
+        widgets.mark_stale(widgets.RECENT_COMMENTS)
+        with mock.patch.object(widgets.threading, "Thread") as thread, self.assertNumQueries(0):
+            self.assertEqual(widgets.get_widget(widgets.RECENT_COMMENTS), [])
+        thread.return_value.start.assert_called_once()
+
+    def test_writes_mark_their_widgets_stale(self):
+        for name in widgets.WIDGETS:
+            widgets.get_widget(name)
+        Comment.objects.create(post=self.post, author=self.author, content="Hello")
+        self.assertEqual(self.entry(widgets.RECENT_COMMENTS)[0], 0)
+        self.assertGreater(self.entry(widgets.POPULAR_TAGS)[0], 0)
+
+        self.post.tags.remove("django")
+        self.assertEqual(self.entry(widgets.POPULAR_TAGS)[0], 0)
+
+    def test_home_page_computes_widgets_only_when_cold(self):
+        url = reverse("post-list")
+        with CaptureQueriesContext(connection) as cold:
+            self.client.get(url)
+        # The paginator COUNT, the page of posts and their tags
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        # An expired sidebar fragment re-renders from the widget cache
+        cache.delete(make_template_fragment_key("blog-sidebar"))
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        self.assertEqual(len(cold.captured_queries), 3 + len(widgets.WIDGETS))
@@ -0,0 +1,127 @@
+"""Post views buffered in memory and written in bulk by a background thread; unflushed views die with the process."""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from .conf import Singleton, get_options
+from .models import Post, PostView
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "FLUSH_INTERVAL": 10.0,
+    "BATCH_SIZE": 1000,
+}
+
+
+def client_ip(request):
+    x_forwarded_for = request.META.get("HTTP_X_FORWARDED_FOR")
+    if x_forwarded_for:
+        return x_forwarded_for.split(",")[0].strip()
+    return request.META.get("REMOTE_ADDR")
+
+
+class ViewBuffer:
+    def __init__(self, flush_interval, batch_size):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.worker = None
+
+    def record(self, post_id, user_id, ip_address):
+        with self.lock:
+            # Repeat views within one flush collapse here
+            self.pending.add((post_id, user_id, ip_address))
+            full = len(self.pending) >= self.batch_size
+        self.ensure_worker()
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        """Write the buffered views; returns the number of new PostView rows"""
+        with self.flush_lock:
+            with self.lock:
+                views, self.pending = self.pending, set()
+            if not views:
+                return 0
+            post_ids = {post_id for post_id, _, _ in views}
+            with transaction.atomic():
+                # Posts deleted since the view was recorded
+                live = set(Post.objects.filter(pk__in=post_ids).values_list("pk", flat=True))
+                # unique_together does not cover anonymous rows (NULL user), so drop seen views first
+                seen = set(
+                    PostView.objects.filter(
+                        post_id__in=post_ids,
+                        ip_address__in={ip for _, _, ip in views},
+                    ).values_list("post_id", "user_id", "ip_address")
+                )
+                new = [view for view in views if view[0] in live and view not in seen]
+                PostView.objects.bulk_create(
+                    [PostView(post_id=post_id, user_id=user_id, ip_address=ip) for post_id, user_id, ip in new],
+                    ignore_conflicts=True,
+                )
+                # One UPDATE per distinct increment rather than one per post
+                by_increment = {}
+                for post_id, count in Counter(post_id for post_id, _, _ in new).items():
+                    by_increment.setdefault(count, []).append(post_id)
+                for count, ids in by_increment.items():
+                    Post.objects.filter(pk__in=ids).update(view_count=F("view_count") + count)
+            return len(new)
+
+    def ensure_worker(self):
+        # Without an interval the buffer is only flushed explicitly (tests)
+        if self.flush_interval is None or (self.worker and self.worker.is_alive()):
+            return
+        self.worker = threading.Thread(target=self.run, name="post-view-flush", daemon=True)
+        self.worker.start()
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Post view flush failed")
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.flush()
+
+
+def _build_buffer():
+    options = get_options("POST_VIEW_TRACKING", DEFAULTS)
+    return ViewBuffer(options["FLUSH_INTERVAL"], options["BATCH_SIZE"])
+
+
+_buffer = Singleton("POST_VIEW_TRACKING", _build_buffer, close=ViewBuffer.stop)
+get_buffer = _buffer.get
+reset_buffer = _buffer.reset
+
+
+@atexit.register
+def flush_on_exit():
+    buffer = _buffer.peek()
+    if buffer is not None:
+        try:
+            buffer.stop()
+        except Exception:
+            logger.exception("Could not flush buffered post views on exit")
+
+
+def record_view(request, post_id):
+    ip_address = client_ip(request)
+    if ip_address:
+        user_id = request.user.pk if request.user.is_authenticated else None
+        get_buffer().record(post_id, user_id, ip_address)
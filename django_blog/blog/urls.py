@@ -9,7 +9,7 @@ from .views import (
     PostDeleteView,
 )
 from .views import CommentCreateView, CommentUpdateView, CommentDeleteView
-from .views import PostSearchView, PostByTagListView, PostByCategoryListView, like_post
+from .views import PostSearchView, PostByTagListView, PostByCategoryListView, TagIndexView, like_post
 
 urlpatterns = [
     path("", PostListView.as_view(), name="post-list"),
@@ -46,6 +46,7 @@ urlpatterns = [
         "comment/<int:pk>/delete/", CommentDeleteView.as_view(), name="comment-delete"
     ),
     path("search/", PostSearchView.as_view(), name="post-search"),
+    path("tags/", TagIndexView.as_view(), name="tag-list"),
     path("tags/<slug:tag_slug>/", PostByTagListView.as_view(), name="posts-by-tag"),
     path("category/<slug:slug>/", PostByCategoryListView.as_view(), name="posts-by-category"),
 ]
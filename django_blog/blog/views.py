@@ -11,9 +11,12 @@ from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from .forms import CustomUserCreationForm, UserUpdateForm, CommentForm, PostForm
 from django.urls import reverse, reverse_lazy
-from .models import Comment, Post, Like, PostView, Category
-from django.db.models import Q
-from django.http import JsonResponse
+from .models import Comment, Post, Like, Category, TagCount
+from . import caching
+from .search import search_posts
+from .tracking import record_view
+from django.db.models import Count, Exists, OuterRef, Prefetch, Subquery
+from django.http import HttpResponse, JsonResponse
 from django.contrib import messages
 
 
@@ -45,71 +48,67 @@ def profile(request):
 # Post views
 class PostListView(DjangoListView):
     model = Post
+    queryset = Post.objects.for_listing()
     template_name = "blog/post_list.html"  # Specify the template to use
     context_object_name = "posts"
     ordering = ["-published_date"]  # Order posts by the published date (newest first)
     paginate_by = 5  # Show 5 posts per page
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        # Add popular tags to context
-        from django.db.models import Count
-        context['popular_tags'] = Post.tags.most_common()[:10]
-        # Add recent comments
-        context['recent_comments'] = Comment.objects.select_related('post', 'author').order_by('-created_at')[:5]
-        return context
+    # The sidebar widgets come from cached template tags, see blog/widgets.py
 
 
 class PostDetailView(DjangoDetailView):
     model = Post
     template_name = "blog/post_detail.html"
 
+    def get_queryset(self):
+        # The post with its like and author post counts in one query, plus tags and comments prefetched
+        author_posts = (
+            Post.objects.filter(author=OuterRef("author"))
+            .order_by()
+            .values("author")
+            .annotate(total=Count("pk"))
+            .values("total")
+        )
+        queryset = (
+            Post.objects.select_related("author", "category")
+            .annotate(like_count=Count("likes"), author_post_count=Subquery(author_posts))
+            .prefetch_related(
+                "tags",
+                Prefetch("comments", queryset=Comment.objects.select_related("author").order_by("-created_at")),
+            )
+        )
+        if self.request.user.is_authenticated:
+            queryset = queryset.annotate(
+                user_has_liked=Exists(Like.objects.filter(post=OuterRef("pk"), user=self.request.user))
+            )
+        return queryset
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["comments"] = Comment.objects.filter(post=self.object).order_by(
-            "-created_at"
-        )
+        context["comments"] = self.object.comments.all()
         context["comment_form"] = CommentForm()
-        
-        # Add like status and count
-        if self.request.user.is_authenticated:
-            context["user_has_liked"] = Like.objects.filter(
-                user=self.request.user, post=self.object
-            ).exists()
-        context["like_count"] = self.object.likes.count()
-        
+        context["user_has_liked"] = getattr(self.object, "user_has_liked", False)
+        context["like_count"] = self.object.like_count
         return context
 
     def get(self, request, *args, **kwargs):
-        # Track post views
-        response = super().get(request, *args, **kwargs)
-        post = self.get_object()
-        
-        # Get client IP
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        
-        # Create or get view record
         if request.user.is_authenticated:
-            PostView.objects.get_or_create(
-                user=request.user,
-                post=post,
-                ip_address=ip
-            )
+            response = super().get(request, *args, **kwargs)
+            record_view(request, self.object.pk)
+            return response
+
+        # Anonymous visitors all see the same page, so it is served from the page cache
+        post_id = self.kwargs["pk"]
+        key = caching.page_key(post_id)
+        content = caching.get_page(key) if key else None
+        if content is None:
+            response = super().get(request, *args, **kwargs).render()
+            if key:
+                caching.set_page(key, response.content)
         else:
-            PostView.objects.get_or_create(
-                post=post,
-                ip_address=ip,
-                defaults={'user': None}
-            )
-        
-        # Update post view count
-        post.view_count = post.post_views.count()
-        post.save(update_fields=['view_count'])
-        
+            response = HttpResponse(content)
+        # Buffered in memory and written in the background, see blog/tracking.py
+        record_view(request, post_id)
         return response
 
     @method_decorator(login_required)
@@ -222,26 +221,37 @@ class PostSearchView(DjangoListView):
     model = Post
     template_name = "blog/search_results.html"
     context_object_name = "posts"
+    paginate_by = 5
 
     def get_queryset(self):
-        query = self.request.GET.get("q")
+        query = self.request.GET.get("q", "").strip()
         if query:
-            return Post.objects.filter(
-                Q(title__icontains=query)
-                | Q(content__icontains=query)
-                | Q(tags__name__icontains=query)
-            ).distinct()
+            return search_posts(Post.objects.for_listing(), query)
         return Post.objects.none()
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.request.GET.get("q", "").strip()
+        return context
+
 
 class PostByTagListView(DjangoListView):
     model = Post
     template_name = "blog/post_list.html"
     context_object_name = "posts"
+    paginate_by = 5
 
     def get_queryset(self):
         slug = self.kwargs.get("tag_slug")
-        return Post.objects.filter(tags__slug=slug)
+        return Post.objects.for_listing().filter(tags__slug=slug)
+
+
+class TagIndexView(DjangoListView):
+    # Reads the materialized counts only; blog.counts keeps them current
+    queryset = TagCount.objects.filter(post_count__gt=0)
+    template_name = "blog/tag_list.html"
+    context_object_name = "tags"
+    paginate_by = 100
 
 
 # Like/Unlike functionality
@@ -277,12 +287,11 @@ class PostByCategoryListView(DjangoListView):
     paginate_by = 5
 
     def get_queryset(self):
-        slug = self.kwargs.get("slug")
-        category = get_object_or_404(Category, slug=slug)
-        return Post.objects.filter(category=category)
-    
+        # Looked up once here and reused for the page heading
+        self.category = get_object_or_404(Category, slug=self.kwargs.get("slug"))
+        return Post.objects.for_listing().filter(category=self.category)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        slug = self.kwargs.get("slug")
-        context['category'] = get_object_or_404(Category, slug=slug)
+        context["category"] = self.category
         return context
@@ -0,0 +1,93 @@
+"""Sidebar widgets served stale-while-revalidate from the cache; see blog/templatetags/blog_widgets.py."""
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from . import conf
+from .models import Comment, TagCount
+
+DEFAULTS = {
+    "SOFT_TTL": 60,
+    "HARD_TTL": 3600,
+    # False recomputes stale widgets inside the request (tests)
+    "ASYNC": True,
+}
+POPULAR_TAGS = "popular-tags"
+RECENT_COMMENTS = "recent-comments"
+KEY = "blog-widget:{}"
+# How long one refresh may hold a widget before another is allowed to start
+LOCK_TTL = 30
+
+
+def get_options():
+    return conf.get_options("BLOG_WIDGETS", DEFAULTS)
+
+
+def compute_popular_tags():
+    return list(
+        TagCount.objects.filter(post_count__gt=0)
+        .order_by("-post_count", "name")
+        .values("name", "slug", "post_count")[:10]
+    )
+
+
+def compute_recent_comments():
+    comments = Comment.objects.select_related("post", "author").order_by("-created_at")[:5]
+    return [
+        {
+            "author": comment.author.username,
+            "post_id": comment.post_id,
+            "post_title": comment.post.title,
+            "created_at": comment.created_at,
+        }
+        for comment in comments
+    ]
+
+
+WIDGETS = {
+    POPULAR_TAGS: compute_popular_tags,
+    RECENT_COMMENTS: compute_recent_comments,
+}
+
+
+def store(name, value):
+    options = get_options()
+    cache.set(KEY.format(name), (time.time() + options["SOFT_TTL"], value), options["HARD_TTL"])
+    return value
+
+
+def refresh(name):
+    try:
+        return store(name, WIDGETS[name]())
+    finally:
+        cache.delete(KEY.format(name) + ":lock")
+
+
+def _refresh_in_background(name):
+    try:
+        refresh(name)
+    finally:
+        close_old_connections()
+
+
+def get_widget(name):
+    entry = cache.get(KEY.format(name))
+    if entry is None:
+        return store(name, WIDGETS[name]())
+    fresh_until, value = entry
+    # One refresh per stale widget; everyone else keeps getting the stale value meanwhile
+    if fresh_until < time.time() and cache.add(KEY.format(name) + ":lock", True, LOCK_TTL):
+        if get_options()["ASYNC"]:
+            threading.Thread(
+                target=_refresh_in_background, args=(name,), name="blog-widget-refresh", daemon=True
+            ).start()
+        else:
+            value = refresh(name)
+    return value
+
+
+def mark_stale(name):
+    entry = cache.get(KEY.format(name))
+    if entry is not None:
+        cache.set(KEY.format(name), (0, entry[1]), get_options()["HARD_TTL"])
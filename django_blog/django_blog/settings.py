@@ -133,4 +133,22 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGOUT_REDIRECT_URL = '/login/'
 LOGIN_REDIRECT_URL = '/profile/'
-LOGIN_URL = '/login/'
\ No newline at end of file
+LOGIN_URL = '/login/'
+
+# Post view tracking: views are buffered in memory and flushed in the background (blog/tracking.py)
+POST_VIEW_TRACKING = {
+    "FLUSH_INTERVAL": 10.0,
+    "BATCH_SIZE": 1000,
+}
+
+# Anonymous post detail pages are cached whole until their post, comments or likes change (blog/caching.py)
+POST_PAGE_CACHE = {
+    "TTL": 300,
+}
+
+# Sidebar widgets: served stale for up to HARD_TTL while refreshed in the background after SOFT_TTL (blog/widgets.py)
+BLOG_WIDGETS = {
+    "SOFT_TTL": 60,
+    "HARD_TTL": 3600,
+    "ASYNC": True,
+}
@@ -5,13 +5,14 @@ from .models import CustomUser
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'date_joined')
+    list_display = ('username', 'email', 'first_name', 'last_name', 'followers_count', 'is_staff', 'date_joined')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'date_joined')
     search_fields = ('username', 'first_name', 'last_name', 'email')
     ordering = ('username',)
+    readonly_fields = ('followers_count', 'following_count')
     
     fieldsets = UserAdmin.fieldsets + (
-        ('Additional Info', {'fields': ('bio', 'profile_picture', 'followers')}),
+        ('Additional Info', {'fields': ('bio', 'profile_picture', 'followers', 'followers_count', 'following_count')}),
     )
     
     add_fieldsets = UserAdmin.add_fieldsets + (
@@ -0,0 +1,107 @@
+"""Follow graph writes that keep CustomUser.followers_count and following_count in step with the followers table."""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from social_media_api import response_cache
+from .models import CustomUser
+
+Follow = CustomUser.followers.through
+# Most accounts a single bulk follow/unfollow request may name
+BULK_FOLLOW_MAX = 100
+
+
+def adjust_counts(edges, delta):
+    """Apply `delta` to both ends of every (followed_id, follower_id) edge"""
+    for field, ids in [
+        ('followers_count', Counter(followed_id for followed_id, _ in edges)),
+        ('following_count', Counter(follower_id for _, follower_id in edges)),
+    ]:
+        # One UPDATE per distinct step rather than one per user
+        by_step = {}
+        for user_id, times in ids.items():
+            by_step.setdefault(times, []).append(user_id)
+        for times, user_ids in by_step.items():
+            CustomUser.objects.filter(pk__in=user_ids).update(**{field: F(field) + delta * times})
+        # The counters are part of the cached profile responses
+        response_cache.bump('user', *ids)
+
+
+def follow(user, target):
+    """Make `user` follow `target`; returns False if it already did"""
+    with transaction.atomic():
+        _, created = Follow.objects.get_or_create(from_customuser=target, to_customuser=user)
+        if created:
+            adjust_counts([(target.pk, user.pk)], 1)
+    return created
+
+
+def unfollow(user, target):
+    """Make `user` stop following `target`; returns False if it was not following"""
+    with transaction.atomic():
+        deleted, _ = Follow.objects.filter(from_customuser=target, to_customuser=user).delete()
+        if deleted:
+            adjust_counts([(target.pk, user.pk)], -1)
+    return bool(deleted)
+
+
+def insert_edges(edges):
+    """Insert (followed_id, follower_id) edges, skipping existing ones; returns the edges actually inserted"""
+    if not edges:
+        return []
+    table = connection.ops.quote_name(Follow._meta.db_table)
+    followed, follower = (
+        connection.ops.quote_name(Follow._meta.get_field(name).column) for name in ['from_customuser', 'to_customuser']
+    )
+    values = ', '.join(['(%s, %s)'] * len(edges))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({followed}, {follower}) VALUES {values} '
+            f'ON CONFLICT DO NOTHING RETURNING {followed}, {follower}',
+            [user_id for edge in edges for user_id in edge],
+        )
+        return cursor.fetchall()
+
+
+def follow_many(user, targets):
+    """Make `user` follow every account in `targets`; returns the ones newly followed"""
+    targets = [target for target in targets if target.pk != user.pk]
+    with transaction.atomic():
+        # Counted from the rows this INSERT wrote, so a concurrent follow of the same account is never counted twice
+        inserted = insert_edges([(target.pk, user.pk) for target in targets])
+        adjust_counts(inserted, 1)
+    new_ids = {followed_id for followed_id, _ in inserted}
+    return [target for target in targets if target.pk in new_ids]
+
+
+def unfollow_many(user, targets):
+    """Make `user` stop following every account in `targets`; returns the ones unfollowed"""
+    with transaction.atomic():
+        edges = Follow.objects.filter(to_customuser=user, from_customuser__in=targets)
+        removed = set(edges.values_list('from_customuser_id', flat=True))
+        edges.delete()
+        adjust_counts([(target_id, user.pk) for target_id in removed], -1)
+    return [target for target in targets if target.pk in removed]
+
+
+def count_subquery(column):
+    """Correlated COUNT(*) of follow edges whose `column` is the outer user"""
+    counts = (
+        Follow.objects.filter(**{column: OuterRef('pk')})
+        .order_by()
+        .values(column)
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount(user_ids):
+    """Recompute both counters of the given users from the follow table"""
+    updated = CustomUser.objects.filter(pk__in=user_ids).update(
+        followers_count=count_subquery('from_customuser'),
+        following_count=count_subquery('to_customuser'),
+    )
+    response_cache.bump('user', *user_ids)
+    return updated
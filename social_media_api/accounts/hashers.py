@@ -0,0 +1,109 @@
+"""Password hasher tuning (settings.PASSWORD_HASHING) and the bounded thread pool the async login view hashes in."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, BCryptSHA256PasswordHasher, check_password, get_hasher, identify_hasher, make_password,
+)
+from social_media_api import conf
+
+DEFAULTS = {
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 65536,
+    'ARGON2_PARALLELISM': 1,
+    'BCRYPT_ROUNDS': 12,
+    'MAX_WORKERS': 4,
+    'MAX_PENDING': 64,
+}
+
+
+def get_options():
+    return conf.get_options('PASSWORD_HASHING', DEFAULTS)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2id with costs from settings; one lane per hash since requests already run in parallel"""
+
+    @property
+    def time_cost(self):
+        return get_options()['ARGON2_TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return get_options()['ARGON2_MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return get_options()['ARGON2_PARALLELISM']
+
+
+class TunedBCryptSHA256PasswordHasher(BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return get_options()['BCRYPT_ROUNDS']
+
+
+class HashingPoolFull(Exception):
+    """Raised when MAX_PENDING hashes are already waiting for the pool"""
+
+
+class HashingPool:
+    def __init__(self, max_workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hashing')
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    async def run(self, func, *args):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise HashingPoolFull()
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args))
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+def _build_pool():
+    options = get_options()
+    return HashingPool(options['MAX_WORKERS'], options['MAX_PENDING'])
+
+
+_pool = conf.Singleton('PASSWORD_HASHING', _build_pool, close=HashingPool.shutdown)
+get_pool = _pool.get
+reset_pool = _pool.reset
+
+
+def needs_rehash(encoded):
+    """True when `encoded` was made by another hasher or with other cost parameters"""
+    preferred = get_hasher()
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+async def acheck_password(user, raw_password):
+    """
+    Verify `raw_password` in the hashing pool. Returns (is_correct, upgraded)
+    where `upgraded` is a fresh hash to store when the current one is outdated.
+    """
+    pool = get_pool()
+    if not await pool.run(check_password, raw_password, user.password):
+        return False, None
+    if needs_rehash(user.password):
+        return True, await pool.run(make_password, raw_password)
+    return True, None
+
+
+async def ahash_dummy(raw_password):
+    """Hash once for unknown users so response times do not reveal which usernames exist"""
+    await get_pool().run(make_password, raw_password)
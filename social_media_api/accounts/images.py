@@ -0,0 +1,121 @@
+"""Content-addressed WebP/JPEG variants of profile pictures, built off the request path once an upload commits."""
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+from social_media_api import conf, response_cache
+from .models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ASYNC': True,
+    # name -> (width, height); every variant is cropped to fill the box
+    'VARIANTS': {'small': (64, 64), 'medium': (256, 256), 'large': (1024, 1024)},
+    'QUALITY': 82,
+}
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+VARIANT_DIR = 'profile_pics/variants'
+
+
+def get_options():
+    return conf.get_options('PROFILE_PICTURES', DEFAULTS)
+
+
+def picture_storage():
+    return CustomUser._meta.get_field('profile_picture').storage
+
+
+def render_variants(source, variants, quality):
+    """Encode every variant of an image file; returns {variant: {ext: bytes}}"""
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            # JPEG has no alpha channel: flatten onto white
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image.convert('RGBA'), mask=image.convert('RGBA').getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+
+        rendered = {}
+        for name, size in variants.items():
+            resized = ImageOps.fit(image, tuple(size), Image.Resampling.LANCZOS)
+            rendered[name] = {}
+            for ext, fmt in FORMATS.items():
+                buffer = BytesIO()
+                # Nothing from the original (EXIF, GPS, ICC) is passed on
+                resized.save(buffer, format=fmt, quality=quality, optimize=True)
+                rendered[name][ext] = buffer.getvalue()
+        return rendered
+
+
+def store_variant(name, ext, data):
+    storage = picture_storage()
+    path = f'{VARIANT_DIR}/{hashlib.sha256(data).hexdigest()[:16]}-{name}.{ext}'
+    if not storage.exists(path):
+        path = storage.save(path, ContentFile(data))
+    return path
+
+
+def process_profile_picture(user_id):
+    """Build and record the variants of a user's current profile picture"""
+    user = CustomUser.objects.only('pk', 'profile_picture').get(pk=user_id)
+    picture = user.profile_picture.name
+    paths = {}
+    if picture:
+        options = get_options()
+        try:
+            with user.profile_picture.open('rb') as source:
+                rendered = render_variants(source, options['VARIANTS'], options['QUALITY'])
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+            logger.warning('Could not process profile picture %s of user %s', picture, user_id, exc_info=True)
+            return None
+        paths = {
+            name: {ext: store_variant(name, ext, data) for ext, data in encoded.items()}
+            for name, encoded in rendered.items()
+        }
+    # Skip the write if another upload replaced the picture meanwhile; its own job will record it
+    if CustomUser.objects.filter(pk=user_id, profile_picture=picture).update(profile_picture_variants=paths):
+        response_cache.bump('user', user_id)
+    return paths
+
+
+def variant_urls(user):
+    storage = picture_storage()
+    return {
+        name: {ext: storage.url(path) for ext, path in formats.items()}
+        for name, formats in (user.profile_picture_variants or {}).items()
+    }
+
+
+_executor = conf.Singleton(
+    'PROFILE_PICTURES',
+    lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix='profile-pictures'),
+    close=lambda executor: executor.shutdown(wait=True),
+)
+get_executor = _executor.get
+reset_executor = _executor.reset
+
+
+def _run(user_id):
+    try:
+        process_profile_picture(user_id)
+    except Exception:
+        logger.exception('Profile picture processing failed for user %s', user_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_processing(user_id):
+    """Process the user's picture once the current transaction commits"""
+    def submit():
+        if get_options()['ASYNC']:
+            get_executor().submit(_run, user_id)
+        else:
+            process_profile_picture(user_id)
+    transaction.on_commit(submit)
@@ -0,0 +1,53 @@
+import random
+import statistics
+import time
+from array import array
+
+from django.core.management.base import BaseCommand
+from accounts.suggestions import FollowGraph, get_options
+
+
+class Command(BaseCommand):
+    help = 'Time building the follow-suggestion graph and scoring users on a generated follow graph (in memory)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000000, help='Number of users in the generated graph')
+        parser.add_argument('--edges', type=int, default=50000000, help='Number of follow edges')
+        parser.add_argument('--queries', type=int, default=1000, help='Number of users to score')
+
+    def handle(self, *args, **options):
+        users, edges = options['users'], options['edges']
+        rng = random.Random(42)
+
+        started = time.perf_counter()
+        follower_ids, followed_ids = self.generate(rng, users, edges)
+        self.stdout.write(f'Generated {edges} edges over {users} users in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        graph = FollowGraph(users, follower_ids, followed_ids)
+        del follower_ids, followed_ids
+        megabytes = (graph.following.nbytes() + graph.followers.nbytes()) / 2 ** 20
+        self.stdout.write(f'Built CSR graph in {time.perf_counter() - started:.1f}s ({megabytes:.0f} MB)')
+
+        top_k = get_options()['TOP_K']
+        sample = [rng.randrange(users) for _ in range(options['queries'])]
+        timings = []
+        for user_id in sample:
+            started = time.perf_counter()
+            graph.suggest(user_id, top_k)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'Scored {len(sample)} users - p50: {statistics.median(timings):.2f} ms, '
+            f'p99: {timings[int(len(timings) * 0.99) - 1]:.2f} ms, max: {timings[-1]:.2f} ms'
+        )
+
+    def generate(self, rng, users, edges):
+        """Uniformly random edges with an equal out-degree per follower"""
+        per_user, remainder = divmod(edges, users)
+        follower_ids = array('q')
+        for user_id in range(users):
+            follower_ids.extend([user_id] * (per_user + (user_id < remainder)))
+        raw = array('I', rng.randbytes(4 * edges))
+        followed_ids = array('q', (value % users for value in raw))
+        return follower_ids, followed_ids
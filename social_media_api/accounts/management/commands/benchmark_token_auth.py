@@ -0,0 +1,54 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from accounts.models import CustomUser
+from social_media_api.authentication import CachedTokenAuthentication
+
+
+class Command(BaseCommand):
+    help = 'Compare queries and time per authenticated request with and without the token cache (rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users with tokens')
+        parser.add_argument('--requests', type=int, default=20000, help='Number of requests to authenticate')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        factory = RequestFactory()
+
+        with transaction.atomic():
+            password = make_password(None)
+            users = CustomUser.objects.bulk_create([
+                CustomUser(username=f'auth_benchmark_{i}', password=password) for i in range(options['users'])
+            ])
+            keys = [token.key for token in Token.objects.bulk_create([
+                Token(key=Token.generate_key(), user=user) for user in users
+            ])]
+            requests = [
+                factory.get('/', HTTP_AUTHORIZATION=f'Token {rng.choice(keys)}') for _ in range(options['requests'])
+            ]
+
+            # A fresh store sized for every token, so the only misses are first sightings
+            cache_settings = {'BACKEND': 'local', 'MAX_ENTRIES': len(keys), 'TTL': 3600}
+            with override_settings(TOKEN_AUTH_CACHE=cache_settings):
+                for label, authenticator in [
+                    ('TokenAuthentication', TokenAuthentication()),
+                    ('CachedTokenAuthentication', CachedTokenAuthentication()),
+                ]:
+                    queries = []
+                    with connection.execute_wrapper(lambda execute, *args: queries.append(1) or execute(*args)):
+                        started = time.perf_counter()
+                        for request in requests:
+                            authenticator.authenticate(request)
+                        elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f'{label}: {len(queries) / len(requests):.3f} queries/request, '
+                        f'{elapsed / len(requests) * 1e6:.0f} us/request'
+                    )
+            transaction.set_rollback(True)
@@ -0,0 +1,95 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from accounts.follows import adjust_counts, insert_edges
+from accounts.models import CustomUser
+from posts.timeline import backfill_timelines
+
+
+class Command(BaseCommand):
+    help = (
+        'Load follow edges from a CSV (follower_id,followed_id) or JSONL '
+        '({"follower_id": ..., "followed_id": ...}) file without sending notifications'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import; .jsonl/.json files are read as JSON lines')
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'],
+            help='Input format (default: guessed from the file extension)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of edges inserted per transaction',
+        )
+        parser.add_argument(
+            '--backfill', action='store_true',
+            help="Also copy followed authors' recent posts into the followers' timelines",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        batch_size = options['batch_size']
+        processed = skipped = 0
+        self.malformed = 0
+
+        try:
+            with open(path, newline='') as handle:
+                batch = []
+                for edge in self.read_edges(handle, fmt):
+                    batch.append(edge)
+                    if len(batch) >= batch_size:
+                        written = self.import_batch(batch, options['backfill'])
+                        processed += written
+                        skipped += len(batch) - written
+                        batch = []
+                if batch:
+                    written = self.import_batch(batch, options['backfill'])
+                    processed += written
+                    skipped += len(batch) - written
+        except OSError as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+
+        skipped += self.malformed
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} follow edges, skipped {skipped}'))
+
+    def read_edges(self, handle, fmt):
+        """Yield (follower_id, followed_id) pairs one line at a time, counting malformed lines in self.malformed"""
+        if fmt == 'jsonl':
+            rows = (line for line in handle if line.strip())
+        else:
+            rows = (row for row in csv.reader(handle) if row)
+        for line, row in enumerate(rows, start=1):
+            try:
+                if fmt == 'jsonl':
+                    record = json.loads(row)
+                    row = (record['follower_id'], record['followed_id'])
+                follower_id, followed_id = int(row[0]), int(row[1])
+            except (IndexError, KeyError, TypeError, ValueError):
+                # A CSV file may start with a header row
+                if fmt == 'jsonl' or line > 1:
+                    self.stderr.write(f'Skipping malformed line {line}: {row!r}')
+                    self.malformed += 1
+                continue
+            yield follower_id, followed_id
+
+    def import_batch(self, batch, backfill):
+        """Insert one chunk of edges between existing users; returns how many edges were valid"""
+        user_ids = {user_id for edge in batch for user_id in edge}
+        known = set(CustomUser.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+        edges = {
+            (follower_id, followed_id) for follower_id, followed_id in batch
+            if follower_id != followed_id and follower_id in known and followed_id in known
+        }
+        with transaction.atomic():
+            # Only the rows this INSERT wrote are counted; existing edges are left alone
+            inserted = insert_edges([(followed_id, follower_id) for follower_id, followed_id in edges])
+            adjust_counts(inserted, 1)
+
+        if backfill:
+            authors = CustomUser.objects.in_bulk({followed_id for followed_id, _ in inserted})
+            backfill_timelines([(follower_id, authors[followed_id]) for followed_id, follower_id in inserted])
+        return len(edges)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from accounts.models import CustomUser
+from accounts.suggestions import FollowGraph, store_suggestions
+
+
+class Command(BaseCommand):
+    help = 'Load the follow graph once and cache every user\'s follow suggestions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of users scored per cache write',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        graph = FollowGraph.load()
+        user_ids = CustomUser.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        stored = 0
+
+        while True:
+            batch = list(user_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            store_suggestions(graph, batch)
+            stored += len(batch)
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Stored suggestions for {stored} users from {graph.edges} follows'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from accounts.images import process_profile_picture
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Build profile picture variants for users that have a picture'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild users that already have variants too')
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True)
+        if not options['all']:
+            users = users.filter(profile_picture_variants={})
+        processed = failed = 0
+        for user_id in users.order_by('pk').values_list('pk', flat=True).iterator():
+            if process_profile_picture(user_id) is None:
+                failed += 1
+            else:
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} profile pictures, {failed} failed'))
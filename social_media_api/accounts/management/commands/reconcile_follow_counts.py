@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from accounts.follows import count_subquery, recount
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Repair drift in the denormalized follower and following counters on users'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of users checked per query',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = CustomUser.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        checked = 0
+        repaired = 0
+
+        while True:
+            batch = list(user_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            drifted = list(
+                CustomUser.objects.filter(pk__in=batch)
+                .annotate(
+                    actual_followers=count_subquery('from_customuser'),
+                    actual_following=count_subquery('to_customuser'),
+                )
+                .filter(~Q(followers_count=F('actual_followers')) | ~Q(following_count=F('actual_following')))
+                .values_list('pk', flat=True)
+            )
+            # The UPDATE counts the edges again as it writes, so follows made since the check are not lost
+            if drifted:
+                recount(drifted)
+            checked += len(batch)
+            repaired += len(drifted)
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} users, repaired {repaired}'))
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+# The follow table is auto-created by the followers M2M field, so its extra
+# indexes are managed with plain SQL. Both lists page on (user, id).
+INDEXES = {
+    'accounts_follow_followed_idx': 'from_customuser_id',
+    'accounts_follow_follower_idx': 'to_customuser_id',
+}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_follow_counts'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f'CREATE INDEX {name} ON accounts_customuser_followers ({column}, id)',
+            f'DROP INDEX {name}',
+        )
+        for name, column in INDEXES.items()
+    ]
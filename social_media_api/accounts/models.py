@@ -9,12 +9,17 @@ class CustomUser(AbstractUser):
     """
     bio = models.TextField(max_length=500, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # {variant: {format: storage path}}, filled in by accounts.images after each upload
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
     followers = models.ManyToManyField(
         'self', 
         symmetrical=False, 
         related_name='following',
         blank=True
     )
+    # Denormalized sizes of the follow graph, maintained by accounts.follows
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.username
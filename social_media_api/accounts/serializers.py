@@ -2,6 +2,8 @@ from rest_framework import serializers
 from django.contrib.auth import authenticate, get_user_model
 from rest_framework.authtoken.models import Token
 from .models import CustomUser
+from .follows import BULK_FOLLOW_MAX, Follow
+from .images import schedule_processing, variant_urls
 
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
@@ -25,6 +27,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         validated_data.pop('password_confirm')
         user = get_user_model().objects.create_user(**validated_data)
         Token.objects.create(user=user)
+        if user.profile_picture:
+            schedule_processing(user.pk)
         return user
 
 
@@ -52,17 +56,91 @@ class UserLoginSerializer(serializers.Serializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     """Serializer for user profile"""
-    followers_count = serializers.SerializerMethodField()
-    following_count = serializers.SerializerMethodField()
+    profile_picture_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = CustomUser
-        fields = ('id', 'username', 'email', 'bio', 'profile_picture', 
+        fields = ('id', 'username', 'email', 'bio', 'profile_picture', 'profile_picture_variants',
                   'followers_count', 'following_count', 'date_joined')
-        read_only_fields = ('id', 'username', 'date_joined')
+        read_only_fields = ('id', 'username', 'followers_count', 'following_count', 'date_joined')
 
-    def get_followers_count(self, obj):
-        return obj.followers.count()
+    def get_profile_picture_variants(self, obj):
+        return variant_urls(obj)
 
-    def get_following_count(self, obj):
-        return obj.following.count()
+    def update(self, instance, validated_data):
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        update_fields = list(validated_data)
+        if 'profile_picture' in validated_data:
+            # Old variants belong to the old picture; new ones follow once processed
+            instance.profile_picture_variants = {}
+            update_fields.append('profile_picture_variants')
+        # Only write the edited columns so a profile save cannot overwrite concurrent counter updates
+        instance.save(update_fields=update_fields)
+        if 'profile_picture' in validated_data and instance.profile_picture:
+            schedule_processing(instance.pk)
+        return instance
+
+
+class SuggestedUserSerializer(serializers.ModelSerializer):
+    """Compact user row for follow suggestions, with the suggestion score"""
+    score = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CustomUser
+        fields = ('id', 'username', 'profile_picture', 'followers_count', 'score')
+
+    def get_score(self, obj):
+        return self.context['scores'][obj.pk]
+
+
+class FollowUserListSerializer(serializers.ListSerializer):
+    """List serializer that resolves which listed users the viewer follows in one query"""
+
+    def to_representation(self, data):
+        users = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.context['followed_ids'] = set(
+                Follow.objects.filter(
+                    to_customuser=request.user, from_customuser__in=[user.pk for user in users]
+                ).values_list('from_customuser_id', flat=True)
+            )
+        return super().to_representation(users)
+
+
+class FollowUserSerializer(serializers.ModelSerializer):
+    """Compact user row for follower and following lists"""
+    is_followed_by_me = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CustomUser
+        fields = ('id', 'username', 'profile_picture', 'followers_count', 'is_followed_by_me')
+        list_serializer_class = FollowUserListSerializer
+
+    def get_is_followed_by_me(self, obj):
+        followed_ids = self.context.get('followed_ids')
+        if followed_ids is not None:
+            return obj.pk in followed_ids
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            return Follow.objects.filter(to_customuser=request.user, from_customuser=obj).exists()
+        return False
+
+
+class BulkFollowSerializer(serializers.Serializer):
+    """Accounts to follow or unfollow in one request, resolved with a single query"""
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=BULK_FOLLOW_MAX
+    )
+
+    def validate_user_ids(self, user_ids):
+        if self.context['request'].user.pk in user_ids:
+            raise serializers.ValidationError('You cannot follow or unfollow yourself')
+        return list(dict.fromkeys(user_ids))
+
+    def validate(self, data):
+        users = CustomUser.objects.in_bulk(data['user_ids'])
+        data['users'] = [users[pk] for pk in data['user_ids'] if pk in users]
+        data['not_found'] = [pk for pk in data['user_ids'] if pk not in users]
+        return data
@@ -0,0 +1,53 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from social_media_api import response_cache
+from social_media_api.authentication import INVALIDATING_FIELDS, invalidate
+from .follows import Follow, adjust_counts
+from .models import CustomUser
+
+
+def _edges(instance, reverse, pk_set):
+    """(followed_id, follower_id) pairs for a change made through either side of the relation"""
+    if reverse:
+        # instance.following: instance is the follower
+        return [(pk, instance.pk) for pk in pk_set]
+    return [(instance.pk, pk) for pk in pk_set]
+
+
+@receiver(m2m_changed, sender=Follow)
+def update_follow_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Count follow edges added or removed through the related managers"""
+    if action == 'post_add':
+        # pk_set only holds the edges that were actually inserted
+        adjust_counts(_edges(instance, reverse, pk_set), 1)
+    elif action in ('pre_remove', 'pre_clear'):
+        # Removal is reported for every requested id, so count the edges that exist before they go
+        column, other = ('to_customuser', 'from_customuser') if reverse else ('from_customuser', 'to_customuser')
+        existing = Follow.objects.filter(**{column: instance.pk})
+        if action == 'pre_remove':
+            existing = existing.filter(**{f'{other}__in': pk_set})
+        adjust_counts(_edges(instance, reverse, existing.values_list(f'{other}_id', flat=True)), -1)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Logging out (or deleting the user) drops the token from the auth cache"""
+    invalidate(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_saved_user(sender, instance, created, update_fields=None, **kwargs):
+    """Password, is_active and profile snapshot changes must not be served from the auth cache"""
+    if created or (update_fields is not None and not INVALIDATING_FIELDS & set(update_fields)):
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate(key)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_user_responses(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    """Drop cached profiles, and post details showing the username if it may have changed"""
+    response_cache.bump('user', instance.pk)
+    if signal is post_save and not created and (update_fields is None or 'username' in update_fields):
+        response_cache.bump('post', *instance.posts.values_list('pk', flat=True))
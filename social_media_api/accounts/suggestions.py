@@ -0,0 +1,186 @@
+""""People you may know" scores from a background-loaded CSR snapshot of the follow graph."""
+import heapq
+import threading
+import time
+from array import array
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.db.models import Max
+from django.dispatch import receiver
+from social_media_api import conf
+from .follows import Follow
+from .models import CustomUser
+
+DEFAULTS = {
+    'ASYNC': True,
+    'TOP_K': 20,
+    'CACHE_TTL': 3600,
+    'GRAPH_TTL': 3600,
+    'PRECOMPUTED': False,
+}
+FOF_WEIGHT = 2
+COMMON_FOLLOWER_WEIGHT = 1
+# Neighbours expanded per hop, so celebrities do not make a single query expensive
+MAX_EXPANSION = 1000
+LOAD_CHUNK_SIZE = 10000
+CACHE_KEY = 'follow-suggestions:{}'
+
+
+def get_options():
+    return conf.get_options('FOLLOW_SUGGESTIONS', DEFAULTS)
+
+
+class CSR:
+    """Adjacency lists of ids 0..size-1: row i is targets[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_edges(cls, size, sources, targets):
+        """Counting sort of parallel (source, target) arrays into rows"""
+        offsets = array('q', bytes(8 * (size + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for row in range(size):
+            offsets[row + 1] += offsets[row]
+        position = array('q', offsets)
+        ordered = array(targets.typecode, bytes(targets.itemsize * len(targets)))
+        for source, target in zip(sources, targets):
+            ordered[position[source]] = target
+            position[source] += 1
+        return cls(offsets, ordered)
+
+    def row(self, index, limit=None):
+        if index + 1 >= len(self.offsets):
+            return self.targets[0:0]
+        start, end = self.offsets[index], self.offsets[index + 1]
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.targets[start:end]
+
+    def nbytes(self):
+        return self.offsets.itemsize * len(self.offsets) + self.targets.itemsize * len(self.targets)
+
+
+class FollowGraph:
+    """Snapshot of the follow graph with `following` and `followers` rows per user id"""
+
+    def __init__(self, size, follower_ids, followed_ids):
+        self.size = size
+        self.following = CSR.from_edges(size, follower_ids, followed_ids)
+        self.followers = CSR.from_edges(size, followed_ids, follower_ids)
+        self.edges = len(follower_ids)
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def load(cls):
+        """Read the through table in chunks into (follower, followed) id arrays"""
+        size = (CustomUser.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+        follower_ids, followed_ids = array('q'), array('q')
+        rows = Follow.objects.order_by().values_list('to_customuser_id', 'from_customuser_id')
+        for follower_id, followed_id in rows.iterator(chunk_size=LOAD_CHUNK_SIZE):
+            follower_ids.append(follower_id)
+            followed_ids.append(followed_id)
+        return cls(size, follower_ids, followed_ids)
+
+    def scores(self, user_id):
+        """Counter of candidate id -> score for one user"""
+        friends_of_friends = Counter()
+        for followed_id in self.following.row(user_id, MAX_EXPANSION):
+            friends_of_friends.update(self.following.row(followed_id, MAX_EXPANSION))
+        common_followers = Counter()
+        for follower_id in self.followers.row(user_id, MAX_EXPANSION):
+            common_followers.update(self.following.row(follower_id, MAX_EXPANSION))
+
+        scores = Counter({candidate: FOF_WEIGHT * count for candidate, count in friends_of_friends.items()})
+        for candidate, count in common_followers.items():
+            scores[candidate] += COMMON_FOLLOWER_WEIGHT * count
+        return scores
+
+    def suggest(self, user_id, k):
+        """Top `k` (candidate id, score) pairs the user does not follow yet"""
+        excluded = set(self.following.row(user_id))
+        excluded.add(user_id)
+        candidates = ((score, candidate) for candidate, score in self.scores(user_id).items()
+                      if candidate not in excluded)
+        # Highest score first, lower ids win ties
+        top = heapq.nsmallest(k, candidates, key=lambda item: (-item[0], item[1]))
+        return [(candidate, score) for score, candidate in top]
+
+    def is_stale(self, ttl):
+        return time.monotonic() - self.built_at > ttl
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_refreshing = False
+
+
+def _refresh():
+    global _graph, _refreshing
+    try:
+        graph = FollowGraph.load()
+        with _graph_lock:
+            _graph = graph
+    finally:
+        _refreshing = False
+        close_old_connections()
+
+
+def get_graph():
+    """
+    The current snapshot, or None until the first one has loaded. Snapshots are
+    built on a background thread, or inline when FOLLOW_SUGGESTIONS['ASYNC'] is
+    False; a stale one keeps serving while its replacement loads.
+    """
+    global _graph, _refreshing
+    with _graph_lock:
+        if _graph is None and not get_options()['ASYNC']:
+            _graph = FollowGraph.load()
+        elif (_graph is None or _graph.is_stale(get_options()['GRAPH_TTL'])) and not _refreshing:
+            _refreshing = True
+            threading.Thread(target=_refresh, name='follow-graph-refresh', daemon=True).start()
+        return _graph
+
+
+@receiver(setting_changed)
+def reset_graph(setting, **kwargs):
+    global _graph
+    if setting == 'FOLLOW_SUGGESTIONS':
+        _graph = None
+
+
+def store_suggestions(graph, user_ids):
+    """Score `user_ids` on `graph` and cache their top-K lists in one write"""
+    options = get_options()
+    cache.set_many(
+        {CACHE_KEY.format(user_id): graph.suggest(user_id, options['TOP_K']) for user_id in user_ids},
+        options['CACHE_TTL'],
+    )
+
+
+def suggestions_for(user):
+    """
+    Cached top-K (user id, score) suggestions for `user`. With
+    FOLLOW_SUGGESTIONS['PRECOMPUTED'] the cache is filled only by
+    `manage.py precompute_follow_suggestions`, so web processes never load the graph.
+    """
+    options = get_options()
+    key = CACHE_KEY.format(user.pk)
+    suggestions = cache.get(key)
+    if suggestions is None and options['PRECOMPUTED']:
+        return []
+    if suggestions is None:
+        graph = get_graph()
+        if graph is None:
+            # Still loading; not cached so the user gets real suggestions once it is ready
+            return []
+        suggestions = graph.suggest(user.pk, options['TOP_K'])
+        cache.set(key, suggestions, options['CACHE_TTL'])
+    return suggestions
+
@@ -1,3 +1,565 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.management import call_command
+from django.db import connection
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from notifications.models import Notification
+from social_media_api import authentication
+from posts.models import Post, TimelineEntry
+from posts.timeline import backfill_timeline
+from . import follows, hashers, images, suggestions
+from .follows import BULK_FOLLOW_MAX, Follow
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FollowCountTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='user', password='testpass123')
+        self.star = User.objects.create_user(username='star', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def counts(self, user):
+        user.refresh_from_db()
+        return user.followers_count, user.following_count
+
+    def test_follow_and_unfollow_endpoints_keep_counts(self):
+        self.client.post(f'/api/follow/{self.star.id}/')
+        # Following twice does not count twice
+        self.client.post(f'/api/follow/{self.star.id}/')
+        self.assertEqual(self.counts(self.star), (1, 0))
+        self.assertEqual(self.counts(self.user), (0, 1))
+
+        self.client.post(f'/api/unfollow/{self.star.id}/')
+        self.client.post(f'/api/unfollow/{self.star.id}/')
+        self.assertEqual(self.counts(self.star), (0, 0))
+        self.assertEqual(self.counts(self.user), (0, 0))
+
+    def test_profile_reads_counts_without_counting(self):
+        self.client.post(f'/api/follow/{self.star.id}/')
+        self.star.refresh_from_db()
+        self.client.force_authenticate(user=self.star)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['followers_count'], response.data['following_count']), (1, 0))
+
+    def test_related_manager_edits_are_counted(self):
+        # As the admin does through the followers field
+        self.star.followers.set([self.user, self.other])
+        self.assertEqual(self.counts(self.star), (2, 0))
+        self.star.followers.remove(self.other, self.star)
+        self.assertEqual(self.counts(self.star), (1, 0))
+        self.other.following.add(self.star)
+        self.assertEqual(self.counts(self.other), (0, 1))
+        self.star.followers.clear()
+        self.assertEqual(self.counts(self.star), (0, 0))
+        self.assertEqual(self.counts(self.user), (0, 0))
+        self.assertEqual(self.counts(self.other), (0, 0))
+
+    def test_reconcile_repairs_drift(self):
+        Follow.objects.bulk_create([
+            Follow(from_customuser=self.star, to_customuser=self.user),
+            Follow(from_customuser=self.star, to_customuser=self.other),
+        ])
+        out = StringIO()
+        call_command('reconcile_follow_counts', batch_size=2, stdout=out)
+        self.assertIn('Checked 3 users, repaired 3', out.getvalue())
+        self.assertEqual(self.counts(self.star), (2, 0))
+        self.assertEqual(self.counts(self.other), (0, 1))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BulkFollowTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='user', password='testpass123')
+        self.accounts = [User.objects.create_user(username=f'account{i}', password='testpass123') for i in range(4)]
+        self.client.force_authenticate(user=self.user)
+
+    def ids(self, users):
+        return [user.id for user in users]
+
+    def test_bulk_follow_reports_each_id(self):
+        self.client.post(f'/api/follow/{self.accounts[0].id}/')
+        Post.objects.create(author=self.accounts[1], title='Welcome', content='Hello')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/follow/bulk/', {'user_ids': self.ids(self.accounts) + [999]}, format='json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['followed'], self.ids(self.accounts[1:]))
+        self.assertEqual(response.data['already_following'], [self.accounts[0].id])
+        self.assertEqual(response.data['not_found'], [999])
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 4)
+        self.assertEqual(Notification.objects.filter(verb='started following you').count(), 3)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.user, post__title='Welcome').exists())
+
+    def test_only_inserted_edges_are_counted(self):
+        # Followed between follow_many's view of the table and its insert
+        Follow.objects.create(from_customuser=self.accounts[0], to_customuser=self.user)
+        inserted = follows.insert_edges([(account.pk, self.user.pk) for account in self.accounts[:2]])
+        self.assertEqual(inserted, [(self.accounts[1].pk, self.user.pk)])
+
+        followed = follows.follow_many(self.user, self.accounts)
+        self.assertEqual(followed, self.accounts[2:])
+        self.user.refresh_from_db()
+        # The edge created outside follows.py was never counted
+        self.assertEqual(self.user.following_count, 2)
+
+    def test_bulk_follow_backfills_in_one_pass(self):
+        for account in self.accounts:
+            for i in range(3):
+                Post.objects.create(author=account, title=f'{account.username} {i}', content='Body')
+        # Recent posts of all authors, then one INSERT
+        with self.assertNumQueries(2):
+            backfill_timeline(self.user, *self.accounts)
+        self.assertEqual(TimelineEntry.objects.filter(user=self.user).count(), 12)
+
+    def test_bulk_unfollow(self):
+        self.client.post('/api/follow/bulk/', {'user_ids': self.ids(self.accounts[:2])}, format='json')
+        response = self.client.post('/api/unfollow/bulk/', {'user_ids': self.ids(self.accounts)}, format='json')
+        self.assertEqual(response.data['unfollowed'], self.ids(self.accounts[:2]))
+        self.assertEqual(response.data['not_following'], self.ids(self.accounts[2:]))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 0)
+
+    def test_bulk_follow_validation(self):
+        for user_ids in [[], [self.user.id], list(range(1, BULK_FOLLOW_MAX + 2))]:
+            response = self.client.post('/api/follow/bulk/', {'user_ids': user_ids}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def import_file(self, suffix, content, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('import_follows', handle.name, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_import_csv_and_jsonl(self):
+        a, b, c, d = self.ids(self.accounts)
+        out = self.import_file('.csv', f'follower_id,followed_id\n{a},{b}\n{a},{c}\n{b},{c}\n{a},{a}\n{a},999\n', batch_size=2)
+        self.assertIn('Processed 3 follow edges, skipped 2', out)
+        # Re-importing an existing edge leaves the counters alone
+        self.import_file('.jsonl', f'{{"follower_id": {a}, "followed_id": {b}}}\n{{"follower_id": {d}, "followed_id": {c}}}\n')
+
+        followers = {user.pk: user.followers_count for user in get_user_model().objects.all()}
+        self.assertEqual((followers[b], followers[c]), (1, 3))
+        self.assertEqual(get_user_model().objects.get(pk=a).following_count, 2)
+        self.assertEqual(Notification.objects.count(), 0)
+
+    def test_malformed_jsonl_lines_are_skipped(self):
+        a, b, c, _ = self.ids(self.accounts)
+        out = self.import_file(
+            '.jsonl',
+            f'{{"follower_id": {a}, "followed_id": {b}}}\nnot json\n{{"follower_id": {a}}}\n'
+            f'{{"follower_id": {b}, "followed_id": {c}}}\n',
+        )
+        self.assertIn('Processed 2 follow edges, skipped 2', out)
+        self.assertEqual(Follow.objects.count(), 2)
+
+    def test_import_backfills_timelines(self):
+        a, b, c, _ = self.ids(self.accounts)
+        Post.objects.create(author=self.accounts[1], title='From b', content='Body')
+        Post.objects.create(author=self.accounts[2], title='From c', content='Body')
+        self.import_file('.csv', f'{a},{b}\n{a},{c}\n{b},{c}\n', backfill=True)
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list('user_id', 'post__title')),
+            {(a, 'From b'), (a, 'From c'), (b, 'From c')},
+        )
+
+
+@override_settings(
+    SECURE_SSL_REDIRECT=False, FOLLOW_SUGGESTIONS={'ASYNC': False, 'TOP_K': 3, 'CACHE_TTL': 60, 'GRAPH_TTL': 60}
+)
+class FollowSuggestionTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        suggestions.reset_graph(setting='FOLLOW_SUGGESTIONS')
+        self.client = APIClient()
+        User = get_user_model()
+        self.user, self.friend, self.fan, self.popular, self.niche, self.stranger = [
+            User.objects.create_user(username=name, password='testpass123')
+            for name in ['user', 'friend', 'fan', 'popular', 'niche', 'stranger']
+        ]
+        self.user.following.add(self.friend)
+        self.fan.following.add(self.user)
+        # Followed by someone the user follows and by one of the user's followers
+        self.friend.following.add(self.popular, self.niche)
+        self.fan.following.add(self.popular)
+        self.client.force_authenticate(user=self.user)
+
+    def test_graph_scores_friends_of_friends_and_common_followers(self):
+        graph = suggestions.FollowGraph.load()
+        self.assertEqual(graph.edges, 5)
+        self.assertEqual(
+            graph.suggest(self.user.pk, 5),
+            [(self.popular.pk, suggestions.FOF_WEIGHT + suggestions.COMMON_FOLLOWER_WEIGHT),
+             (self.niche.pk, suggestions.FOF_WEIGHT)],
+        )
+        # Users unknown to the snapshot get nothing rather than an error
+        self.assertEqual(graph.suggest(graph.size + 10, 5), [])
+
+    def test_endpoint_ranks_and_skips_accounts_followed_since(self):
+        response = self.client.get('/api/users/suggestions/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([user['username'] for user in response.data['results']], ['popular', 'niche'])
+        self.assertEqual(response.data['results'][0]['score'], 3)
+
+        # Served from the cache, which still lists 'popular'
+        self.client.post(f'/api/follow/{self.popular.id}/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/suggestions/')
+        self.assertEqual([user['username'] for user in response.data['results']], ['niche'])
+
+    @override_settings(FOLLOW_SUGGESTIONS={'ASYNC': True, 'TOP_K': 3, 'CACHE_TTL': 60, 'GRAPH_TTL': 60})
+    def test_requests_never_wait_for_the_graph(self):
+        with mock.patch.object(suggestions.threading, 'Thread') as thread:
+            response = self.client.get('/api/users/suggestions/')
+        self.assertEqual(response.data['results'], [])
+        thread.return_value.start.assert_called_once()
+        self.assertIsNone(cache.get(suggestions.CACHE_KEY.format(self.user.pk)))
+
+        # Once the background load has finished the same request is answered from it
+        with mock.patch.object(suggestions, 'close_old_connections'):
+            thread.call_args.kwargs['target']()
+        response = self.client.get('/api/users/suggestions/')
+        self.assertEqual([user['username'] for user in response.data['results']], ['popular', 'niche'])
+
+    @override_settings(
+        FOLLOW_SUGGESTIONS={'ASYNC': False, 'TOP_K': 3, 'CACHE_TTL': 60, 'GRAPH_TTL': 60, 'PRECOMPUTED': True}
+    )
+    def test_precomputed_suggestions_are_served_from_the_cache(self):
+        with mock.patch.object(suggestions.FollowGraph, 'load') as load:
+            response = self.client.get('/api/users/suggestions/')
+        self.assertEqual(response.data['results'], [])
+        load.assert_not_called()
+
+        out = StringIO()
+        call_command('precompute_follow_suggestions', batch_size=2, stdout=out)
+        self.assertIn('Stored suggestions for 6 users from 5 follows', out.getvalue())
+        self.assertEqual(
+            cache.get(suggestions.CACHE_KEY.format(self.fan.pk)), [(self.friend.pk, suggestions.FOF_WEIGHT)]
+        )
+        with mock.patch.object(suggestions.FollowGraph, 'load') as load:
+            response = self.client.get('/api/users/suggestions/')
+        self.assertEqual([user['username'] for user in response.data['results']], ['popular', 'niche'])
+        load.assert_not_called()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class FollowListTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='user', password='testpass123')
+        self.star = User.objects.create_user(username='star', password='testpass123')
+        self.fans = [User.objects.create_user(username=f'fan{i}', password='testpass123') for i in range(12)]
+        for fan in self.fans:
+            self.star.followers.add(fan)
+        self.user.following.add(self.fans[11])
+        self.user.following.add(self.fans[0])
+        self.client.force_authenticate(user=self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_followers_newest_first_across_pages(self):
+        first = self.get(f'/api/users/{self.star.id}/followers/')
+        second = self.get(first['next'])
+        self.assertIsNone(second['next'])
+        usernames = [user['username'] for user in first['results'] + second['results']]
+        self.assertEqual(usernames, [f'fan{i}' for i in reversed(range(12))])
+        flags = {user['username']: user['is_followed_by_me'] for user in first['results'] + second['results']}
+        self.assertEqual({name for name, followed in flags.items() if followed}, {'fan11', 'fan0'})
+
+    def test_following_list(self):
+        data = self.get(f'/api/users/{self.user.id}/following/')
+        self.assertEqual([user['username'] for user in data['results']], ['fan0', 'fan11'])
+        self.assertEqual(data['results'][0]['followers_count'], 1)
+
+    def test_query_count_does_not_grow_with_page(self):
+        def count(page_size):
+            with CaptureQueriesContext(connection) as context:
+                self.get(f'/api/users/{self.star.id}/followers/?page_size={page_size}')
+            return len(context.captured_queries)
+        self.assertEqual(count(2), count(12))
+
+    def test_unknown_user(self):
+        response = self.client.get('/api/users/999/followers/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, TOKEN_AUTH_CACHE={'BACKEND': 'local', 'MAX_ENTRIES': 2, 'TTL': 60})
+class TokenCacheTestCase(TestCase):
+    def setUp(self):
+        authentication.reset_store(setting='TOKEN_AUTH_CACHE')
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username='user', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def unread_count(self):
+        return self.client.get('/api/notifications/unread-count/')
+
+    def test_repeat_requests_skip_the_token_query(self):
+        with CaptureQueriesContext(connection) as cold:
+            self.assertEqual(self.unread_count().status_code, status.HTTP_200_OK)
+        with CaptureQueriesContext(connection) as warm:
+            self.assertEqual(self.unread_count().status_code, status.HTTP_200_OK)
+        self.assertEqual(len(cold.captured_queries) - len(warm.captured_queries), 1)
+
+    def test_profile_loads_full_user_once(self):
+        self.unread_count()
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/profile/')
+        self.assertEqual(response.data['username'], 'user')
+
+    def test_logout_revokes_cached_token(self):
+        self.unread_count()
+        self.assertEqual(self.client.post('/api/logout/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.unread_count().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_and_password_change_invalidate(self):
+        self.unread_count()
+        self.user.set_password('changed456')
+        self.user.save()
+        self.assertIsNone(authentication.get_store().get(self.token.key))
+
+        self.unread_count()
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.unread_count().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocations_from_other_processes_are_honoured(self):
+        self.unread_count()
+        store = authentication.get_store()
+        self.assertIsNotNone(store.get(self.token.key))
+        # Another process sharing the Django cache invalidates the token
+        authentication.LocalTokenStore(2, 60).delete(self.token.key)
+        self.assertIsNone(store.get(self.token.key))
+
+        self.unread_count()
+        self.assertIsNotNone(store.get(self.token.key))
+
+    def test_lru_is_bounded_and_reports_hit_rate(self):
+        store = authentication.get_store()
+        for name in ['a', 'b', 'c']:
+            user = get_user_model().objects.create_user(username=name, password='testpass123')
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+            self.unread_count()
+        self.assertEqual(store.size(), 2)
+
+        user.is_staff = True
+        user.save()
+        before = authentication.stats()
+        response = self.client.get('/api/auth/token-cache/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['misses'], before['misses'] + 1)
+
+
+THROTTLED_RATES = {'login_ip': '100/min', 'login_username': '3/min', 'register': '2/hour'}
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class LoginHashingTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username='user', password='testpass123')
+
+    def login(self, password='testpass123', url='/api/login/'):
+        return self.client.post(url, {'username': 'user', 'password': password}, format='json')
+
+    def test_old_hashes_are_upgraded_on_login(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            password=make_password('testpass123', hasher='pbkdf2_sha1')
+        )
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith(get_hasher().algorithm + '$'))
+
+    def test_username_throttle_rejects_before_hashing(self):
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': THROTTLED_RATES}):
+            for _ in range(3):
+                self.assertEqual(self.login('wrong').status_code, status.HTTP_400_BAD_REQUEST)
+            with mock.patch('django.contrib.auth.base_user.check_password') as check:
+                response = self.login()
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            check.assert_not_called()
+
+    def test_register_is_throttled_per_ip(self):
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': THROTTLED_RATES}):
+            statuses = [
+                self.client.post('/api/register/', {
+                    'username': f'new{i}', 'password': 'S3cure-pass!', 'password_confirm': 'S3cure-pass!',
+                }, format='json').status_code
+                for i in range(3)
+            ]
+        self.assertEqual(statuses, [status.HTTP_201_CREATED] * 2 + [status.HTTP_429_TOO_MANY_REQUESTS])
+
+    async def test_async_login(self):
+        await get_user_model().objects.filter(pk=self.user.pk).aupdate(
+            password=await sync_to_async(make_password)('testpass123', hasher='pbkdf2_sha1')
+        )
+        response = await self.async_client.post(
+            '/api/login/async/', {'username': 'user', 'password': 'testpass123'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['user']['username'], 'user')
+        self.assertTrue(await Token.objects.filter(user=self.user, key=response.json()['token']).aexists())
+        user = await get_user_model().objects.aget(pk=self.user.pk)
+        self.assertFalse(hashers.needs_rehash(user.password))
+
+        for username in ['user', 'nobody']:
+            response = await self.async_client.post(
+                '/api/login/async/', {'username': username, 'password': 'wrong'}, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_async_login_sheds_load_when_pool_is_full(self):
+        with override_settings(PASSWORD_HASHING={'MAX_WORKERS': 1, 'MAX_PENDING': 0}):
+            response = await self.async_client.post(
+                '/api/login/async/', {'username': 'user', 'password': 'testpass123'}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PROFILE_PICTURES={'ASYNC': False, 'VARIANTS': {'small': (64, 64), 'medium': (256, 256)}})
+class ProfilePictureTestCase(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.user = get_user_model().objects.create_user(username='user', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, size=(400, 300), name='photo.jpg'):
+        # EXIF orientation 6: stored landscape, displayed portrait
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Test Camera'
+        buffer = BytesIO()
+        source = Image.new('RGB', size, 'red')
+        source.paste('blue', (size[0] // 2, 0, size[0], size[1]))
+        source.save(buffer, format='JPEG', exif=exif)
+        buffer.seek(0)
+        buffer.name = name
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.patch('/api/profile/', {'profile_picture': buffer}, format='multipart')
+
+    def test_upload_builds_variants(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        variants = self.user.profile_picture_variants
+        self.assertEqual(set(variants), {'small', 'medium'})
+        storage = images.picture_storage()
+        for name, size in [('small', (64, 64)), ('medium', (256, 256))]:
+            self.assertEqual(set(variants[name]), {'webp', 'jpeg'})
+            for ext, path in variants[name].items():
+                self.assertRegex(path, rf'^profile_pics/variants/[0-9a-f]{{16}}-{name}\.{ext}$')
+                with storage.open(path) as f, Image.open(f) as image:
+                    self.assertEqual(image.size, size)
+                    self.assertEqual(image.format, images.FORMATS[ext])
+                    self.assertEqual(len(image.getexif()), 0)
+
+        response = self.client.get('/api/profile/')
+        self.assertEqual(
+            response.data['profile_picture_variants']['small']['webp'], storage.url(variants['small']['webp'])
+        )
+
+    def test_orientation_is_applied(self):
+        with override_settings(PROFILE_PICTURES={'ASYNC': False, 'VARIANTS': {'tall': (100, 200)}}):
+            self.upload(size=(400, 200))
+        self.user.refresh_from_db()
+        # Rotated upright, the red left half of the stored pixels ends up on top
+        with images.picture_storage().open(self.user.profile_picture_variants['tall']['jpeg']) as f:
+            with Image.open(f) as image:
+                self.assertEqual(image.size, (100, 200))
+                red, _, blue = image.getpixel((50, 20))
+                self.assertGreater(red, blue)
+                red, _, blue = image.getpixel((50, 180))
+                self.assertGreater(blue, red)
+
+    def test_identical_uploads_share_variant_files(self):
+        self.upload()
+        self.user.refresh_from_db()
+        first = self.user.profile_picture_variants
+        self.upload()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture_variants, first)
+
+    def test_invalid_image_leaves_no_variants(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(profile_picture='profile_pics/missing.jpg')
+        with self.assertLogs('accounts.images', 'WARNING'):
+            self.assertIsNone(images.process_profile_picture(self.user.pk))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture_variants, {})
+
+    def test_process_profile_pictures_command(self):
+        self.upload()
+        get_user_model().objects.filter(pk=self.user.pk).update(profile_picture_variants={})
+        out = StringIO()
+        call_command('process_profile_pictures', stdout=out)
+        self.assertIn('Processed 1 profile pictures, 0 failed', out.getvalue())
+        self.user.refresh_from_db()
+        self.assertEqual(set(self.user.profile_picture_variants), {'small', 'medium'})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ProfileResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='user', password='testpass123')
+        self.other = get_user_model().objects.create_user(username='other', password='testpass123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def profile(self, user):
+        # Requests authenticate with a freshly loaded user, not the in-memory test instance
+        self.client.force_authenticate(get_user_model().objects.get(pk=user.pk))
+        return self.client.get('/api/profile/').data
+
+    def test_profile_is_cached_with_etag(self):
+        etag = self.client.get('/api/profile/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/profile/', headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_edits_and_follows_invalidate_the_profile(self):
+        self.client.get('/api/profile/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch('/api/profile/', {'bio': 'Hello'}, format='json')
+        self.assertEqual(self.client.get('/api/profile/').data['bio'], 'Hello')
+
+        # Counters change through update(), which sends no signals
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/follow/{self.other.pk}/')
+        self.assertEqual(self.profile(self.user)['following_count'], 1)
+        self.assertEqual(self.profile(self.other)['followers_count'], 1)
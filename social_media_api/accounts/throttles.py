@@ -0,0 +1,33 @@
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class ScopedSettingsThrottle(SimpleRateThrottle):
+    """Reads its rate from DEFAULT_THROTTLE_RATES on every request so setting changes apply"""
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+
+class LoginIPThrottle(ScopedSettingsThrottle):
+    """Credential attempts per client IP"""
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class LoginUsernameThrottle(ScopedSettingsThrottle):
+    """Credential attempts per target username, whichever IPs they come from"""
+    scope = 'login_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not username:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': str(username).strip().lower()}
+
+
+class RegisterThrottle(LoginIPThrottle):
+    """Sign-ups per client IP"""
+    scope = 'register'
@@ -4,7 +4,15 @@ from . import views
 urlpatterns = [
     path('register/', views.RegisterView.as_view(), name='register'),
     path('login/', views.login_view, name='login'),
+    path('login/async/', views.async_login_view, name='async_login'),
+    path('logout/', views.logout_view, name='logout'),
+    path('auth/token-cache/', views.token_cache_stats, name='token_cache_stats'),
     path('profile/', views.ProfileView.as_view(), name='profile'),
+    path('users/suggestions/', views.follow_suggestions, name='follow_suggestions'),
+    path('users/<int:user_id>/followers/', views.FollowersListView.as_view(), name='user_followers'),
+    path('users/<int:user_id>/following/', views.FollowingListView.as_view(), name='user_following'),
+    path('follow/bulk/', views.bulk_follow, name='bulk_follow'),
+    path('unfollow/bulk/', views.bulk_unfollow, name='bulk_unfollow'),
     path('follow/<int:user_id>/', views.follow_user, name='follow_user'),
     path('unfollow/<int:user_id>/', views.unfollow_user, name='unfollow_user'),
 ]
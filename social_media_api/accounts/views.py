@@ -1,13 +1,28 @@
+import math
+
 from rest_framework import status, generics, permissions
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from social_media_api import authentication, response_cache
 from .models import CustomUser
-from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer
-from notifications.models import Notification
+from . import follows, hashers, suggestions
+from .throttles import LoginIPThrottle, LoginUsernameThrottle, RegisterThrottle
+from .serializers import (
+    UserRegistrationSerializer, UserLoginSerializer, UserProfileSerializer, BulkFollowSerializer,
+    SuggestedUserSerializer, FollowUserSerializer
+)
+from notifications.delivery import notify, retract
+from posts.timeline import backfill_timeline, prune_timeline
 
 
 class RegisterView(generics.CreateAPIView):
@@ -15,6 +30,7 @@ class RegisterView(generics.CreateAPIView):
     queryset = CustomUser.objects.all()
     serializer_class = UserRegistrationSerializer
     permission_classes = [AllowAny]
+    throttle_classes = [RegisterThrottle]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -29,6 +45,7 @@ class RegisterView(generics.CreateAPIView):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginIPThrottle, LoginUsernameThrottle])
 def login_view(request):
     """User login view"""
     serializer = UserLoginSerializer(data=request.data)
@@ -42,13 +59,84 @@ def login_view(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@csrf_exempt
+@require_POST
+async def async_login_view(request):
+    """
+    Login for ASGI deployments: the password is checked in the bounded hashing
+    pool so the event loop keeps serving other requests meanwhile
+    """
+    request = Request(request, parsers=[JSONParser(), FormParser(), MultiPartParser()])
+    for throttle in (LoginIPThrottle(), LoginUsernameThrottle()):
+        if not throttle.allow_request(request, None):
+            return JsonResponse(
+                {'detail': 'Request was throttled.'}, status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={'Retry-After': str(math.ceil(throttle.wait() or 1))},
+            )
+
+    username, password = request.data.get('username'), request.data.get('password')
+    if not username or not password:
+        return JsonResponse(
+            {'non_field_errors': ['Must include username and password.']}, status=status.HTTP_400_BAD_REQUEST
+        )
+
+    user = await CustomUser.objects.filter(username=username).afirst()
+    try:
+        if user is None:
+            await hashers.ahash_dummy(password)
+            is_correct, upgraded = False, None
+        else:
+            is_correct, upgraded = await hashers.acheck_password(user, password)
+    except hashers.HashingPoolFull:
+        return JsonResponse(
+            {'detail': 'Too many logins in progress, retry shortly.'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'},
+        )
+    if not is_correct or not user.is_active:
+        return JsonResponse({'non_field_errors': ['Invalid credentials.']}, status=status.HTTP_400_BAD_REQUEST)
+
+    if upgraded:
+        # Same upgrade authenticate() makes for hashes from an older hasher or cost setting
+        await CustomUser.objects.filter(pk=user.pk).aupdate(password=upgraded)
+    token, created = await Token.objects.aget_or_create(user=user)
+    data = await sync_to_async(lambda: UserProfileSerializer(user).data)()
+    return JsonResponse({'user': data, 'token': token.key}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout_view(request):
+    """Revoke the current token"""
+    Token.objects.filter(user=request.user).delete()
+    return Response({'message': 'Logged out'}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def token_cache_stats(request):
+    """Hit rate and size of the token authentication cache (admin only)"""
+    return Response(authentication.stats(), status=status.HTTP_200_OK)
+
+
 class ProfileView(generics.RetrieveUpdateAPIView):
     """User profile view"""
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
-        return self.request.user
+        user = self.request.user
+        # A trimmed snapshot from the token cache: load every column at once rather than one by one
+        if user.get_deferred_fields():
+            user = CustomUser.objects.get(pk=user.pk)
+        return user
+
+    def retrieve(self, request, *args, **kwargs):
+        user_id = request.user.pk
+        # Picture URLs are absolute, so entries are kept per host
+        version, data = response_cache.lookup(
+            'user', user_id, lambda: self.get_serializer(self.get_object()).data, variant=request.get_host()
+        )
+        return response_cache.conditional_response(request, data, response_cache.make_etag('user', user_id, version))
 
 
 @api_view(['POST'])
@@ -63,14 +151,15 @@ def follow_user(request, user_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    request.user.following.add(user_to_follow)
+    follows.follow(request.user, user_to_follow)
+    backfill_timeline(request.user, user_to_follow)
     
-    # Create notification for the followed user
-    Notification.objects.create(
+    # Notify the followed user; follows are aggregated on the followed account
+    notify(
         recipient=user_to_follow,
         actor=request.user,
         verb='started following you',
-        target=request.user
+        target=user_to_follow
     )
     
     return Response(
@@ -92,14 +181,14 @@ class FollowUserView(generics.GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        request.user.following.add(user_to_follow)
+        follows.follow(request.user, user_to_follow)
+        backfill_timeline(request.user, user_to_follow)
         
-        # Create notification for the followed user
-        Notification.objects.create(
+        notify(
             recipient=user_to_follow,
             actor=request.user,
             verb='started following you',
-            target=request.user
+            target=user_to_follow
         )
         
         return Response(
@@ -120,7 +209,14 @@ def unfollow_user(request, user_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    request.user.following.remove(user_to_unfollow)
+    follows.unfollow(request.user, user_to_unfollow)
+    prune_timeline(request.user, user_to_unfollow)
+    retract(
+        recipient=user_to_unfollow,
+        actor=request.user,
+        verb='started following you',
+        target=user_to_unfollow
+    )
     return Response(
         {'message': f'You have unfollowed {user_to_unfollow.username}'}, 
         status=status.HTTP_200_OK
@@ -140,8 +236,124 @@ class UnfollowUserView(generics.GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        request.user.following.remove(user_to_unfollow)
+        follows.unfollow(request.user, user_to_unfollow)
+        prune_timeline(request.user, user_to_unfollow)
+        retract(
+            recipient=user_to_unfollow,
+            actor=request.user,
+            verb='started following you',
+            target=user_to_unfollow
+        )
         return Response(
             {'message': f'You have unfollowed {user_to_unfollow.username}'}, 
             status=status.HTTP_200_OK
         )
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_follow(request):
+    """Follow up to BULK_FOLLOW_MAX users at once"""
+    serializer = BulkFollowSerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    users = serializer.validated_data['users']
+    followed = follows.follow_many(request.user, users)
+
+    backfill_timeline(request.user, *followed)
+    for user_to_follow in followed:
+        notify(
+            recipient=user_to_follow,
+            actor=request.user,
+            verb='started following you',
+            target=user_to_follow
+        )
+
+    followed_ids = {user.pk for user in followed}
+    return Response({
+        'followed': [user.pk for user in followed],
+        'already_following': [user.pk for user in users if user.pk not in followed_ids],
+        'not_found': serializer.validated_data['not_found'],
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def bulk_unfollow(request):
+    """Unfollow up to BULK_FOLLOW_MAX users at once"""
+    serializer = BulkFollowSerializer(data=request.data, context={'request': request})
+    serializer.is_valid(raise_exception=True)
+    users = serializer.validated_data['users']
+    unfollowed = follows.unfollow_many(request.user, users)
+
+    prune_timeline(request.user, *unfollowed)
+    for user_to_unfollow in unfollowed:
+        retract(
+            recipient=user_to_unfollow,
+            actor=request.user,
+            verb='started following you',
+            target=user_to_unfollow
+        )
+
+    unfollowed_ids = {user.pk for user in unfollowed}
+    return Response({
+        'unfollowed': [user.pk for user in unfollowed],
+        'not_following': [user.pk for user in users if user.pk not in unfollowed_ids],
+        'not_found': serializer.validated_data['not_found'],
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def follow_suggestions(request):
+    """Accounts the user may know, ranked by shared follows and followers"""
+    ranked = suggestions.suggestions_for(request.user)
+    scores = dict(ranked)
+    # The cached list can predate recent follows, so drop accounts followed since
+    users = (
+        CustomUser.objects.filter(pk__in=scores, is_active=True).exclude(followers=request.user)
+        .only('id', 'username', 'profile_picture', 'followers_count')
+        .in_bulk()
+    )
+    users = [users[pk] for pk, _ in ranked if pk in users]
+    serializer = SuggestedUserSerializer(users, many=True, context={'scores': scores})
+    return Response({'results': serializer.data}, status=status.HTTP_200_OK)
+
+
+class FollowListView(generics.ListAPIView):
+    """
+    Keyset-paginated followers or followees of a user, newest follow first.
+    Pages walk the follow table's (user, id) index, so deep pages cost the same as the first.
+    """
+    serializer_class = FollowUserSerializer
+    permission_classes = [IsAuthenticated]
+    # Column holding the listed user's id, and the one holding the user the list belongs to
+    user_field = None
+    owner_field = None
+
+    def get_queryset(self):
+        owner = get_object_or_404(CustomUser.objects.only('pk'), pk=self.kwargs['user_id'])
+        fields = [f'{self.user_field}__{name}' for name in ('id', 'username', 'profile_picture', 'followers_count')]
+        return (
+            follows.Follow.objects.filter(**{self.owner_field: owner})
+            .select_related(self.user_field)
+            .only('id', self.owner_field, self.user_field, *fields)
+            .order_by('-id')
+        )
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        users = [getattr(row, self.user_field) for row in page]
+        serializer = self.get_serializer(users, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class FollowersListView(FollowListView):
+    """Accounts following the user"""
+    user_field = 'to_customuser'
+    owner_field = 'from_customuser'
+
+
+class FollowingListView(FollowListView):
+    """Accounts the user follows"""
+    user_field = 'from_customuser'
+    owner_field = 'to_customuser'
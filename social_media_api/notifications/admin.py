@@ -4,7 +4,8 @@ from .models import Notification
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('recipient', 'actor', 'verb', 'target', 'timestamp', 'read')
+    list_display = ('recipient', 'actor', 'actor_count', 'verb', 'target_summary', 'timestamp', 'read')
+    list_select_related = ('recipient', 'actor')
     list_filter = ('read', 'timestamp', 'verb')
     search_fields = ('recipient__username', 'actor__username', 'verb')
     readonly_fields = ('timestamp',)
@@ -0,0 +1,380 @@
+"""Notification events queued at commit and written in aggregated batches by the NOTIFICATION_QUEUE backend."""
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from functools import reduce
+from operator import or_
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from social_media_api.conf import Singleton, get_options
+from . import realtime
+from .models import Notification, NotificationActor, NotificationOutbox, describe_target
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKEND': 'local',
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+NotificationEvent = namedtuple(
+    'NotificationEvent',
+    ['recipient_id', 'actor_id', 'verb', 'target_content_type_id', 'target_object_id', 'target_summary', 'retract'],
+)
+
+
+def event_key(event):
+    return (event.recipient_id, event.actor_id, event.verb, event.target_content_type_id, event.target_object_id)
+
+
+def collapse(events):
+    """Reduce a batch of events to the latest event of each actor on each target"""
+    pending = {}
+    for event in events:
+        key = event_key(event)
+        # Re-inserted so the batch keeps the order of each actor's latest activity
+        pending.pop(key, None)
+        pending[key] = event
+    return list(pending.values())
+
+
+def aggregate_key(event):
+    return (event.recipient_id, event.verb, event.target_content_type_id, event.target_object_id)
+
+
+def upsert(events):
+    """Fold a collapsed batch into the aggregated Notification rows; returns the rows with new activity"""
+    if not events:
+        return []
+    groups = {}
+    for event in events:
+        groups.setdefault(aggregate_key(event), []).append(event)
+    usernames = dict(
+        get_user_model().objects.filter(pk__in={event.actor_id for event in events if not event.retract})
+        .values_list('pk', 'username')
+    )
+    lookup = reduce(or_, [
+        Q(recipient_id=recipient_id, verb=verb, target_content_type_id=content_type_id, target_object_id=object_id)
+        for recipient_id, verb, content_type_id, object_id in groups
+    ])
+    now = timezone.now()
+
+    with transaction.atomic():
+        existing = {
+            aggregate_key(notification): notification
+            for notification in Notification.objects.select_for_update().filter(lookup)
+        }
+        created, active, added, retracted = [], [], [], []
+        for key, group in groups.items():
+            notification = existing.get(key)
+            has_activity = any(not event.retract for event in group)
+            if notification is None:
+                if not has_activity:
+                    # Retracting something that was never delivered
+                    continue
+                recipient_id, verb, content_type_id, object_id = key
+                notification = Notification(
+                    recipient_id=recipient_id, verb=verb, target_content_type_id=content_type_id,
+                    target_object_id=object_id, actor_count=0, recent_actors=[],
+                )
+                created.append(notification)
+            for event in group:
+                if event.retract:
+                    notification.remove_actor(event.actor_id)
+                    retracted.append((notification, event.actor_id))
+                else:
+                    notification.add_actor(event.actor_id, usernames.get(event.actor_id, ''))
+                    notification.target_summary = event.target_summary
+                    added.append((notification, event.actor_id))
+            if has_activity:
+                # New activity bumps the row to the top and marks it unread again
+                notification.timestamp = now
+                notification.read = False
+                active.append(notification)
+        Notification.objects.bulk_create(created)
+
+        NotificationActor.objects.bulk_create(
+            [NotificationActor(notification=notification, actor_id=actor_id) for notification, actor_id in added],
+            ignore_conflicts=True,
+        )
+        if retracted:
+            NotificationActor.objects.filter(reduce(or_, [
+                Q(notification=notification, actor_id=actor_id) for notification, actor_id in retracted
+            ])).delete()
+
+        # Counted from the actor rows, so repeat and retracted actors can never skew the total
+        touched = list(existing.values()) + created
+        counts = dict(
+            NotificationActor.objects.filter(notification__in=touched)
+            .values_list('notification').annotate(Count('id'))
+        )
+        for notification in touched:
+            notification.actor_count = counts.get(notification.pk, 0)
+            if len(notification.recent_actors) < min(notification.actor_count, Notification.RECENT_ACTORS_LIMIT):
+                refill_recent_actors(notification)
+            if notification.recent_actors:
+                notification.actor_id = notification.recent_actors[0]['id']
+        Notification.objects.filter(pk__in=[n.pk for n in touched if not n.actor_count]).delete()
+        Notification.objects.bulk_update(
+            [notification for notification in touched if notification.actor_count],
+            ['actor', 'actor_count', 'recent_actors', 'target_summary', 'timestamp', 'read'],
+        )
+    return [notification for notification in active if notification.actor_count]
+
+
+def refill_recent_actors(notification):
+    """Top up recent_actors from the newest remaining actors after some were retracted"""
+    listed = {entry['id'] for entry in notification.recent_actors}
+    limit = Notification.RECENT_ACTORS_LIMIT - len(listed)
+    remaining = (
+        NotificationActor.objects.filter(notification=notification).exclude(actor_id__in=listed)
+        .order_by('-id').values_list('actor_id', 'actor__username')[:limit]
+    )
+    notification.recent_actors += [{'id': actor_id, 'username': username} for actor_id, username in remaining]
+
+
+class QueueMetrics:
+    """Counters describing queue health, safe to read from any thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.enqueued = 0
+        self.delivered = 0
+        self.collapsed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def record_enqueue(self):
+        with self.lock:
+            self.enqueued += 1
+
+    def record_flush(self, received, delivered, elapsed_ms):
+        with self.lock:
+            self.flushes += 1
+            self.delivered += delivered
+            self.collapsed += received - delivered
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self.total_flush_ms += elapsed_ms
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'enqueued': self.enqueued,
+                'delivered': self.delivered,
+                'collapsed': self.collapsed,
+                'flushes': self.flushes,
+                'last_flush_ms': round(self.last_flush_ms, 3),
+                'max_flush_ms': round(self.max_flush_ms, 3),
+                'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            }
+
+
+class BaseQueue:
+    def __init__(self, batch_size, flush_interval):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.metrics = QueueMetrics()
+
+    def put(self, event):
+        raise NotImplementedError
+
+    def depth(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Deliver everything currently queued; returns the number of notifications written"""
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def write(self, events):
+        started = time.perf_counter()
+        pending = collapse(events)
+        try:
+            written = upsert(pending)
+        except IntegrityError:
+            # Another worker created one of the rows first; it is visible now, so update it instead
+            written = upsert(pending)
+        transaction.on_commit(lambda: realtime.publish_notifications(written))
+        self.metrics.record_flush(len(events), len(pending), (time.perf_counter() - started) * 1000)
+        return len(written)
+
+    def stats(self):
+        return {'backend': self.name, 'depth': self.depth(), **self.metrics.snapshot()}
+
+
+class SyncQueue(BaseQueue):
+    name = 'sync'
+
+    def put(self, event):
+        self.metrics.record_enqueue()
+        self.write([event])
+
+    def depth(self):
+        return 0
+
+    def flush(self):
+        return 0
+
+
+class LocalQueue(BaseQueue):
+    """In-process queue flushed by a background thread"""
+    name = 'local'
+
+    def __init__(self, batch_size, flush_interval):
+        super().__init__(batch_size, flush_interval)
+        self.events = queue.Queue()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.worker = None
+
+    def put(self, event):
+        self.events.put(event)
+        self.metrics.record_enqueue()
+        self.ensure_worker()
+        if self.events.qsize() >= self.batch_size:
+            self.wakeup.set()
+
+    def depth(self):
+        return self.events.qsize()
+
+    def drain(self):
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        written = 0
+        with self.flush_lock:
+            while True:
+                batch = self.drain()
+                if not batch:
+                    return written
+                written += self.write(batch)
+
+    def ensure_worker(self):
+        # Without an interval the queue is only flushed explicitly (tests, management commands)
+        if self.flush_interval is None or (self.worker and self.worker.is_alive()):
+            return
+        self.worker = threading.Thread(target=self.run, name='notification-queue', daemon=True)
+        self.worker.start()
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Notification flush failed')
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        self.flush()
+
+
+class OutboxQueue(BaseQueue):
+    """Durable queue backed by the NotificationOutbox table"""
+    name = 'outbox'
+
+    def put(self, event):
+        NotificationOutbox.objects.create(**event._asdict())
+        self.metrics.record_enqueue()
+
+    def depth(self):
+        return NotificationOutbox.objects.count()
+
+    def flush(self):
+        written = 0
+        while True:
+            with transaction.atomic():
+                rows = list(NotificationOutbox.objects.order_by('id')[:self.batch_size])
+                if not rows:
+                    return written
+                written += self.write([
+                    NotificationEvent(
+                        row.recipient_id, row.actor_id, row.verb,
+                        row.target_content_type_id, row.target_object_id, row.target_summary, row.retract,
+                    )
+                    for row in rows
+                ])
+                NotificationOutbox.objects.filter(id__in=[row.id for row in rows]).delete()
+
+
+BACKENDS = {
+    'sync': SyncQueue,
+    'local': LocalQueue,
+    'outbox': OutboxQueue,
+}
+
+def _build_queue():
+    options = get_options('NOTIFICATION_QUEUE', DEFAULTS)
+    return BACKENDS[options['BACKEND']](options['BATCH_SIZE'], options['FLUSH_INTERVAL'])
+
+
+_queue = Singleton('NOTIFICATION_QUEUE', _build_queue, close=lambda notification_queue: notification_queue.stop())
+get_queue = _queue.get
+reset_queue = _queue.reset
+
+
+@atexit.register
+def flush_on_exit():
+    notification_queue = _queue.peek()
+    if notification_queue is not None:
+        try:
+            notification_queue.stop()
+        except Exception:
+            logger.exception('Could not flush pending notifications on exit')
+
+
+def _enqueue(recipient, actor, verb, target, retract):
+    event = NotificationEvent(
+        recipient_id=recipient.pk,
+        actor_id=actor.pk,
+        verb=verb,
+        target_content_type_id=ContentType.objects.get_for_model(target).pk,
+        target_object_id=target.pk,
+        target_summary=describe_target(target),
+        retract=retract,
+    )
+    # Only deliver once the triggering write is committed
+    transaction.on_commit(lambda: get_queue().put(event))
+
+
+def notify(recipient, actor, verb, target):
+    """Queue a notification for delivery"""
+    _enqueue(recipient, actor, verb, target, retract=False)
+
+
+def retract(recipient, actor, verb, target):
+    """Withdraw the actor from a matching notification, whether it is still queued or already delivered"""
+    _enqueue(recipient, actor, verb, target, retract=True)
+
+
+def flush():
+    return get_queue().flush()
+
+
+def stats():
+    return get_queue().stats()
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from notifications import delivery
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued notifications (drains the outbox when NOTIFICATION_QUEUE uses it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting once drained')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            written = delivery.flush()
+            if written:
+                self.stdout.write(f'Delivered {written} notifications')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(str(delivery.stats())))
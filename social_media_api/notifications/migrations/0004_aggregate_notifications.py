@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:29
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+RECENT_ACTORS_LIMIT = 3
+
+
+def merge_duplicates(apps, schema_editor):
+    """Fold existing per-interaction rows into one aggregated row per (recipient, verb, target)"""
+    Notification = apps.get_model('notifications', 'Notification')
+    groups = {}
+    rows = Notification.objects.select_related('actor').order_by('-timestamp', '-id')
+    for notification in rows.iterator():
+        key = (
+            notification.recipient_id, notification.verb,
+            notification.target_content_type_id, notification.target_object_id,
+        )
+        groups.setdefault(key, []).append(notification)
+
+    for notifications in groups.values():
+        keep, duplicates = notifications[0], notifications[1:]
+        actors = []
+        for notification in notifications:
+            if notification.actor_id not in [actor['id'] for actor in actors]:
+                actors.append({'id': notification.actor_id, 'username': notification.actor.username})
+        keep.actor_count = len(actors)
+        keep.recent_actors = actors[:RECENT_ACTORS_LIMIT]
+        keep.read = all(notification.read for notification in notifications)
+        keep.save(update_fields=['actor_count', 'recent_actors', 'read'])
+        if duplicates:
+            Notification.objects.filter(pk__in=[notification.pk for notification in duplicates]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0003_notificationoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='recent_actors',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('recipient', 'verb', 'target_content_type', 'target_object_id'), name='notif_unique_recipient_verb_target'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.5 on 2026-10-18 06:31
+
+from django.db import migrations, models
+
+
+def describe(target):
+    if target is None:
+        return ''
+    if target._meta.model_name == 'post':
+        return f"Post: {target.title}"[:255]
+    if target._meta.model_name == 'comment':
+        return f"Comment: {target.content[:50]}..."
+    return str(getattr(target, 'username', target))[:255]
+
+
+def backfill_target_summaries(apps, schema_editor):
+    """Describe existing targets with one lookup per content type"""
+    Notification = apps.get_model('notifications', 'Notification')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    for content_type in ContentType.objects.filter(
+        pk__in=Notification.objects.values('target_content_type').distinct()
+    ):
+        try:
+            model = apps.get_model(content_type.app_label, content_type.model)
+        except LookupError:
+            continue
+        notifications = list(Notification.objects.filter(target_content_type=content_type))
+        targets = model._default_manager.in_bulk({n.target_object_id for n in notifications})
+        for notification in notifications:
+            notification.target_summary = describe(targets.get(notification.target_object_id))
+        Notification.objects.bulk_update(notifications, ['target_summary'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0004_aggregate_notifications'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='target_summary',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='notificationoutbox',
+            name='target_summary',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(backfill_target_summaries, migrations.RunPython.noop),
+    ]
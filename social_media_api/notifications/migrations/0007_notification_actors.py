@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_actors(apps, schema_editor):
+    """Record the actors still known for existing rows: the recent actors, or the displayed actor"""
+    Notification = apps.get_model('notifications', 'Notification')
+    NotificationActor = apps.get_model('notifications', 'NotificationActor')
+    actors = []
+    for notification in Notification.objects.only('pk', 'actor_id', 'recent_actors').iterator():
+        actor_ids = {entry['id'] for entry in notification.recent_actors} or {notification.actor_id}
+        actors.extend(NotificationActor(notification_id=notification.pk, actor_id=actor_id) for actor_id in actor_ids)
+    NotificationActor.objects.bulk_create(actors, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0006_unread_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actors', to='notifications.notification')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('notification', 'actor'), name='notif_actor_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_actors, migrations.RunPython.noop),
+    ]
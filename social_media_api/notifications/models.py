@@ -1,11 +1,31 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
 
+def describe_target(target):
+    """Short description of a notification target, such as: Post: Hello world"""
+    if target is None:
+        return ''
+    model_name = target._meta.model_name
+    if model_name == 'post':
+        return f"Post: {target.title}"[:255]
+    if model_name == 'comment':
+        return f"Comment: {target.content[:50]}..."
+    return str(target)[:255]
+
+
 class Notification(models.Model):
-    """Notification model for user notifications"""
+    """
+    Notification model for user notifications.
+
+    One row aggregates every actor who did `verb` to `target` for a recipient
+    ("alice and 41 others liked your post"); new activity updates the row in
+    place instead of adding another one, and the row is deleted once every
+    actor has retracted.
+    """
     recipient = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
         on_delete=models.CASCADE, 
@@ -15,16 +35,81 @@ class Notification(models.Model):
         settings.AUTH_USER_MODEL, 
         on_delete=models.CASCADE, 
         related_name='sent_notifications'
-    )
+    )  # Most recent actor
     verb = models.CharField(max_length=255)  # Description of the action
     target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     target_object_id = models.PositiveIntegerField()
     target = GenericForeignKey('target_content_type', 'target_object_id')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Rendered description of the target, stored at write time so lists need no GFK lookups
+    target_summary = models.CharField(max_length=255, blank=True)
+    actor_count = models.PositiveIntegerField(default=1)  # Distinct actors, see NotificationActor
+    # Newest first, capped at RECENT_ACTORS_LIMIT entries of {'id': ..., 'username': ...}
+    recent_actors = models.JSONField(default=list, blank=True)
+    timestamp = models.DateTimeField(default=timezone.now)  # Time of the latest activity
     read = models.BooleanField(default=False)
 
+    RECENT_ACTORS_LIMIT = 3
+
     class Meta:
         ordering = ['-timestamp']
+        # Backs keyset pagination of a recipient's notifications on (timestamp, id)
+        indexes = [
+            models.Index(fields=['recipient', '-timestamp', '-id'], name='notif_recipient_ts_idx'),
+            # Partial index: unread badge counts only touch the recipient's unread rows
+            models.Index(fields=['recipient'], condition=models.Q(read=False), name='notif_unread_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipient', 'verb', 'target_content_type', 'target_object_id'],
+                name='notif_unique_recipient_verb_target',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.actor.username} {self.verb} - {self.recipient.username}"
+
+    def add_actor(self, actor_id, username):
+        """Move an actor to the front of recent_actors and make them the displayed actor"""
+        others = [entry for entry in self.recent_actors if entry['id'] != actor_id]
+        self.recent_actors = [{'id': actor_id, 'username': username}] + others[:self.RECENT_ACTORS_LIMIT - 1]
+        self.actor_id = actor_id
+
+    def remove_actor(self, actor_id):
+        """Drop an actor from recent_actors; returns whether they were listed"""
+        others = [entry for entry in self.recent_actors if entry['id'] != actor_id]
+        removed = len(others) != len(self.recent_actors)
+        self.recent_actors = others
+        return removed
+
+
+class NotificationActor(models.Model):
+    """A distinct actor counted in an aggregated Notification; actor_count is the number of these rows"""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actors')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['notification', 'actor'], name='notif_actor_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.actor_id} in notification {self.notification_id}"
+
+
+class NotificationOutbox(models.Model):
+    """Pending notification written by a request and delivered later by the outbox worker"""
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    verb = models.CharField(max_length=255)
+    target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    target_object_id = models.PositiveIntegerField()
+    target_summary = models.CharField(max_length=255, blank=True)
+    # Retractions cancel a still-pending notification, e.g. an unlike right after a like
+    retract = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Pending: {self.verb} for user {self.recipient_id}"
@@ -0,0 +1,236 @@
+"""Server-Sent Events brokers: per-process delivery, optionally relayed between processes through Redis."""
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from social_media_api.conf import Singleton
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class RealtimeMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.connections_total = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.last_fanout_ms = 0.0
+        self.max_fanout_ms = 0.0
+        self.total_fanout_ms = 0.0
+
+    def record_connection(self, delta):
+        with self.lock:
+            self.connections += delta
+            if delta > 0:
+                self.connections_total += delta
+
+    def record_publish(self, dropped=False):
+        with self.lock:
+            self.published += 1
+            if dropped:
+                self.dropped += 1
+
+    def record_delivery(self, published_at):
+        """Latency from publish() to the event being written to the client's stream"""
+        elapsed_ms = (time.perf_counter() - published_at) * 1000
+        with self.lock:
+            self.delivered += 1
+            self.last_fanout_ms = elapsed_ms
+            self.max_fanout_ms = max(self.max_fanout_ms, elapsed_ms)
+            self.total_fanout_ms += elapsed_ms
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'connections': self.connections,
+                'connections_total': self.connections_total,
+                'published': self.published,
+                'delivered': self.delivered,
+                'dropped': self.dropped,
+                'last_fanout_ms': round(self.last_fanout_ms, 3),
+                'max_fanout_ms': round(self.max_fanout_ms, 3),
+                'avg_fanout_ms': round(self.total_fanout_ms / self.delivered, 3) if self.delivered else 0.0,
+            }
+
+
+class Subscription:
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+
+class InMemoryBroker:
+    """Process-local pub/sub keyed by user id"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.metrics = RealtimeMetrics()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self.lock:
+            self.subscriptions.setdefault(user_id, set()).add(subscription)
+        self.metrics.record_connection(1)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.user_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscriptions.pop(subscription.user_id, None)
+        self.metrics.record_connection(-1)
+
+    def connected_user_ids(self):
+        with self.lock:
+            return set(self.subscriptions)
+
+    def publish(self, user_id, event, data):
+        """Send an event to every connection of `user_id`; safe to call from any thread"""
+        with self.lock:
+            subscribers = list(self.subscriptions.get(user_id, ()))
+        message = {'event': event, 'data': data, 'published_at': time.perf_counter()}
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(self._offer, subscription, message)
+            except RuntimeError:
+                # The connection's event loop has already shut down
+                self.unsubscribe(subscription)
+
+    def _offer(self, subscription, message):
+        try:
+            subscription.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: drop rather than let its backlog grow without bound
+            self.metrics.record_publish(dropped=True)
+        else:
+            self.metrics.record_publish()
+
+    def stats(self):
+        return self.metrics.snapshot()
+
+
+class RedisBroker(InMemoryBroker):
+    """
+    Pub/sub through Redis (settings.REALTIME_REDIS_URL), so an event published by
+    any process reaches connections held by every other one. Each process
+    subscribes to the channels of its connected users and a listener thread
+    relays their messages to the local subscriptions.
+    """
+    channel_prefix = 'realtime:user:'
+    poll_seconds = 0.1
+
+    def __init__(self):
+        import redis
+
+        super().__init__()
+        self.redis = redis.Redis.from_url(settings.REALTIME_REDIS_URL)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        # The pubsub connection belongs to the listener thread; (un)subscribes are handed to it
+        self.channel_changes = queue.SimpleQueue()
+        self.listener = None
+        self.listener_lock = threading.Lock()
+
+    def channel(self, user_id):
+        return f'{self.channel_prefix}{user_id}'
+
+    def subscribe(self, user_id):
+        subscription = super().subscribe(user_id)
+        self.channel_changes.put(('subscribe', self.channel(user_id)))
+        self.ensure_listener()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        super().unsubscribe(subscription)
+        with self.lock:
+            still_connected = subscription.user_id in self.subscriptions
+        if not still_connected:
+            self.channel_changes.put(('unsubscribe', self.channel(subscription.user_id)))
+
+    def connected_user_ids(self):
+        """Users with a connection on any process, from the channels Redis has subscribers for"""
+        channels = self.redis.pubsub_channels(f'{self.channel_prefix}*')
+        return {int(channel.decode().rsplit(':', 1)[1]) for channel in channels}
+
+    def publish(self, user_id, event, data):
+        self.redis.publish(self.channel(user_id), json.dumps({'event': event, 'data': data}))
+
+    def ensure_listener(self):
+        with self.listener_lock:
+            if self.listener is None or not self.listener.is_alive():
+                self.listener = threading.Thread(target=self.listen, name='realtime-redis', daemon=True)
+                self.listener.start()
+
+    def listen(self):
+        while True:
+            try:
+                self.relay()
+            except Exception:
+                logger.exception('Realtime relay failed')
+                time.sleep(self.poll_seconds)
+
+    def relay(self):
+        """Apply pending (un)subscribes, then hand at most one Redis message to the local connections"""
+        while not self.channel_changes.empty():
+            action, channel = self.channel_changes.get()
+            getattr(self.pubsub, action)(channel)
+        message = self.pubsub.get_message(timeout=self.poll_seconds)
+        if message is not None and message['type'] == 'message':
+            user_id = int(message['channel'].decode().rsplit(':', 1)[1])
+            payload = json.loads(message['data'])
+            super().publish(user_id, payload['event'], payload['data'])
+
+
+def _build_broker():
+    return import_string(getattr(settings, 'REALTIME_BROKER', 'notifications.realtime.InMemoryBroker'))()
+
+
+_broker = Singleton('REALTIME_BROKER', _build_broker)
+get_broker = _broker.get
+reset_broker = _broker.reset
+
+
+def publish_notifications(notifications):
+    """Push freshly written notifications to recipients that are connected"""
+    broker = get_broker()
+    connected = broker.connected_user_ids()
+    for notification in notifications:
+        if notification.recipient_id not in connected:
+            continue
+        broker.publish(notification.recipient_id, 'notification', {
+            'id': notification.pk,
+            'verb': notification.verb,
+            'target': notification.target_summary,
+            'actor_count': notification.actor_count,
+            'recent_actors': [entry['username'] for entry in notification.recent_actors],
+            'timestamp': notification.timestamp.isoformat(),
+        })
+
+
+def publish_feed_item(post):
+    """Push a new post to the author's followers that are connected right now"""
+    broker = get_broker()
+    connected = broker.connected_user_ids()
+    if not connected:
+        return
+    follower_ids = post.author.followers.filter(pk__in=connected).values_list('pk', flat=True)
+    data = {
+        'id': post.pk,
+        'author': post.author.username,
+        'author_id': post.author_id,
+        'title': post.title,
+        'created_at': post.created_at.isoformat(),
+    }
+    for follower_id in follower_ids:
+        broker.publish(follower_id, 'feed', data)
@@ -1,20 +1,64 @@
+from django.contrib.contenttypes.models import ContentType
 from rest_framework import serializers
-from .models import Notification
+from .models import Notification, describe_target
+
+
+class NotificationListSerializer(serializers.ListSerializer):
+    """Fills in missing target summaries for a page with one query per content type"""
+
+    def to_representation(self, data):
+        notifications = list(data.all() if hasattr(data, 'all') else data)
+        missing = {}
+        for notification in notifications:
+            if not notification.target_summary:
+                missing.setdefault(notification.target_content_type_id, []).append(notification)
+        for content_type_id, group in missing.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            targets = model._default_manager.in_bulk({n.target_object_id for n in group}) if model else {}
+            for notification in group:
+                notification.target_summary = describe_target(targets.get(notification.target_object_id))
+        return super().to_representation(notifications)
 
 
 class NotificationSerializer(serializers.ModelSerializer):
     """Serializer for notifications"""
     actor = serializers.StringRelatedField(read_only=True)
     target = serializers.SerializerMethodField()
+    recent_actors = serializers.SerializerMethodField()
+    summary = serializers.SerializerMethodField()
 
     class Meta:
         model = Notification
-        fields = ['id', 'actor', 'verb', 'target', 'timestamp', 'read']
-        read_only_fields = ['id', 'actor', 'verb', 'target', 'timestamp']
+        fields = ['id', 'actor', 'actor_count', 'recent_actors', 'verb', 'summary',
+                  'target', 'timestamp', 'read']
+        read_only_fields = ['id', 'actor', 'actor_count', 'verb', 'target', 'timestamp']
+        list_serializer_class = NotificationListSerializer
+
+    def get_recent_actors(self, obj):
+        return [entry['username'] for entry in obj.recent_actors]
+
+    def get_summary(self, obj):
+        """Human readable line such as: alice and 41 others liked your post"""
+        names = self.get_recent_actors(obj) or [str(obj.actor)]
+        others = obj.actor_count - 1
+        if others <= 0:
+            return f"{names[0]} {obj.verb}"
+        if others == 1 and len(names) > 1:
+            return f"{names[0]} and {names[1]} {obj.verb}"
+        return f"{names[0]} and {others} others {obj.verb}"
 
     def get_target(self, obj):
-        if hasattr(obj.target, 'title'):  # Post
-            return f"Post: {obj.target.title}"
-        elif hasattr(obj.target, 'content'):  # Comment
-            return f"Comment: {obj.target.content[:50]}..."
-        return str(obj.target)
+        if obj.target_summary:
+            return obj.target_summary
+        return describe_target(obj.target)
+
+
+class MarkNotificationsReadSerializer(serializers.Serializer):
+    """Selects notifications to mark as read, either by id or everything up to a timestamp"""
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000, required=False)
+    before = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if ('ids' in data) == ('before' in data):
+            raise serializers.ValidationError('Provide either ids or before.')
+        return data
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.authtoken.models import Token
+from .realtime import get_broker
+
+HEARTBEAT_SECONDS = 15
+
+
+async def authenticate_token(request):
+    """Token from the Authorization header, or ?token= since EventSource cannot set headers"""
+    header = request.headers.get('Authorization', '')
+    key = header[len('Token '):] if header.startswith('Token ') else request.GET.get('token')
+    if not key:
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=key)
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def event_stream(user_id):
+    broker = get_broker()
+    subscription = broker.subscribe(user_id)
+    try:
+        yield ': connected\n\n'
+        while True:
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': heartbeat\n\n'
+                continue
+            broker.metrics.record_delivery(message['published_at'])
+            yield format_event(message['event'], message['data'])
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def stream(request):
+    """Server-Sent Events stream of new notifications and feed items for the current user"""
+    user = await authenticate_token(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    response = StreamingHttpResponse(event_stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def stream_stats(request):
+    """Connection count and fan-out latency of the realtime stream (staff only)"""
+    user = await authenticate_token(request)
+    if user is None or not user.is_staff:
+        return JsonResponse({'detail': 'You do not have permission to perform this action.'}, status=403)
+    return JsonResponse(get_broker().stats())
@@ -1,3 +1,482 @@
-from django.test import TestCase
+import asyncio
+import json
+import sys
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from posts.models import Post, Comment
+from .models import Notification, NotificationActor, NotificationOutbox, describe_target
+from . import delivery, realtime
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class NotificationListTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.recipient = get_user_model().objects.create_user(username='recipient', password='testpass123')
+        self.actor = get_user_model().objects.create_user(username='actor', password='testpass123')
+        self.client.force_authenticate(user=self.recipient)
+
+    def notify(self, count):
+        for i in range(count):
+            Notification.objects.create(
+                recipient=self.recipient, actor=self.actor, verb=f'did thing {i}', target=self.actor
+            )
+
+    def test_notifications_are_keyset_paginated(self):
+        self.notify(12)
+        response = self.client.get('/api/notifications/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertNotIn('count', response.data)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_ordering_by_a_relation_keeps_the_default_cursor(self):
+        self.notify(12)
+        response = self.client.get('/api/notifications/', {'ordering': 'actor'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/notifications/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), response.data['results']
+
+    def add_mixed_targets(self, count, with_summary):
+        # Rows created outside the delivery queue, with or without a stored summary
+        start = Post.objects.count()
+        for i in range(start, start + count):
+            post = Post.objects.create(author=self.recipient, title=f'Post {i}', content='Body')
+            comment = Comment.objects.create(post=post, author=self.actor, content=f'Comment {i}')
+            for verb, target in [('liked your post', post), ('commented', comment), ('followed', self.actor)]:
+                Notification.objects.create(
+                    recipient=self.recipient, actor=self.actor, verb=f'{verb} {i}', target=target,
+                    target_summary=describe_target(target) if with_summary else '',
+                )
+
+    def test_stored_summaries_need_no_target_queries(self):
+        self.add_mixed_targets(1, with_summary=True)
+        small, _ = self.count_list_queries()
+        self.add_mixed_targets(3, with_summary=True)
+        large, results = self.count_list_queries()
+        self.assertEqual(small, large)
+        self.assertIn('Post: Post 3', [item['target'] for item in results])
+
+    def test_missing_summaries_resolve_per_content_type(self):
+        self.add_mixed_targets(1, with_summary=False)
+        small, _ = self.count_list_queries()
+        self.add_mixed_targets(3, with_summary=False)
+        large, results = self.count_list_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(
+            {item['target'] for item in results if item['verb'].endswith(' 3')},
+            {'Post: Post 3', 'Comment: Comment 3...', 'actor'},
+        )
+
+
+LOCAL_QUEUE = {'BACKEND': 'local', 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': None}
+OUTBOX_QUEUE = {'BACKEND': 'outbox', 'BATCH_SIZE': 2, 'FLUSH_INTERVAL': None}
+SYNC_QUEUE = {'BACKEND': 'sync', 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': None}
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, NOTIFICATION_QUEUE=LOCAL_QUEUE)
+class NotificationDeliveryTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='author', password='testpass123')
+        self.fan = get_user_model().objects.create_user(username='fan', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Hello', content='World')
+        self.client.force_authenticate(user=self.fan)
+        # Start every test with a fresh queue and metrics
+        delivery.reset_queue(setting='NOTIFICATION_QUEUE')
+
+    def request(self, method, url, data=None):
+        # Notifications are handed to the queue when the request's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url, data)
+
+    def test_notifications_are_written_on_flush(self):
+        self.request('post', f'/api/posts/{self.post.id}/like/')
+        self.request('post', '/api/comments/', {'post': self.post.id, 'content': 'Nice'})
+        self.assertEqual(Notification.objects.count(), 0)
+        self.assertEqual(delivery.stats()['depth'], 2)
+
+        self.assertEqual(delivery.flush(), 2)
+        self.assertEqual(
+            set(Notification.objects.values_list('verb', flat=True)),
+            {'liked your post', 'commented on your post'},
+        )
+        stats = delivery.stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['flushes'], 1)
+
+    def test_like_toggles_collapse_to_one_notification(self):
+        self.request('post', f'/api/posts/{self.post.id}/like/')
+        self.request('delete', f'/api/posts/{self.post.id}/unlike/')
+        self.request('post', f'/api/posts/{self.post.id}/like/')
+        self.request('delete', f'/api/posts/{self.post.id}/unlike/')
+        self.request('post', f'/api/posts/{self.post.id}/like/')
+
+        self.assertEqual(delivery.flush(), 1)
+        self.assertEqual(Notification.objects.get().verb, 'liked your post')
+        self.assertEqual(delivery.stats()['collapsed'], 4)
+
+    def test_follow_then_unfollow_sends_nothing(self):
+        self.request('post', f'/api/follow/{self.author.id}/')
+        self.request('post', f'/api/unfollow/{self.author.id}/')
+        self.assertEqual(delivery.flush(), 0)
+
+    @override_settings(NOTIFICATION_QUEUE=OUTBOX_QUEUE)
+    def test_outbox_is_drained_in_batches(self):
+        self.request('post', f'/api/posts/{self.post.id}/like/')
+        self.request('post', '/api/comments/', {'post': self.post.id, 'content': 'One'})
+        self.request('post', '/api/comments/', {'post': self.post.id, 'content': 'Two'})
+        self.assertEqual(NotificationOutbox.objects.count(), 3)
+
+        call_command('flush_notifications', stdout=StringIO())
+        self.assertEqual(NotificationOutbox.objects.count(), 0)
+        # Both comments land on the same aggregated row even though they were flushed separately
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertEqual(delivery.stats()['flushes'], 2)
+
+    @override_settings(NOTIFICATION_QUEUE=SYNC_QUEUE)
+    def test_sync_backend_writes_immediately(self):
+        self.request('post', f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(Notification.objects.count(), 1)
+
+    def test_queue_stats_are_admin_only(self):
+        response = self.client.get('/api/notifications/queue/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = get_user_model().objects.create_user(username='admin', password='testpass123', is_staff=True)
+        self.client.force_authenticate(user=admin)
+        response = self.client.get('/api/notifications/queue/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['backend'], 'local')
+        self.assertIn('avg_flush_ms', response.data)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class NotificationAggregationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='author', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Popular', content='Everyone likes it')
+        delivery.reset_queue(setting='NOTIFICATION_QUEUE')
+
+    def like_as(self, username):
+        user, _ = get_user_model().objects.get_or_create(username=username)
+        self.client.force_authenticate(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{self.post.id}/like/')
+        return user
+
+    def test_likes_aggregate_into_one_row(self):
+        for name in ['alice', 'bob', 'carol', 'dave']:
+            self.like_as(name)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual([actor['username'] for actor in notification.recent_actors], ['dave', 'carol', 'bob'])
+
+        self.client.force_authenticate(user=self.author)
+        response = self.client.get('/api/notifications/')
+        item = response.data['results'][0]
+        self.assertEqual(item['summary'], 'dave and 3 others liked your post')
+        self.assertEqual(item['recent_actors'], ['dave', 'carol', 'bob'])
+        self.assertEqual(item['target'], 'Post: Popular')
+        self.assertEqual(Notification.objects.get().target_summary, 'Post: Popular')
+
+    def test_repeat_actor_is_not_recounted(self):
+        alice = self.like_as('alice')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        self.like_as('alice')
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(notification.actor, alice)
+
+    def unlike_as(self, user):
+        self.client.force_authenticate(user=user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+
+    def test_unlike_withdraws_a_delivered_like(self):
+        alice = self.like_as('alice')
+        bob = self.like_as('bob')
+        self.unlike_as(bob)
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(notification.actor, alice)
+        self.assertEqual([actor['username'] for actor in notification.recent_actors], ['alice'])
+
+        self.unlike_as(alice)
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(NotificationActor.objects.exists())
+
+    def test_withdrawn_recent_actor_is_replaced(self):
+        for name in ['alice', 'bob', 'carol', 'dave']:
+            self.like_as(name)
+        self.unlike_as(get_user_model().objects.get(username='dave'))
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 3)
+        self.assertEqual([actor['username'] for actor in notification.recent_actors], ['carol', 'bob', 'alice'])
+        self.assertEqual(notification.actor.username, 'carol')
+
+    @override_settings(NOTIFICATION_QUEUE=LOCAL_QUEUE)
+    def test_toggles_across_flushes_count_each_actor_once(self):
+        likers = [self.like_as(name) for name in ['alice', 'bob', 'carol', 'dave']]
+        delivery.flush()
+        for user in likers:
+            self.unlike_as(user)
+            self.like_as(user.username)
+            delivery.flush()
+
+        notification = Notification.objects.get()
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(NotificationActor.objects.filter(notification=notification).count(), 4)
+
+    def test_new_activity_marks_row_unread(self):
+        self.like_as('alice')
+        Notification.objects.update(read=True)
+        self.like_as('bob')
+
+        notification = Notification.objects.get()
+        self.assertFalse(notification.read)
+        self.assertEqual(notification.actor_count, 2)
+
+    def test_follows_aggregate_on_followed_user(self):
+        for name in ['alice', 'bob']:
+            follower = get_user_model().objects.create_user(username=name, password='testpass123')
+            self.client.force_authenticate(user=follower)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(f'/api/follow/{self.author.id}/')
+
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.verb, 'started following you')
+        self.assertEqual(notification.actor_count, 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MarkNotificationsReadTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.recipient = get_user_model().objects.create_user(username='recipient', password='testpass123')
+        self.actor = get_user_model().objects.create_user(username='actor', password='testpass123')
+        self.other = get_user_model().objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(user=self.recipient)
+        self.notifications = [
+            Notification.objects.create(
+                recipient=self.recipient, actor=self.actor, verb=f'did thing {i}', target=self.actor
+            )
+            for i in range(5)
+        ]
+        self.foreign = Notification.objects.create(
+            recipient=self.other, actor=self.actor, verb='did thing', target=self.actor
+        )
+
+    def unread_count(self):
+        response = self.client.get('/api/notifications/unread-count/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['unread_count']
+
+    def test_mark_ids_read_in_one_update(self):
+        ids = [self.notifications[0].id, self.notifications[1].id, self.foreign.id]
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/notifications/read/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Other users' notifications are never touched
+        self.assertEqual(response.data['marked_read'], 2)
+        self.assertFalse(Notification.objects.get(pk=self.foreign.id).read)
+        self.assertEqual(self.unread_count(), 3)
+
+    def test_mark_all_before_timestamp(self):
+        cutoff = timezone.now()
+        Notification.objects.filter(pk=self.notifications[4].pk).update(timestamp=cutoff + timedelta(minutes=1))
+
+        response = self.client.post('/api/notifications/read/', {'before': cutoff.isoformat()}, format='json')
+        self.assertEqual(response.data['marked_read'], 4)
+        self.assertEqual(self.unread_count(), 1)
+
+    def test_requires_exactly_one_selector(self):
+        response = self.client.post('/api/notifications/read/', {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            '/api/notifications/read/', {'ids': [1], 'before': timezone.now().isoformat()}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_single_mark_read(self):
+        response = self.client.post(f'/api/notifications/{self.notifications[0].id}/read/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.unread_count(), 4)
+
+        response = self.client.post(f'/api/notifications/{self.foreign.id}/read/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, REALTIME_BROKER='notifications.realtime.InMemoryBroker')
+class RealtimeStreamTestCase(TestCase):
+    def setUp(self):
+        delivery.reset_queue(setting='NOTIFICATION_QUEUE')
+        realtime.reset_broker(setting='REALTIME_BROKER')
+        self.author = get_user_model().objects.create_user(username='author', password='testpass123')
+        self.fan = get_user_model().objects.create_user(username='fan', password='testpass123')
+        self.fan.following.add(self.author)
+        self.token = Token.objects.create(user=self.fan)
+
+    async def open_stream(self, **kwargs):
+        response = await self.async_client.get('/api/stream/', **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b': connected\n\n')
+        return stream
+
+    async def next_event(self, stream):
+        frame = (await asyncio.wait_for(anext(stream), timeout=5)).decode()
+        event, data = frame.strip().split('\n')
+        return event[len('event: '):], json.loads(data[len('data: '):])
+
+    async def test_requires_token(self):
+        response = await self.async_client.get('/api/stream/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get('/api/stream/?token=wrong')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_delivered_notification_is_pushed(self):
+        stream = await self.open_stream(headers={'authorization': f'Token {self.token.key}'})
+        post = await Post.objects.acreate(author=self.fan, title='Mine', content='Body')
+
+
+        def deliver():
+            # Written from a worker thread, as the queue backends do
+            with self.captureOnCommitCallbacks(execute=True):
+                delivery.get_queue().write([delivery.NotificationEvent(
+                    self.fan.pk, self.author.pk, 'liked your post',
+                    ContentType.objects.get_for_model(Post).pk, post.pk, describe_target(post), False,
+                )])
+
+        await sync_to_async(deliver)()
+
+        event, data = await self.next_event(stream)
+        self.assertEqual(event, 'notification')
+        self.assertEqual(data['target'], 'Post: Mine')
+        self.assertEqual(data['recent_actors'], ['author'])
+        stats = realtime.get_broker().stats()
+        self.assertEqual((stats['connections'], stats['delivered']), (1, 1))
+
+    async def test_new_post_is_pushed_to_connected_followers(self):
+        stream = await self.open_stream(data={'token': self.token.key})
+        post = await Post.objects.acreate(author=self.author, title='Fresh', content='Body')
+        await sync_to_async(realtime.publish_feed_item)(post)
+
+        event, data = await self.next_event(stream)
+        self.assertEqual(event, 'feed')
+        self.assertEqual((data['id'], data['author']), (post.pk, 'author'))
+
+    def test_slow_consumer_drops_instead_of_buffering(self):
+        async def flood():
+            broker = realtime.get_broker()
+            subscription = broker.subscribe(self.fan.pk)
+            for i in range(realtime.SUBSCRIBER_QUEUE_SIZE + 5):
+                broker.publish(self.fan.pk, 'feed', {'id': i})
+            await asyncio.sleep(0)
+            broker.unsubscribe(subscription)
+            return subscription.queue.qsize(), broker.stats()
+
+        depth, stats = asyncio.run(flood())
+        self.assertEqual(depth, realtime.SUBSCRIBER_QUEUE_SIZE)
+        self.assertEqual((stats['dropped'], stats['connections']), (5, 0))
+
+    def test_stats_are_staff_only(self):
+        response = self.client.get('/api/stream/stats/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.fan.is_staff = True
+        self.fan.save()
+        response = self.client.get('/api/stream/stats/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('max_fanout_ms', response.json())
+
+
+@override_settings(REALTIME_REDIS_URL='redis://redis.test:6379/0')
+class RedisBrokerTestCase(SimpleTestCase):
+    def setUp(self):
+        # redis-py is replaced wholesale, so these tests run without the package or a server
+        self.redis_module = mock.MagicMock()
+        for patcher in [
+            mock.patch.dict(sys.modules, {'redis': self.redis_module}),
+            mock.patch.object(realtime.RedisBroker, 'ensure_listener'),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.broker = realtime.RedisBroker()
+        self.redis = self.redis_module.Redis.from_url.return_value
+        self.pubsub = self.redis.pubsub.return_value
+        self.pubsub.get_message.return_value = None
+
+    def test_connects_to_the_configured_url(self):
+        self.redis_module.Redis.from_url.assert_called_once_with('redis://redis.test:6379/0')
+
+    def test_channels_follow_the_first_and_last_connection_of_a_user(self):
+        async def connect_twice():
+            first = self.broker.subscribe(7)
+            second = self.broker.subscribe(7)
+            self.broker.relay()
+            self.broker.unsubscribe(first)
+            self.broker.relay()
+            self.assertEqual(self.pubsub.unsubscribe.call_count, 0)
+            self.broker.unsubscribe(second)
+            self.broker.relay()
+
+        asyncio.run(connect_twice())
+        self.pubsub.subscribe.assert_called_with('realtime:user:7')
+        self.pubsub.unsubscribe.assert_called_once_with('realtime:user:7')
+        self.assertEqual(self.broker.stats()['connections'], 0)
+
+    def test_publish_goes_through_redis(self):
+        self.broker.publish(7, 'feed', {'id': 1})
+        self.redis.publish.assert_called_once_with('realtime:user:7', json.dumps({'event': 'feed', 'data': {'id': 1}}))
+
+    def test_relayed_messages_reach_local_connections(self):
+        async def receive():
+            subscription = self.broker.subscribe(7)
+            self.pubsub.get_message.return_value = {
+                'type': 'message',
+                'channel': b'realtime:user:7',
+                'data': json.dumps({'event': 'notification', 'data': {'id': 3}}).encode(),
+            }
+            self.broker.relay()
+            message = await asyncio.wait_for(subscription.queue.get(), timeout=5)
+            self.broker.unsubscribe(subscription)
+            return message
+
+        message = asyncio.run(receive())
+        self.assertEqual((message['event'], message['data']), ('notification', {'id': 3}))
+        self.assertEqual(self.broker.stats()['published'], 1)
+
+    def test_connected_users_come_from_every_process(self):
+        self.redis.pubsub_channels.return_value = [b'realtime:user:7', b'realtime:user:12']
+        self.assertEqual(self.broker.connected_user_ids(), {7, 12})
+        self.redis.pubsub_channels.assert_called_once_with('realtime:user:*')
 
-# Create your tests here.
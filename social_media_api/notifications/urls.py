@@ -1,7 +1,12 @@
 from django.urls import path
-from . import views
+from . import streams, views
 
 urlpatterns = [
     path('notifications/', views.NotificationListView.as_view(), name='notifications'),
+    path('notifications/read/', views.mark_notifications_read, name='mark_notifications_read'),
+    path('notifications/unread-count/', views.unread_notification_count, name='unread_notification_count'),
+    path('notifications/queue/', views.notification_queue_stats, name='notification_queue_stats'),
     path('notifications/<int:pk>/read/', views.mark_notification_read, name='mark_notification_read'),
+    path('stream/', streams.stream, name='stream'),
+    path('stream/stats/', streams.stream_stats, name='stream_stats'),
 ]
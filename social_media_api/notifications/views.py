@@ -3,26 +3,57 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Notification
-from .serializers import NotificationSerializer
+from .serializers import NotificationSerializer, MarkNotificationsReadSerializer
+from . import delivery
 
 
 class NotificationListView(generics.ListAPIView):
     """List user notifications"""
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Only indexed columns; ?ordering= on anything else keeps the default
+    ordering_fields = ['timestamp']
+    ordering = ['-timestamp']
 
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('actor')
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def mark_notification_read(request, pk):
     """Mark a notification as read"""
-    try:
-        notification = Notification.objects.get(pk=pk, recipient=request.user)
-        notification.read = True
-        notification.save()
-        return Response({'message': 'Notification marked as read'}, status=status.HTTP_200_OK)
-    except Notification.DoesNotExist:
+    updated = Notification.objects.filter(pk=pk, recipient=request.user).update(read=True)
+    if not updated:
         return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({'message': 'Notification marked as read'}, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def mark_notifications_read(request):
+    """Mark a list of notifications, or all notifications up to a timestamp, as read in one UPDATE"""
+    serializer = MarkNotificationsReadSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    queryset = Notification.objects.filter(recipient=request.user, read=False)
+    if 'ids' in serializer.validated_data:
+        queryset = queryset.filter(pk__in=serializer.validated_data['ids'])
+    else:
+        queryset = queryset.filter(timestamp__lte=serializer.validated_data['before'])
+    updated = queryset.update(read=True)
+    return Response({'marked_read': updated}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def unread_notification_count(request):
+    """Number of unread notifications, answered from the partial unread index"""
+    count = Notification.objects.filter(recipient=request.user, read=False).count()
+    return Response({'unread_count': count}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def notification_queue_stats(request):
+    """Queue depth and flush latency of the notification delivery pipeline"""
+    return Response(delivery.stats(), status=status.HTTP_200_OK)
@@ -0,0 +1,62 @@
+"""Idempotent like/unlike writes that keep Post.likes_count in step with the likes table."""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+from social_media_api import response_cache
+from .models import Like, Post
+
+LIKE_TABLE = Like._meta.db_table
+POST_TABLE = Post._meta.db_table
+# Columns the views need back: the author to notify and the title for the notification text
+RETURNING = ['id', 'author_id', 'title']
+
+INSERT_LIKE = (
+    f'INSERT INTO {LIKE_TABLE} (user_id, post_id, created_at) '
+    f'SELECT %s, id, %s FROM {POST_TABLE} WHERE id = %s '
+    f'ON CONFLICT (user_id, post_id) DO NOTHING RETURNING post_id'
+)
+DELETE_LIKE = f'DELETE FROM {LIKE_TABLE} WHERE user_id = %s AND post_id = %s RETURNING post_id'
+ADJUST_COUNT = (
+    f'UPDATE {POST_TABLE} SET likes_count = likes_count + %s WHERE id = %s '
+    f'RETURNING {", ".join(RETURNING)}'
+)
+ADJUST_COUNT_FROM_CTE = (
+    f'WITH changed AS ({{}}) '
+    f'UPDATE {POST_TABLE} SET likes_count = likes_count + %s FROM changed '
+    f'WHERE {POST_TABLE}.id = changed.post_id '
+    f'RETURNING {", ".join(f"{POST_TABLE}.{column}" for column in RETURNING)}'
+)
+
+
+def _write(statement, params, delta):
+    """Run a like insert/delete and its counter update; returns the changed post or None"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(ADJUST_COUNT_FROM_CTE.format(statement), [*params, delta])
+            row = cursor.fetchone()
+        else:
+            cursor.execute(statement, params)
+            changed = cursor.fetchone()
+            row = None
+            if changed is not None:
+                cursor.execute(ADJUST_COUNT, [delta, changed[0]])
+                row = cursor.fetchone()
+    if row is None:
+        return None
+    # Raw SQL sends no signals, so invalidate the cached post detail here
+    response_cache.bump('post', row[0])
+    post = Post.from_db(connection.alias, RETURNING, row)
+    # Notifications only need the author's id; other columns load lazily if touched
+    post.author = get_user_model().from_db(connection.alias, ['id'], [post.author_id])
+    return post
+
+
+def like(user, post_id):
+    """Make `user` like the post; returns it (id, author_id and title only) or None if nothing changed"""
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    return _write(INSERT_LIKE, [user.pk, now, post_id], 1)
+
+
+def unlike(user, post_id):
+    """Remove `user`'s like of the post; returns it (id, author_id and title only) or None if there was none"""
+    return _write(DELETE_LIKE, [user.pk, post_id], -1)
@@ -0,0 +1,80 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from posts.models import Post
+from posts.search import rebuild_index, search_keys
+
+VOCABULARY_SIZE = 20000
+# Every generated post contains this word, so ranking it has to score the whole corpus
+COMMON_WORD = 'everywhere'
+
+
+def build_vocabulary(rng):
+    """Random pseudo-words so that, as in real text, most search terms are selective"""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choices(letters, k=rng.randint(4, 9))) for _ in range(VOCABULARY_SIZE)]
+
+
+class Command(BaseCommand):
+    help = 'Compare icontains search against the full-text index on a generated corpus (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000, help='Number of posts to generate')
+        parser.add_argument('--queries', type=int, default=20, help='Number of search terms to time')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        vocabulary = build_vocabulary(rng)
+        # Corpus words stop a LIKE scan early; absent words force it through every row,
+        # and the common word makes the index rank every post
+        term_sets = {
+            'present': [rng.choice(vocabulary) for _ in range(options['queries'])],
+            'common': [COMMON_WORD] * options['queries'],
+            'absent': [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=12)) for _ in range(options['queries'])],
+        }
+
+        # Everything happens in one transaction that is rolled back, leaving the database untouched
+        with transaction.atomic():
+            self.generate(options['posts'], options['batch_size'], rng, vocabulary)
+            started = time.perf_counter()
+            rebuild_index()
+            self.stdout.write(f'Indexed {options["posts"]} posts in {time.perf_counter() - started:.2f}s')
+
+            for label, terms in term_sets.items():
+                legacy = self.time_queries(terms, lambda term: Post.objects.filter(
+                    Q(title__icontains=term) | Q(content__icontains=term)
+                ).order_by('-created_at'))
+                # What PostViewSet.list runs for a ranked first page
+                indexed = self.time_queries(terms, lambda term: Post.objects.filter(
+                    pk__in=[pk for _, pk in search_keys(Post.objects.all(), term, 11)]
+                ))
+                self.stdout.write(f'{label} terms - icontains: {legacy * 1000:.1f} ms/query, '
+                                  f'full-text: {indexed * 1000:.1f} ms/query')
+            transaction.set_rollback(True)
+
+    def generate(self, total, batch_size, rng, vocabulary):
+        author, _ = get_user_model().objects.get_or_create(username='search_benchmark')
+        created = 0
+        while created < total:
+            size = min(batch_size, total - created)
+            Post.objects.bulk_create([
+                Post(
+                    author=author,
+                    title=' '.join(rng.choices(vocabulary, k=6)),
+                    content=' '.join(rng.choices(vocabulary, k=59) + [COMMON_WORD]),
+                )
+                for _ in range(size)
+            ])
+            created += size
+
+    def time_queries(self, terms, build_queryset):
+        # First page of results, as the API would serve it
+        started = time.perf_counter()
+        for term in terms:
+            list(build_queryset(term)[:10])
+        return (time.perf_counter() - started) / len(terms)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from posts.models import Post, Comment, Like
+from social_media_api import response_cache
+
+
+def _count_subquery(model):
+    """Correlated COUNT(*) of `model` rows pointing at the outer post"""
+    counts = (
+        model.objects.filter(post=OuterRef('pk'))
+        .order_by()
+        .values('post')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized like and comment counters on posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of posts updated per UPDATE statement',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        post_ids = Post.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        updated = 0
+
+        while True:
+            batch = list(post_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            updated += Post.objects.filter(pk__in=batch).update(
+                likes_count=_count_subquery(Like),
+                comments_count=_count_subquery(Comment),
+            )
+            response_cache.bump('post', *batch)
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} posts'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from posts.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all posts'
+
+    def handle(self, *args, **options):
+        rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
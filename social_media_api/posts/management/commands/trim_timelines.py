@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from accounts.models import CustomUser
+from posts.timeline import trim_timelines
+
+
+class Command(BaseCommand):
+    help = 'Cut every home timeline down to its newest FEED_TIMELINE_MAX_ENTRIES entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of users checked per query',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        user_ids = CustomUser.objects.order_by('pk').values_list('pk', flat=True)
+        last_id = 0
+        deleted = 0
+
+        while True:
+            batch = list(user_ids.filter(pk__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            deleted += trim_timelines(batch)
+            last_id = batch[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} timeline entries'))
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+FTS_TABLE = 'posts_post_fts'
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(content, '')), 'B')"
+)
+
+
+def create_search_index(apps, schema_editor):
+    """Create the backend-specific full-text index and fill it from existing posts"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE posts_post ADD COLUMN search_vector tsvector')
+        schema_editor.execute(
+            'CREATE INDEX posts_post_search_vector_idx ON posts_post USING gin (search_vector)'
+        )
+        schema_editor.execute(f'UPDATE posts_post SET search_vector = {POSTGRES_VECTOR}')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, content)')
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content) SELECT id, title, content FROM posts_post'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('ALTER TABLE posts_post DROP COLUMN search_vector')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
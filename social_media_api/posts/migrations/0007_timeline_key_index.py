@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 08:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0006_post_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='timelineentry',
+            options={'ordering': ['-created_at', '-post_id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='timelineentry',
+            name='posts_timeline_user_idx',
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-created_at', '-post'], name='posts_timeline_user_key_idx'),
+        ),
+    ]
@@ -9,9 +9,17 @@ class Post(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters kept current by the like/unlike and comment views
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-created_at']
+        # Back keyset pagination on (created_at, id) for the global list and per-author feeds
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='posts_post_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='posts_post_author_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} by {self.author.username}"
@@ -27,6 +35,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='posts_comment_created_idx'),
+            models.Index(fields=['post', '-created_at', '-id'], name='posts_comment_post_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
@@ -44,3 +56,20 @@ class Like(models.Model):
 
     def __str__(self):
         return f"{self.user.username} likes {self.post.title}"
+
+
+class TimelineEntry(models.Model):
+    """Materialized home timeline row: `post` appears in `user`'s feed"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    created_at = models.DateTimeField()  # Copy of post.created_at so the feed sorts without a join
+
+    class Meta:
+        unique_together = ('user', 'post')
+        ordering = ['-created_at', '-post_id']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='posts_timeline_user_key_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post.title} in {self.user.username}'s timeline"
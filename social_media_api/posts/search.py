@@ -0,0 +1,131 @@
+"""Full-text search over post titles and content (PostgreSQL tsvector or SQLite FTS5, created by migration 0006)."""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'posts_post_fts'
+SEARCH_CONFIG = 'english'
+# Title matches weigh twice as much as content matches
+TITLE_WEIGHT = 2.0
+CONTENT_WEIGHT = 1.0
+
+RANK_FUNCTION = f'bm25({TITLE_WEIGHT}, {CONTENT_WEIGHT})'
+TSQUERY = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+
+POSTGRES_VECTOR = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(content, '')), 'B')"
+)
+
+
+def _fts_expression(query):
+    """Quote each word as an FTS5 prefix term so user input cannot inject query syntax"""
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def index_post(post):
+    """Add or refresh a post's search index entry"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'UPDATE posts_post SET search_vector = {POSTGRES_VECTOR} WHERE id = %s', [post.pk])
+        elif connection.vendor == 'sqlite':
+            cursor.execute(
+                f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+                [post.pk, post.title, post.content],
+            )
+
+
+def remove_post(post_id):
+    """Drop a deleted post from the search index"""
+    # On PostgreSQL the vector lives on the deleted row itself
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index():
+    """Recompute the search index for every post"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'UPDATE posts_post SET search_vector = {POSTGRES_VECTOR}')
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, content) SELECT id, title, content FROM posts_post'
+            )
+
+
+def search_posts(queryset, query):
+    """
+    Restrict `queryset` to posts matching `query`, without ranking them; see
+    search_keys for relevance order. Backends without an index fall back to icontains.
+    """
+    if connection.vendor == 'postgresql':
+        return queryset.filter(pk__in=RawSQL(f'SELECT id FROM posts_post WHERE search_vector @@ {TSQUERY}', [query]))
+
+    if connection.vendor == 'sqlite':
+        expression = _fts_expression(query)
+        if not expression:
+            return queryset.none()
+        matches = RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+        return queryset.filter(pk__in=matches)
+
+    return queryset.filter(Q(title__icontains=query) | Q(content__icontains=query))
+
+
+def search_keys(queryset, query, limit, after=None):
+    """
+    Up to `limit` (rank, post id) keys of the posts in `queryset` matching `query`,
+    most relevant first and following the `after` key. A higher rank is more relevant.
+    """
+    if connection.vendor == 'postgresql':
+        rank = RawSQL(f'ts_rank("posts_post"."search_vector", {TSQUERY})', [query], output_field=FloatField())
+        ranked = search_posts(queryset, query).annotate(search_rank=rank)
+        if after is not None:
+            value, pk = after
+            ranked = ranked.filter(Q(search_rank__lt=value) | Q(search_rank=value, pk__lt=pk))
+        return list(ranked.order_by('-search_rank', '-pk').values_list('search_rank', 'pk')[:limit])
+
+    if connection.vendor == 'sqlite':
+        expression = _fts_expression(query)
+        if not expression:
+            return []
+        keys = []
+        batch_size = limit
+        # Keys come from the FTS table alone; posts outside `queryset` are dropped a batch at a time
+        while len(keys) < limit:
+            batch = _fts_keys(expression, batch_size, after)
+            if queryset.query.has_filters():
+                visible = set(queryset.filter(pk__in=[pk for _, pk in batch]).values_list('pk', flat=True))
+                keys.extend(key for key in batch if key[1] in visible)
+            else:
+                keys.extend(batch)
+            if len(batch) < batch_size:
+                break
+            after = batch[-1]
+            batch_size *= 2
+        return keys[:limit]
+
+    matches = search_posts(queryset, query)
+    if after is not None:
+        matches = matches.filter(pk__lt=after[1])
+    return [(0.0, pk) for pk in matches.order_by('-pk').values_list('pk', flat=True)[:limit]]
+
+
+def _fts_keys(expression, limit, after):
+    """
+    One FTS5 statement ranks every match and returns the next `limit` keys. FTS5
+    ranks with bm25(), which is lower-is-better, so keys carry it negated.
+    """
+    sql = f"SELECT -rank, rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rank MATCH '{RANK_FUNCTION}'"
+    params = [expression]
+    if after is not None:
+        value, pk = after
+        sql += ' AND (rank > %s OR (rank = %s AND rowid < %s))'
+        params += [-value, -value, pk]
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} ORDER BY rank, rowid DESC LIMIT %s', params + [limit])
+        return cursor.fetchall()
@@ -1,6 +1,13 @@
 from rest_framework import serializers
 from .models import Post, Comment, Like
 
+# Number of comments embedded in each post of a list response
+RECENT_COMMENTS_LIMIT = 3
+# Number of newest comments and likes embedded in a post detail response; the rest are paged
+# through /api/posts/<id>/comments/ and /api/posts/<id>/likes/
+DETAIL_COMMENTS_LIMIT = 20
+DETAIL_LIKES_LIMIT = 20
+
 
 class CommentSerializer(serializers.ModelSerializer):
     """Serializer for comments"""
@@ -12,6 +19,12 @@ class CommentSerializer(serializers.ModelSerializer):
         fields = ['id', 'post', 'author', 'author_id', 'content', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at', 'author', 'author_id']
 
+    def validate_post(self, value):
+        # Moving a comment would leave both posts' comments_count wrong
+        if self.instance is not None and value.pk != self.instance.post_id:
+            raise serializers.ValidationError('A comment cannot be moved to another post.')
+        return value
+
 
 class LikeSerializer(serializers.ModelSerializer):
     """Serializer for likes"""
@@ -23,35 +36,76 @@ class LikeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'created_at']
 
 
+class PostListSerializer(serializers.ListSerializer):
+    """List serializer that resolves the viewer's likes for a whole page at once"""
+
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.context['liked_post_ids'] = set(
+                Like.objects.filter(
+                    user=request.user, post__in=[post.pk for post in posts]
+                ).values_list('post_id', flat=True)
+            )
+        return super().to_representation(posts)
+
+
 class PostSerializer(serializers.ModelSerializer):
-    """Serializer for posts with nested comments and likes"""
+    """Slim serializer for post lists with counts and the most recent comments"""
     author = serializers.StringRelatedField(read_only=True)
     author_id = serializers.ReadOnlyField(source='author.id')
-    comments = CommentSerializer(many=True, read_only=True)
-    likes = LikeSerializer(many=True, read_only=True)
-    comments_count = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
+    recent_comments = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
         fields = ['id', 'author', 'author_id', 'title', 'content', 'created_at', 
-                  'updated_at', 'comments', 'likes', 'comments_count', 'likes_count', 'is_liked']
-        read_only_fields = ['id', 'created_at', 'updated_at', 'author', 'author_id']
+                  'updated_at', 'recent_comments', 'comments_count', 'likes_count', 'is_liked']
+        read_only_fields = ['id', 'created_at', 'updated_at', 'author', 'author_id',
+                            'comments_count', 'likes_count']
+        list_serializer_class = PostListSerializer
 
-    def get_comments_count(self, obj):
-        return obj.comments.count()
-
-    def get_likes_count(self, obj):
-        return obj.likes.count()
+    def get_recent_comments(self, obj):
+        # Views prefetch a bounded slice into `recent_comments`; fall back to a query otherwise
+        comments = getattr(obj, 'recent_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('author')[:RECENT_COMMENTS_LIMIT]
+        return CommentSerializer(comments, many=True, context=self.context).data
 
     def get_is_liked(self, obj):
+        liked_post_ids = self.context.get('liked_post_ids')
+        if liked_post_ids is not None:
+            return obj.pk in liked_post_ids
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return obj.likes.filter(user=request.user).exists()
         return False
 
 
+class PostDetailSerializer(PostSerializer):
+    """Serializer for a single post with its newest comments and likes"""
+    comments = serializers.SerializerMethodField()
+    likes = serializers.SerializerMethodField()
+
+    class Meta(PostSerializer.Meta):
+        fields = ['id', 'author', 'author_id', 'title', 'content', 'created_at', 
+                  'updated_at', 'comments', 'likes', 'comments_count', 'likes_count', 'is_liked']
+
+    def get_comments(self, obj):
+        # Views prefetch a bounded slice into `detail_comments`; fall back to a query otherwise
+        comments = getattr(obj, 'detail_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('author').order_by('-created_at', '-id')[:DETAIL_COMMENTS_LIMIT]
+        return CommentSerializer(comments, many=True, context=self.context).data
+
+    def get_likes(self, obj):
+        likes = getattr(obj, 'detail_likes', None)
+        if likes is None:
+            likes = obj.likes.select_related('user').order_by('-created_at', '-id')[:DETAIL_LIKES_LIMIT]
+        return LikeSerializer(likes, many=True, context=self.context).data
+
+
 class PostCreateUpdateSerializer(serializers.ModelSerializer):
     """Serializer for creating and updating posts"""
     
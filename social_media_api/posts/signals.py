@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from social_media_api import response_cache
+from .models import Comment, Like, Post
+from . import search
+
+
+@receiver(post_save, sender=Post)
+def index_post_on_save(sender, instance, **kwargs):
+    """Keep the full-text index in step with post edits"""
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_on_delete(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_responses(sender, instance, **kwargs):
+    response_cache.bump('post', instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Like)
+def invalidate_parent_post_responses(sender, instance, **kwargs):
+    """Comments and likes are embedded in the post detail response"""
+    response_cache.bump('post', instance.post_id)
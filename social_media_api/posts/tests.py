@@ -1,3 +1,680 @@
-from django.test import TestCase
+import threading
+import time
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from notifications import delivery
+from notifications.models import Notification
+from social_media_api import idempotency, response_cache
+from social_media_api.pagination import KeysetPagination
+from .models import Post, Comment, Like, TimelineEntry
+from .serializers import DETAIL_COMMENTS_LIMIT, RECENT_COMMENTS_LIMIT
+from .timeline import fanout_post
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PostCounterTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='author', password='testpass123')
+        self.reader = get_user_model().objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Hello', content='World')
+        self.client.force_authenticate(user=self.reader)
+
+    def test_like_and_unlike_update_counter(self):
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        # A repeated like must not bump the counter again
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        response = self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_comment_create_and_delete_update_counter(self):
+        response = self.client.post('/api/comments/', {'post': self.post.id, 'content': 'Nice'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+        response = self.client.delete(f"/api/comments/{response.data['id']}/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_comment_cannot_move_to_another_post(self):
+        other = Post.objects.create(author=self.author, title='Other', content='Post')
+        response = self.client.post('/api/comments/', {'post': self.post.id, 'content': 'Nice'})
+        url = f"/api/comments/{response.data['id']}/"
+
+        response = self.client.patch(url, {'post': other.id})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(url, {'post': self.post.id, 'content': 'Edited'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.post.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.post.comments_count, other.comments_count), (1, 0))
+        self.assertEqual(Comment.objects.get().post_id, self.post.id)
+
+    def test_rebuild_command_repairs_drift(self):
+        Like.objects.create(user=self.reader, post=self.post)
+        Comment.objects.create(post=self.post, author=self.reader, content='Drifted')
+        Post.objects.filter(pk=self.post.pk).update(likes_count=42, comments_count=7)
+
+        call_command('rebuild_post_counters', batch_size=1, stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(self.post.comments_count, 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class LikeWriteTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='author', password='testpass123')
+        self.reader = get_user_model().objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Hello', content='World')
+        self.client.force_authenticate(user=self.reader)
+
+    def like(self, **headers):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/posts/{self.post.id}/like/', headers=headers)
+
+    def test_like_and_unlike_notify_the_author(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # Savepoint, like insert, counter update, release; the notification is written after commit
+            with self.assertNumQueries(4):
+                response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual((notification.actor, notification.target), (self.reader, self.post))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Like.objects.exists())
+
+    def test_repeats_and_missing_posts(self):
+        self.like()
+        response = self.like()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['message'], 'You already liked this post')
+        self.assertEqual(self.client.post('/api/posts/999/like/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.delete('/api/posts/999/unlike/').status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        response = self.client.delete(f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_idempotency_key_replays_the_first_response(self):
+        first = self.like(idempotency_key='tap-1')
+        replay = self.like(idempotency_key='tap-1')
+        self.assertEqual(replay.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(Notification.objects.count(), 1)
+
+        # A new key runs the view again
+        self.assertEqual(self.like(idempotency_key='tap-2').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_idempotency_keys_are_scoped_to_the_user(self):
+        self.like(idempotency_key='tap')
+        self.client.force_authenticate(user=self.author)
+        response = self.like(idempotency_key='tap')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 2)
+
+    def test_key_in_progress_conflicts(self):
+        request = APIClient().request().wsgi_request
+        request.user = self.reader
+        request.method = 'POST'
+        request.path = f'/api/posts/{self.post.id}/like/'
+        cache.add(f"{idempotency.cache_key(request, 'tap')}:lock", True)
+        self.assertEqual(self.like(idempotency_key='tap').status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(Like.objects.exists())
+
+
+# Notifications are queued and flushed once afterwards so the taps only contend on the like itself
+@override_settings(
+    SECURE_SSL_REDIRECT=False, NOTIFICATION_QUEUE={'BACKEND': 'local', 'BATCH_SIZE': 100, 'FLUSH_INTERVAL': None}
+)
+class LikeConcurrencyTestCase(TransactionTestCase):
+    THREADS = 8
+    TAPS = 5
+
+    def setUp(self):
+        author = get_user_model().objects.create_user(username='author', password='testpass123')
+        self.users = [
+            get_user_model().objects.create_user(username=f'user{i}', password='testpass123')
+            for i in range(self.THREADS)
+        ]
+        self.post = Post.objects.create(author=author, title='Hello', content='World')
+
+    def hammer(self, method, path):
+        """Every user sends TAPS requests at once from their own thread; returns the status codes"""
+        return self.race([(user, method, path) for user in self.users])
+
+    def race(self, taps):
+        """Each (user, method, path) is sent TAPS times from its own thread, all starting at once"""
+        barrier = threading.Barrier(len(taps))
+        codes = []
+
+        def tap(user, method, path):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            barrier.wait()
+            try:
+                for _ in range(self.TAPS):
+                    codes.append(getattr(client, method)(path).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=tap, args=args) for args in taps]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return codes
+
+    def test_concurrent_taps_keep_the_counter_exact(self):
+        codes = self.hammer('post', f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), self.THREADS)
+        self.assertEqual(codes.count(status.HTTP_400_BAD_REQUEST), self.THREADS * (self.TAPS - 1))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, self.THREADS)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), self.THREADS)
+        delivery.flush()
+        self.assertEqual(Notification.objects.filter(recipient=self.post.author).count(), 1)
+
+        codes = self.hammer('delete', f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual(codes.count(status.HTTP_200_OK), self.THREADS)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+        self.assertFalse(Like.objects.exists())
+        delivery.flush()
+
+    def test_one_user_double_tapping_keeps_the_counter_exact(self):
+        user = self.users[0]
+        like, unlike = f'/api/posts/{self.post.id}/like/', f'/api/posts/{self.post.id}/unlike/'
+
+        codes = self.race([(user, 'post', like)] * self.THREADS)
+        self.assertEqual(codes.count(status.HTTP_201_CREATED), 1)
+        self.assertEqual(codes.count(status.HTTP_400_BAD_REQUEST), self.THREADS * self.TAPS - 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+
+        codes = self.race([(user, 'post', like), (user, 'delete', unlike)] * (self.THREADS // 2))
+        self.assertNotIn(status.HTTP_500_INTERNAL_SERVER_ERROR, codes)
+        self.assertTrue(set(codes) <= {status.HTTP_200_OK, status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST})
+        self.post.refresh_from_db()
+        likes = Like.objects.filter(post=self.post, user=user).count()
+        self.assertLessEqual(likes, 1)
+        self.assertEqual(self.post.likes_count, likes)
+        delivery.flush()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PostResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='author', password='testpass123')
+        self.reader = get_user_model().objects.create_user(username='reader', password='testpass123')
+        self.post = Post.objects.create(author=self.author, title='Hello', content='World')
+        self.url = f'/api/posts/{self.post.id}/'
+        self.client.force_authenticate(user=self.reader)
+
+    def write(self, method, path, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(path, data)
+
+    def test_repeat_reads_are_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        # Only the viewer's like is looked up
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertIn('private', second['Cache-Control'])
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+        response = self.client.get(self.url, headers={'if-none-match': f'W/{etag}, "other"'})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_is_liked_is_per_viewer(self):
+        self.write('post', f'{self.url}like/')
+        self.assertTrue(self.client.get(self.url).data['is_liked'])
+        self.client.force_authenticate(user=self.author)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertFalse(response.data['is_liked'])
+        self.assertEqual(response.data['likes_count'], 1)
+
+    def test_writes_invalidate_the_cached_detail(self):
+        etag = self.client.get(self.url)['ETag']
+
+        self.write('post', f'{self.url}like/')
+        response = self.client.get(self.url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['likes_count'], [like['user'] for like in response.data['likes']]),
+                         (1, ['reader']))
+
+        self.write('post', '/api/comments/', {'post': self.post.id, 'content': 'Nice'})
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['comments_count'], 1)
+        self.assertEqual([comment['content'] for comment in response.data['comments']], ['Nice'])
+
+        self.client.force_authenticate(user=self.author)
+        self.write('patch', self.url, {'title': 'Edited'})
+        self.assertEqual(self.client.get(self.url).data['title'], 'Edited')
+
+        # Writes outside the API are caught by the model signals
+        self.author.username = 'renamed'
+        self.author.save()
+        self.assertEqual(self.client.get(self.url).data['author'], 'renamed')
+        Like.objects.filter(post=self.post).delete()
+        self.assertEqual(self.client.get(self.url).data['likes'], [])
+
+        self.write('delete', self.url)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_missing_posts_are_not_cached(self):
+        self.assertEqual(self.client.get('/api/posts/999/').status_code, status.HTTP_404_NOT_FOUND)
+        post = Post.objects.create(pk=999, author=self.author, title='Late', content='Body')
+        self.assertEqual(self.client.get('/api/posts/999/').data['title'], post.title)
+
+
+@override_settings(RESPONSE_CACHE={'TTL': 60, 'LOCK_TTL': 10, 'LOCK_WAIT': 0.5})
+class StampedeLockTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.fills = 0
+
+    def fill(self):
+        self.fills += 1
+        return 'filled'
+
+    def test_waiters_reuse_the_fill_of_the_lock_holder(self):
+        cache.add('hot:lock', True)
+        timer = threading.Timer(0.1, cache.set, args=('hot', 'from holder'))
+        timer.start()
+        self.assertEqual(response_cache.get_or_fill('hot', self.fill), 'from holder')
+        timer.join()
+        self.assertEqual(self.fills, 0)
+
+    def test_waiters_compute_without_caching_after_lock_wait(self):
+        cache.add('hot:lock', True)
+        self.assertEqual(response_cache.get_or_fill('hot', self.fill), 'filled')
+        self.assertIsNone(cache.get('hot'))
+
+    def test_concurrent_misses_fill_once(self):
+        def slow_fill():
+            time.sleep(0.1)
+            return self.fill()
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(response_cache.get_or_fill('hot', slow_fill)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['filled'] * 8)
+        self.assertEqual(self.fills, 1)
+        self.assertIsNone(cache.get('hot:lock'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PostQueryCountTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.viewer = get_user_model().objects.create_user(username='viewer', password='testpass123')
+        self.client.force_authenticate(user=self.viewer)
+        self.authors = []
+
+    def create_posts(self, count):
+        # Each post gets its own author, a comment and a like so lazy lookups would show up
+        for i in range(count):
+            author = get_user_model().objects.create_user(
+                username=f'author{len(self.authors)}', password='testpass123'
+            )
+            self.authors.append(author)
+            self.viewer.following.add(author)
+            post = Post.objects.create(
+                author=author, title=f'Post {i}', content='Body', likes_count=1, comments_count=1
+            )
+            fanout_post(post)
+            Comment.objects.create(post=post, author=author, content='First')
+            Like.objects.create(user=self.viewer, post=post)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries), response
+
+    def assert_constant_queries(self, url):
+        self.create_posts(2)
+        small, _ = self.count_queries(url)
+        self.create_posts(8)
+        large, response = self.count_queries(url)
+        self.assertEqual(small, large)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertTrue(all(post['is_liked'] for post in response.data['results']))
+        self.assertTrue(all(post['likes_count'] == 1 for post in response.data['results']))
+
+    def test_post_list_query_count_is_constant(self):
+        self.assert_constant_queries('/api/posts/')
+
+    def test_feed_query_count_is_constant(self):
+        self.assert_constant_queries('/api/feed/')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PostRepresentationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = get_user_model().objects.create_user(username='author', password='testpass123')
+        self.client.force_authenticate(user=self.author)
+        self.post = Post.objects.create(author=self.author, title='Viral', content='Everyone is here')
+        for i in range(12):
+            Comment.objects.create(post=self.post, author=self.author, content=f'Comment {i}')
+
+    def test_list_embeds_only_recent_comments(self):
+        response = self.client.get('/api/posts/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        post = response.data['results'][0]
+        self.assertNotIn('comments', post)
+        self.assertNotIn('likes', post)
+        self.assertEqual(len(post['recent_comments']), RECENT_COMMENTS_LIMIT)
+        self.assertEqual(post['recent_comments'][0]['content'], 'Comment 11')
+
+    def test_detail_embeds_only_newest_comments(self):
+        for i in range(12, DETAIL_COMMENTS_LIMIT + 5):
+            Comment.objects.create(post=self.post, author=self.author, content=f'Comment {i}')
+        response = self.client.get(f'/api/posts/{self.post.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['comments']), DETAIL_COMMENTS_LIMIT)
+        self.assertEqual(response.data['comments'][0]['content'], f'Comment {DETAIL_COMMENTS_LIMIT + 4}')
+        self.assertIn('likes', response.data)
+
+    def test_comments_sub_endpoint_is_paginated(self):
+        response = self.client.get(f'/api/posts/{self.post.id}/comments/', {'count': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 10)
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_likes_sub_endpoint_is_paginated(self):
+        Like.objects.create(user=self.author, post=self.post)
+        response = self.client.get(f'/api/posts/{self.post.id}/likes/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['user'], 'author')
+
+    def test_sub_endpoints_404_for_missing_post(self):
+        response = self.client.get('/api/posts/999/comments/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TimelineTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.reader = get_user_model().objects.create_user(username='reader', password='testpass123')
+        self.writer = get_user_model().objects.create_user(username='writer', password='testpass123')
+        self.client.force_authenticate(user=self.reader)
+
+    def feed_titles(self):
+        response = self.client.get('/api/feed/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['title'] for post in response.data['results']]
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        self.client.post(f'/api/follow/{self.writer.id}/')
+        self.client.force_authenticate(user=self.writer)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/posts/', {'title': 'Fresh', 'content': 'Just posted'})
+
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post__title='Fresh').exists())
+        self.client.force_authenticate(user=self.reader)
+        self.assertEqual(self.feed_titles(), ['Fresh'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        Post.objects.create(author=self.writer, title='Older', content='Before the follow')
+
+        self.client.post(f'/api/follow/{self.writer.id}/')
+        self.assertEqual(self.feed_titles(), ['Older'])
+
+        self.client.post(f'/api/unfollow/{self.writer.id}/')
+        self.assertEqual(self.feed_titles(), [])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_high_follower_authors_are_pulled(self):
+        self.client.post(f'/api/follow/{self.writer.id}/')
+        self.writer.refresh_from_db()
+        post = Post.objects.create(author=self.writer, title='Celebrity', content='Not fanned out')
+        fanout_post(post)
+
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed_titles(), ['Celebrity'])
+
+    def test_fanout_waits_for_the_commit(self):
+        self.reader.following.add(self.writer)
+        self.client.force_authenticate(user=self.writer)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post('/api/posts/', {'title': 'Fresh', 'content': 'Just posted'})
+            self.assertFalse(TimelineEntry.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader).exists())
+
+    @override_settings(FEED_TIMELINE_MAX_ENTRIES=3)
+    def test_timelines_keep_only_their_newest_entries(self):
+        self.reader.following.add(self.writer)
+        for i in range(5):
+            fanout_post(Post.objects.create(author=self.writer, title=f'Post {i}', content='Body'))
+        other = get_user_model().objects.create_user(username='other', password='testpass123')
+        Post.objects.create(author=other, title='Backfilled', content='Body')
+        self.client.post(f'/api/follow/{other.id}/')
+        # Short timelines are left alone
+        self.writer.following.add(other)
+        fanout_post(Post.objects.create(author=other, title='Post 5', content='Body'))
+
+        out = StringIO()
+        call_command('trim_timelines', batch_size=1, stdout=out)
+        self.assertIn('Deleted 4 timeline entries', out.getvalue())
+        self.assertEqual(self.feed_titles(), ['Post 5', 'Backfilled', 'Post 4'])
+        self.assertEqual(TimelineEntry.objects.filter(user=self.writer).count(), 1)
+
+    def test_pulled_and_pushed_posts_page_together(self):
+        celebrity = get_user_model().objects.create_user(username='celebrity', password='testpass123')
+        self.reader.following.add(self.writer, celebrity)
+        get_user_model().objects.filter(pk=celebrity.pk).update(followers_count=10 ** 6)
+        celebrity.refresh_from_db()
+        created_at = timezone.now()
+        for i in range(12):
+            author = self.writer if i % 2 else celebrity
+            post = Post.objects.create(author=author, title=f'Post {i}', content='Body')
+            Post.objects.filter(pk=post.pk).update(created_at=created_at)
+            post.created_at = created_at
+            fanout_post(post)
+        self.assertEqual(TimelineEntry.objects.count(), 6)
+
+        titles = []
+        response = self.client.get('/api/feed/', {'page_size': 5, 'count': 'true'})
+        self.assertEqual(response.data['count'], 12)
+        while True:
+            titles.extend(post['title'] for post in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(titles, [f'Post {i}' for i in reversed(range(12))])
+
+    @override_settings(FEED_MODE='query')
+    def test_query_mode_reads_followed_authors_directly(self):
+        self.reader.following.add(self.writer)
+        Post.objects.create(author=self.writer, title='Direct', content='No timeline rows')
+        self.assertEqual(self.feed_titles(), ['Direct'])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class KeysetPaginationTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username='pager', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        # Identical timestamps force the id tie-breaker to keep pages disjoint
+        created_at = timezone.now()
+        self.posts = [
+            Post.objects.create(author=self.user, title=f'Post {i}', content='Body') for i in range(15)
+        ]
+        Post.objects.update(created_at=created_at)
+
+    def collect_titles(self, url, params=None):
+        titles = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            titles.extend(post['title'] for post in response.data['results'])
+            if not response.data['next']:
+                return titles
+            response = self.client.get(response.data['next'])
+
+    def test_pages_cover_every_post_once(self):
+        titles = self.collect_titles('/api/posts/')
+        self.assertEqual(titles, [f'Post {i}' for i in reversed(range(15))])
+
+    def test_count_is_opt_in(self):
+        response = self.client.get('/api/posts/')
+        self.assertNotIn('count', response.data)
+        response = self.client.get('/api/posts/', {'count': 'true'})
+        self.assertEqual(response.data['count'], 15)
+
+    def test_cursor_is_stable_across_inserts(self):
+        first_page = self.client.get('/api/posts/')
+        Post.objects.create(author=self.user, title='Newer', content='Inserted ahead of the cursor')
+
+        second_page = self.client.get(first_page.data['next'])
+        titles = [post['title'] for post in second_page.data['results']]
+        self.assertEqual(titles, [f'Post {i}' for i in reversed(range(5))])
+
+    def test_ordering_filter_is_respected(self):
+        titles = self.collect_titles('/api/posts/', {'ordering': 'created_at', 'page_size': 4})
+        self.assertEqual(titles, [f'Post {i}' for i in range(15)])
+
+    def test_ordering_by_a_relation_keeps_the_default_cursor(self):
+        reader = get_user_model().objects.create_user(username='reader', password='testpass123')
+        reader.following.add(self.user)
+        for post in self.posts:
+            fanout_post(post)
+        self.client.force_authenticate(user=reader)
+        titles = self.collect_titles('/api/feed/', {'ordering': 'author'})
+        self.assertEqual(titles, [f'Post {i}' for i in reversed(range(15))])
+
+    def test_unsupported_cursor_fields_fall_back_to_the_default(self):
+        paginator = KeysetPagination()
+        self.assertEqual(paginator.get_ordering(Post.objects.order_by('author')), ('created_at', True))
+        self.assertEqual(paginator.get_ordering(Like.objects.order_by('-post')), ('created_at', True))
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get('/api/posts/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PostSearchTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username='searcher', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        Post.objects.create(author=self.user, title='Django tips', content='Notes about querysets')
+        Post.objects.create(author=self.user, title='Gardening', content='Tomatoes love Django music')
+        Post.objects.create(author=self.user, title='Cooking', content='Nothing relevant here')
+
+    def search_titles(self, term):
+        response = self.client.get('/api/posts/', {'search': term})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [post['title'] for post in response.data['results']]
+
+    def test_title_matches_rank_above_content_matches(self):
+        self.assertEqual(self.search_titles('django'), ['Django tips', 'Gardening'])
+
+    def test_ranked_results_paginate_by_rank(self):
+        response = self.client.get('/api/posts/', {'search': 'django', 'page_size': 1})
+        self.assertEqual([post['title'] for post in response.data['results']], ['Django tips'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([post['title'] for post in response.data['results']], ['Gardening'])
+        self.assertIsNone(response.data['next'])
+
+    def test_prefix_terms_match(self):
+        self.assertEqual(self.search_titles('tomat'), ['Gardening'])
+
+    def test_ranked_results_respect_filters(self):
+        other = get_user_model().objects.create_user(username='other_searcher', password='testpass123')
+        for index in range(3):
+            Post.objects.create(author=other, title=f'Django {index}', content='django')
+        response = self.client.get('/api/posts/', {'search': 'django', 'author': self.user.pk, 'page_size': 1})
+        self.assertEqual([post['title'] for post in response.data['results']], ['Django tips'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([post['title'] for post in response.data['results']], ['Gardening'])
+        self.assertIsNone(response.data['next'])
+
+    def test_explicit_ordering_overrides_rank(self):
+        response = self.client.get('/api/posts/', {'search': 'django', 'ordering': 'created_at', 'count': 'true'})
+        self.assertEqual([post['title'] for post in response.data['results']], ['Django tips', 'Gardening'])
+        self.assertEqual(response.data['count'], 2)
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.get(title='Cooking')
+        post.content = 'Now about Django too'
+        post.save()
+        self.assertIn('Cooking', self.search_titles('django'))
+
+        post.delete()
+        self.assertNotIn('Cooking', self.search_titles('django'))
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search_titles('"django": (tips*'), ['Django tips'])
+        self.assertEqual(self.search_titles('***'), [])
+
+    def test_rebuild_command_indexes_bulk_created_posts(self):
+        Post.objects.bulk_create([Post(author=self.user, title='Bulk import', content='zeppelin')])
+        self.assertEqual(self.search_titles('zeppelin'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search_titles('zeppelin'), ['Bulk import'])
@@ -0,0 +1,215 @@
+"""Fan-out-on-write home timelines, with the posts of heavily followed authors pulled in at read time."""
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from social_media_api.conf import Singleton
+from .models import Post, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def feed_mode():
+    return getattr(settings, 'FEED_MODE', 'timeline')
+
+
+def max_fanout_followers():
+    return getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 10000)
+
+
+def backfill_size():
+    return getattr(settings, 'FEED_BACKFILL_POSTS', 100)
+
+
+def max_timeline_entries():
+    return getattr(settings, 'FEED_TIMELINE_MAX_ENTRIES', 1000)
+
+
+def fanout_async():
+    return getattr(settings, 'FEED_FANOUT_ASYNC', True)
+
+
+def is_pull_author(author):
+    """Authors above the fan-out threshold are read on demand instead of pushed"""
+    return author.followers_count > max_fanout_followers()
+
+
+def pull_author_ids(user):
+    """Ids of the accounts `user` follows whose posts are not fanned out"""
+    return list(
+        user.following.filter(followers_count__gt=max_fanout_followers())
+        .values_list('pk', flat=True)
+    )
+
+
+def trim_timelines(user_ids):
+    """
+    Drop everything past the newest FEED_TIMELINE_MAX_ENTRIES rows of the given
+    timelines; returns the number of rows deleted. Run by `manage.py trim_timelines`.
+    """
+    limit = max_timeline_entries()
+    oversized = list(
+        TimelineEntry.objects.filter(user_id__in=user_ids)
+        .order_by()
+        .values('user_id')
+        .annotate(total=Count('pk'))
+        .filter(total__gt=limit)
+        .values_list('user_id', flat=True)
+    )
+    deleted = 0
+    for user_id in oversized:
+        entries = TimelineEntry.objects.filter(user_id=user_id)
+        # The oldest entry that stays, found by walking the (user, created_at, post) index
+        oldest = entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[limit - 1]
+        deleted += entries.filter(_after('created_at', 'post_id', oldest, True)).delete()[0]
+    return deleted
+
+
+def _insert_entries(user_ids, post):
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, created_at=post.created_at) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+def fanout_post(post):
+    """Push a new post into the timelines of its author's followers"""
+    if is_pull_author(post.author):
+        return
+    batch = []
+    follower_ids = post.author.followers.values_list('pk', flat=True)
+    for follower_id in follower_ids.iterator(chunk_size=FANOUT_BATCH_SIZE):
+        batch.append(follower_id)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            _insert_entries(batch, post)
+            batch = []
+    if batch:
+        _insert_entries(batch, post)
+
+
+_executor = Singleton(
+    'FEED_FANOUT_ASYNC',
+    lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix='timeline-fanout'),
+    close=lambda executor: executor.shutdown(wait=True),
+)
+get_executor = _executor.get
+reset_executor = _executor.reset
+
+
+def _run(post_id):
+    try:
+        post = Post.objects.select_related('author').filter(pk=post_id).first()
+        if post is not None:
+            fanout_post(post)
+    except Exception:
+        logger.exception('Timeline fan-out failed for post %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_fanout(post):
+    """Fan the post out after the current transaction commits (in the background unless FEED_FANOUT_ASYNC is False)"""
+    def submit():
+        if fanout_async():
+            get_executor().submit(_run, post.pk)
+        else:
+            fanout_post(post)
+    transaction.on_commit(submit)
+
+
+def recent_posts_by_author(authors):
+    """(post id, created_at) of the newest FEED_BACKFILL_POSTS posts of each fanned-out author, by author id"""
+    author_ids = [author.pk for author in authors if not is_pull_author(author)]
+    if not author_ids:
+        return {}
+    ranked = Post.objects.filter(author_id__in=author_ids).annotate(
+        position=Window(RowNumber(), partition_by=F('author_id'), order_by=[F('created_at').desc(), F('pk').desc()])
+    )
+    posts = {}
+    for author_id, post_id, created_at in (
+        ranked.filter(position__lte=backfill_size()).values_list('author_id', 'pk', 'created_at')
+    ):
+        posts.setdefault(author_id, []).append((post_id, created_at))
+    return posts
+
+
+def backfill_timelines(edges):
+    """Copy followed authors' recent posts into new followers' timelines; `edges` are (user id, author) pairs"""
+    posts = recent_posts_by_author({author for _, author in edges})
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=post_id, created_at=created_at)
+            for user_id, author in edges
+            for post_id, created_at in posts.get(author.pk, ())
+        ],
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_timeline(user, *authors):
+    """Copy authors' recent posts into a new follower's timeline"""
+    if authors:
+        backfill_timelines([(user.pk, author) for author in authors])
+
+
+def prune_timeline(user, *authors):
+    """Drop unfollowed authors' posts from the user's timeline"""
+    if authors:
+        TimelineEntry.objects.filter(user=user, post__author__in=authors).delete()
+
+
+def feed_queryset(user):
+    """Posts making up `user`'s home feed for the configured FEED_MODE"""
+    if feed_mode() == 'query':
+        return Post.objects.filter(author__in=user.following.all())
+    timeline_post_ids = TimelineEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(
+        Q(pk__in=timeline_post_ids) | Q(author_id__in=pull_author_ids(user))
+    )
+
+
+def _after(field, pk_field, after, descending):
+    if after is None:
+        return Q()
+    value, pk = after
+    lookup = 'lt' if descending else 'gt'
+    return Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'{pk_field}__{lookup}': pk})
+
+
+def feed_keys(user, limit, after=None, descending=True):
+    """
+    The (created_at, post id) keys of the next `limit` posts of `user`'s timeline
+    following the `after` key. Both sources are range scans on their own index;
+    post_id breaks created_at ties so every key is unique within a timeline.
+    """
+    direction = '-' if descending else ''
+    pushed = (
+        TimelineEntry.objects.filter(Q(user=user) & _after('created_at', 'post_id', after, descending))
+        .order_by(f'{direction}created_at', f'{direction}post_id')
+        .values_list('created_at', 'post_id')[:limit]
+    )
+    sources = [list(pushed)]
+    pull_ids = pull_author_ids(user)
+    if pull_ids:
+        pulled = (
+            Post.objects.filter(Q(author_id__in=pull_ids) & _after('created_at', 'pk', after, descending))
+            .order_by(f'{direction}created_at', f'{direction}pk')
+            .values_list('created_at', 'pk')[:limit]
+        )
+        sources.append(list(pulled))
+
+    keys = []
+    # Posts fanned out before their author crossed the threshold come from both sources
+    for key in heapq.merge(*sources, reverse=descending):
+        if not keys or keys[-1] != key:
+            keys.append(key)
+        if len(keys) == limit:
+            break
+    return keys
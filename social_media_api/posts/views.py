@@ -1,13 +1,23 @@
 from rest_framework import viewsets, permissions, filters, generics, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F, FloatField, Prefetch
 from django.shortcuts import get_object_or_404
 from django.contrib.contenttypes.models import ContentType
 from .models import Post, Comment, Like
-from .serializers import PostSerializer, PostCreateUpdateSerializer, CommentSerializer
-from notifications.models import Notification
+from .serializers import (
+    PostSerializer, PostDetailSerializer, PostCreateUpdateSerializer,
+    CommentSerializer, LikeSerializer, RECENT_COMMENTS_LIMIT, DETAIL_COMMENTS_LIMIT, DETAIL_LIKES_LIMIT,
+)
+from notifications.delivery import notify, retract
+from notifications.realtime import publish_feed_item
+from social_media_api import response_cache
+from social_media_api.idempotency import idempotent
+from . import likes, timeline
+from .search import search_keys, search_posts
 
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
@@ -21,38 +31,126 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
         return obj.author == request.user
 
 
+def recent_comments_prefetch():
+    """Prefetch a bounded slice of each post's newest comments with their authors"""
+    return Prefetch(
+        'comments',
+        queryset=Comment.objects.select_related('author').order_by('-created_at', '-id')[:RECENT_COMMENTS_LIMIT],
+        to_attr='recent_comments',
+    )
+
+
 class PostViewSet(viewsets.ModelViewSet):
     """ViewSet for posts with CRUD operations"""
     queryset = Post.objects.all()
     permission_classes = [permissions.IsAuthenticated, IsAuthorOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    # ?search= is served by the full-text index in get_queryset rather than SearchFilter
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['author']
-    search_fields = ['title', 'content']
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return PostCreateUpdateSerializer
+        if self.action == 'retrieve':
+            return PostDetailSerializer
         return PostSerializer
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        timeline.schedule_fanout(post)
+        transaction.on_commit(lambda: publish_feed_item(post))
 
     def get_queryset(self):
-        queryset = Post.objects.all()
-        # Add search functionality
-        search = self.request.query_params.get('search', None)
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) | Q(content__icontains=search)
+        queryset = Post.objects.select_related('author')
+        if self.action == 'list':
+            queryset = queryset.prefetch_related(recent_comments_prefetch())
+        elif self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    'comments',
+                    queryset=Comment.objects.select_related('author')
+                    .order_by('-created_at', '-id')[:DETAIL_COMMENTS_LIMIT],
+                    to_attr='detail_comments',
+                ),
+                Prefetch(
+                    'likes',
+                    queryset=Like.objects.select_related('user').order_by('-created_at', '-id')[:DETAIL_LIKES_LIMIT],
+                    to_attr='detail_likes',
+                ),
             )
+        # Add search functionality; ranked searches are matched by search_keys in list()
+        search = self.request.query_params.get('search', None)
+        if search and not self.is_ranked_search():
+            queryset = search_posts(queryset, search)
         return queryset
 
+    def is_ranked_search(self):
+        """Search hits are ranked by relevance unless the client asked for an explicit ordering"""
+        params = self.request.query_params
+        return self.action == 'list' and bool(params.get('search')) and not params.get('ordering')
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_ranked_search():
+            return super().list(request, *args, **kwargs)
+
+        # Page over the index's (rank, post id) keys, then load only the posts on the page
+        search = request.query_params['search']
+        queryset = self.filter_queryset(self.get_queryset())
+        keys = self.paginator.paginate_keys(
+            request,
+            lambda limit, after: search_keys(queryset, search, limit, after),
+            FloatField(),
+            count=lambda: search_posts(queryset, search).count(),
+        )
+        posts = queryset.in_bulk([pk for _, pk in keys])
+        page = [posts[pk] for _, pk in keys if pk in posts]
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        # Served from the response cache; only the viewer's is_liked is looked up per request
+        post_id = self.kwargs['pk']
+        if not post_id.isdigit():
+            raise NotFound()
+        version, data = response_cache.lookup('post', post_id, lambda: self.detail_cache_entry(post_id), 'detail')
+        is_liked = Like.objects.filter(user=request.user, post_id=post_id).exists()
+        etag = response_cache.make_etag('post', post_id, version, int(is_liked))
+        return response_cache.conditional_response(request, {**data, 'is_liked': is_liked}, etag)
+
+    def detail_cache_entry(self, post_id):
+        post = generics.get_object_or_404(self.get_queryset(), pk=post_id)
+        self.check_object_permissions(self.request, post)
+        # An empty liked set keeps the serializer from querying the viewer's like
+        context = {**self.get_serializer_context(), 'liked_post_ids': set()}
+        data = PostDetailSerializer(post, context=context).data
+        del data['is_liked']
+        return data
+
+    def paginated_response(self, queryset, serializer_class):
+        page = self.paginate_queryset(queryset)
+        serializer = serializer_class(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='comments')
+    def comments(self, request, pk=None):
+        """Paginated comments of a single post"""
+        post = self.get_object()
+        queryset = post.comments.select_related('author').order_by('-created_at', '-id')
+        return self.paginated_response(queryset, CommentSerializer)
+
+    @action(detail=True, methods=['get'], url_path='likes')
+    def likes(self, request, pk=None):
+        """Paginated likes of a single post"""
+        post = self.get_object()
+        queryset = post.likes.select_related('user').order_by('-created_at', '-id')
+        return self.paginated_response(queryset, LikeSerializer)
+
 
 class CommentViewSet(viewsets.ModelViewSet):
     """ViewSet for comments with CRUD operations"""
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated, IsAuthorOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
@@ -60,61 +158,98 @@ class CommentViewSet(viewsets.ModelViewSet):
     ordering_fields = ['created_at', 'updated_at']
     ordering = ['-created_at']
 
+    @transaction.atomic
     def perform_create(self, serializer):
         comment = serializer.save(author=self.request.user)
+        Post.objects.filter(pk=comment.post_id).update(comments_count=F('comments_count') + 1)
         # Create notification for post author
         if comment.post.author != self.request.user:
-            Notification.objects.create(
+            notify(
                 recipient=comment.post.author,
                 actor=self.request.user,
                 verb='commented on your post',
                 target=comment.post
             )
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        post_id = instance.post_id
+        instance.delete()
+        Post.objects.filter(pk=post_id).update(comments_count=F('comments_count') - 1)
+
 
 class FeedView(generics.ListAPIView):
     """Feed view showing posts from followed users"""
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['created_at']
     ordering = ['-created_at']
 
     def get_queryset(self):
-        user = self.request.user
-        # Get posts from users that the current user follows
-        following_users = user.following.all()
-        return Post.objects.filter(author__in=following_users).order_by('-created_at')
+        # Posts from followed users, read from the materialized timeline by default
+        return (
+            timeline.feed_queryset(self.request.user)
+            .select_related('author')
+            .prefetch_related(recent_comments_prefetch())
+            .order_by('-created_at')
+        )
+
+    def list(self, request, *args, **kwargs):
+        if timeline.feed_mode() == 'query':
+            return super().list(request, *args, **kwargs)
+
+        # Page over the timeline's (created_at, post id) keys, then load only the posts on the page
+        _, descending = self.paginator.get_ordering(self.filter_queryset(Post.objects.all()))
+        keys = self.paginator.paginate_keys(
+            request,
+            lambda limit, after: timeline.feed_keys(request.user, limit, after, descending),
+            Post._meta.get_field('created_at'),
+            count=lambda: timeline.feed_queryset(request.user).count(),
+        )
+        posts = (
+            Post.objects.select_related('author')
+            .prefetch_related(recent_comments_prefetch())
+            .in_bulk([pk for _, pk in keys])
+        )
+        page = [posts[pk] for _, pk in keys if pk in posts]
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def like_post(request, pk):
     """Like a post"""
-    post = generics.get_object_or_404(Post, pk=pk)
-    like, created = Like.objects.get_or_create(user=request.user, post=post)
-    
-    if created:
-        # Create notification for post author
-        if post.author != request.user:
-            Notification.objects.create(
-                recipient=post.author,
-                actor=request.user,
-                verb='liked your post',
-                target=post
-            )
-        return Response({'message': 'Post liked'}, status=status.HTTP_201_CREATED)
-    else:
+    post = likes.like(request.user, pk)
+    if post is None:
+        # Nothing was inserted: either the post does not exist or it is already liked
+        generics.get_object_or_404(Post.objects.only('pk'), pk=pk)
         return Response({'message': 'You already liked this post'}, status=status.HTTP_400_BAD_REQUEST)
 
+    # Create notification for post author
+    if post.author_id != request.user.pk:
+        notify(
+            recipient=post.author,
+            actor=request.user,
+            verb='liked your post',
+            target=post
+        )
+    return Response({'message': 'Post liked'}, status=status.HTTP_201_CREATED)
+
 
 @api_view(['DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def unlike_post(request, pk):
     """Unlike a post"""
-    post = generics.get_object_or_404(Post, pk=pk)
-    try:
-        like = Like.objects.get(user=request.user, post=post)
-        like.delete()
-        return Response({'message': 'Post unliked'}, status=status.HTTP_200_OK)
-    except Like.DoesNotExist:
+    post = likes.unlike(request.user, pk)
+    if post is None:
+        generics.get_object_or_404(Post.objects.only('pk'), pk=pk)
         return Response({'message': 'You have not liked this post'}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Drop the like notification if it has not been delivered yet
+    if post.author_id != request.user.pk:
+        retract(recipient=post.author, actor=request.user, verb='liked your post', target=post)
+    return Response({'message': 'Post unliked'}, status=status.HTTP_200_OK)
@@ -0,0 +1,187 @@
+"""Token authentication that rebuilds request.user from a cached snapshot (settings.TOKEN_AUTH_CACHE)."""
+import threading
+import time
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .conf import Singleton, get_options
+
+DEFAULTS = {
+    'BACKEND': 'local',
+    'MAX_ENTRIES': 10000,
+    'TTL': 30,
+}
+SNAPSHOT_FIELDS = ('id', 'username', 'email', 'first_name', 'last_name', 'is_active', 'is_staff', 'is_superuser')
+# Saving any of these makes cached snapshots of the user stale
+INVALIDATING_FIELDS = set(SNAPSHOT_FIELDS) | {'password'}
+CACHE_KEY = 'auth-token:{}'
+REVISION_KEY = 'auth-token-revision:{}'
+
+
+class CacheMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_invalidation(self):
+        with self.lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class LocalTokenStore:
+    """Process-local LRU of token key -> (expiry, revision, snapshot)"""
+    name = 'local'
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def revision(self, key):
+        """How often the token has been invalidated, by any process"""
+        return cache.get(REVISION_KEY.format(key), 0)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, revision, snapshot = entry
+        if expires_at < time.monotonic() or revision != self.revision(key):
+            with self.lock:
+                self.entries.pop(key, None)
+            return None
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+        return snapshot
+
+    def set(self, key, snapshot, revision=0):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, revision, snapshot)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        # Outlives every entry cached before the bump; once it expires, entries merely miss
+        revision_key = REVISION_KEY.format(key)
+        cache.add(revision_key, 0, self.ttl * 2)
+        try:
+            cache.incr(revision_key)
+        except ValueError:
+            cache.set(revision_key, 1, self.ttl * 2)
+
+    def size(self):
+        return len(self.entries)
+
+
+class DjangoCacheTokenStore:
+    """Token snapshots in the configured Django cache, shared between processes"""
+    name = 'cache'
+
+    def __init__(self, max_entries, ttl):
+        self.ttl = ttl
+
+    def revision(self, key):
+        return 0
+
+    def get(self, key):
+        return cache.get(CACHE_KEY.format(key))
+
+    def set(self, key, snapshot, revision=0):
+        cache.set(CACHE_KEY.format(key), snapshot, self.ttl)
+
+    def delete(self, key):
+        cache.delete(CACHE_KEY.format(key))
+
+    def size(self):
+        return None
+
+
+BACKENDS = {
+    'local': LocalTokenStore,
+    'cache': DjangoCacheTokenStore,
+}
+
+def _build_store():
+    options = get_options('TOKEN_AUTH_CACHE', DEFAULTS)
+    return BACKENDS[options['BACKEND']](options['MAX_ENTRIES'], options['TTL'])
+
+
+_store = Singleton('TOKEN_AUTH_CACHE', _build_store)
+get_store = _store.get
+reset_store = _store.reset
+metrics = CacheMetrics()
+
+
+def stats():
+    store = get_store()
+    return {'backend': store.name, 'size': store.size(), **metrics.snapshot()}
+
+
+def snapshot_user(user):
+    """The cached columns of `user`, in model field order"""
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in user._meta.concrete_fields if field.attname in SNAPSHOT_FIELDS
+    }
+
+
+def user_from_snapshot(snapshot):
+    User = get_user_model()
+    return User.from_db(router.db_for_read(User), list(snapshot), list(snapshot.values()))
+
+
+def invalidate(key):
+    get_store().delete(key)
+    metrics.record_invalidation()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in TokenAuthentication that serves repeat tokens from the token cache"""
+
+    def authenticate_credentials(self, key):
+        store = get_store()
+        snapshot = store.get(key)
+        metrics.record(hit=snapshot is not None)
+        if snapshot is None:
+            # Read before the user, so a revocation racing this lookup is not cached over
+            revision = store.revision(key)
+            user, token = super().authenticate_credentials(key)
+            store.set(key, snapshot_user(user), revision)
+            return user, token
+
+        user = user_from_snapshot(snapshot)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, Token(key=key, user=user)
+
@@ -0,0 +1,42 @@
+"""Settings dictionaries merged over their defaults, and the per-process objects built from them."""
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+
+
+def get_options(name, defaults):
+    return {**defaults, **getattr(settings, name, {})}
+
+
+class Singleton:
+    """
+    An object built by `factory()` on first use and dropped, after
+    `close(instance)`, whenever `setting` is overridden (e.g. in tests).
+    """
+
+    def __init__(self, setting, factory, close=None):
+        self.setting = setting
+        self.factory = factory
+        self.close = close
+        self.instance = None
+        self.lock = threading.Lock()
+        setting_changed.connect(self.reset, weak=False)
+
+    def get(self):
+        with self.lock:
+            if self.instance is None:
+                self.instance = self.factory()
+            return self.instance
+
+    def peek(self):
+        """The current instance without building one"""
+        return self.instance
+
+    def reset(self, setting=None, **kwargs):
+        if setting is not None and setting != self.setting:
+            return
+        with self.lock:
+            instance, self.instance = self.instance, None
+        if instance is not None and self.close is not None:
+            self.close(instance)
@@ -0,0 +1,66 @@
+"""Idempotency-Key support: the first response to a key is replayed to retries of the same write."""
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+from . import conf
+
+DEFAULTS = {
+    'TTL': 300,
+    # How long a request may hold its key before a repeat is allowed to run again
+    'LOCK_TTL': 30,
+}
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+CACHE_KEY = 'idempotency:{}'
+
+
+def get_options():
+    return conf.get_options('IDEMPOTENCY', DEFAULTS)
+
+
+def cache_key(request, key):
+    scope = f'{request.user.pk}:{request.method}:{request.path}:{key}'
+    return CACHE_KEY.format(hashlib.sha256(scope.encode()).hexdigest())
+
+
+def idempotent(view):
+    """Decorate a DRF function view (inside @api_view) to honour Idempotency-Key"""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        options = get_options()
+        response_key = cache_key(request, key)
+        lock_key = f'{response_key}:lock'
+        stored = cache.get(response_key)
+        if stored is None:
+            if not cache.add(lock_key, True, options['LOCK_TTL']):
+                return Response(
+                    {'error': f'A request with this {HEADER} is still in progress'},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            try:
+                # Another request may have finished between the first lookup and taking the lock
+                stored = cache.get(response_key)
+                if stored is None:
+                    response = view(request, *args, **kwargs)
+                    if response.status_code < 500:
+                        cache.set(response_key, (response.status_code, response.data), options['TTL'])
+                    return response
+            finally:
+                cache.delete(lock_key)
+
+        status_code, data = stored
+        return Response(data, status=status_code, headers={REPLAYED_HEADER: 'true'})
+    return wrapped
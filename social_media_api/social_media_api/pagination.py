@@ -0,0 +1,149 @@
+"""Keyset pagination over (ordering value, id) cursors, shared by the list endpoints."""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination keyed on the queryset's first ordering field plus the primary key"""
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # The total is an extra COUNT(*) over the whole result set, so it is opt-in (?count=true)
+    count_query_param = 'count'
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(queryset)
+
+        direction = '-' if self.descending else ''
+        queryset = queryset.order_by(f'{direction}{self.field}', f'{direction}pk')
+        self.count = queryset.count() if self.include_count(request) else None
+
+        cursor = self.decode_cursor(request, queryset)
+        if cursor is not None:
+            value, pk = cursor
+            lookup = 'lt' if self.descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) | Q(**{self.field: value, f'pk__{lookup}': pk})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.next_cursor = self.encode_cursor(results[-1]) if self.has_next else None
+        return results
+
+    def paginate_keys(self, request, fetch_keys, field, count=None):
+        """
+        Paginate a list merged from several sources by its (value, pk) keys;
+        `fetch_keys(limit, after)` returns up to `limit` keys in page order
+        following the `after` key, and `field` parses the cursor value.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = count() if count is not None and self.include_count(request) else None
+
+        keys = list(fetch_keys(self.page_size + 1, self.parse_cursor(request, field)))
+        self.has_next = len(keys) > self.page_size
+        keys = keys[:self.page_size]
+        self.next_cursor = self.make_cursor(*keys[-1]) if self.has_next else None
+        return keys
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict([('next', self.get_next_link())])
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'count': {'type': 'integer'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def include_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ['true', '1', 'yes']
+
+    def get_ordering(self, queryset):
+        """
+        Use the first ordering of the queryset, e.g. one chosen by OrderingFilter or
+        an annotation such as a search rank, falling back to the model's ordering
+        and then `default_ordering`.
+        """
+        ordering = list(queryset.query.order_by)[:1] + list(queryset.model._meta.ordering)[:1]
+        for field in ordering + [self.default_ordering]:
+            if isinstance(field, str) and self.get_output_field(queryset, field.lstrip('-')) is not None:
+                return field.lstrip('-'), field.startswith('-')
+        raise ImproperlyConfigured(f'{queryset.model.__name__} has no field to key pages on')
+
+    def get_output_field(self, queryset, name):
+        """The field behind a cursor column, or None if `name` cannot key a cursor"""
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        try:
+            field = queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        # A cursor stores the value as JSON, which model instances (foreign keys) are not
+        if field.is_relation or not field.concrete:
+            return None
+        return field
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def encode_cursor(self, obj):
+        return self.make_cursor(getattr(obj, self.field), obj.pk)
+
+    def make_cursor(self, value, pk):
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        position = json.dumps([value, pk], separators=(',', ':'))
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request, queryset):
+        return self.parse_cursor(request, self.get_output_field(queryset, self.field))
+
+    def parse_cursor(self, request, field):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            value = field.to_python(value)
+            pk = int(pk)
+        except (TypeError, ValueError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
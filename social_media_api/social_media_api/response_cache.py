@@ -0,0 +1,100 @@
+"""Versioned, ETag-aware response cache for single-object read endpoints."""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from . import conf
+
+DEFAULTS = {
+    'TTL': 300,
+    # How long a filling request may hold a key's lock
+    'LOCK_TTL': 10,
+    # How long other requests wait for that fill before computing the response themselves
+    'LOCK_WAIT': 2.0,
+}
+POLL_INTERVAL = 0.02
+VERSION_KEY = 'response-version:{}:{}'
+ENTRY_KEY = 'response:{}:{}:{}'
+
+
+def get_options():
+    return conf.get_options('RESPONSE_CACHE', DEFAULTS)
+
+
+def get_version(kind, pk):
+    key = VERSION_KEY.format(kind, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(kind, pks):
+    for pk in pks:
+        key = VERSION_KEY.format(kind, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump(kind, *pks):
+    """Invalidate the cached responses of the given objects now and again on commit"""
+    _bump(kind, pks)
+    transaction.on_commit(lambda: _bump(kind, pks))
+
+
+def get_or_fill(key, fill):
+    """The cached value of `key`, computed with `fill()` by a single request on a miss"""
+    entry = cache.get(key)
+    if entry is not None:
+        return entry
+
+    options = get_options()
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + options['LOCK_WAIT']
+    while not cache.add(lock_key, True, options['LOCK_TTL']):
+        # Another request is filling this key: wait for it instead of querying as well
+        if time.monotonic() >= deadline:
+            return fill()
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    try:
+        entry = cache.get(key)
+        if entry is None:
+            entry = fill()
+            cache.set(key, entry, options['TTL'])
+        return entry
+    finally:
+        cache.delete(lock_key)
+
+
+def lookup(kind, pk, fill, variant=''):
+    """(version, entry) for one object; `variant` separates representations of the same version"""
+    version = get_version(kind, pk)
+    return version, get_or_fill(ENTRY_KEY.format(kind, pk, f'{version}:{variant}'), fill)
+
+
+def make_etag(*parts):
+    return quote_etag('-'.join(str(part) for part in parts))
+
+
+def conditional_response(request, data, etag):
+    """200 with `data`, or 304 when the client already holds `etag`"""
+    # If-None-Match uses weak comparison: W/"x" matches "x"
+    client_etags = {value.removeprefix('W/') for value in parse_etags(request.headers.get('If-None-Match', ''))}
+    if etag in client_etags or '*' in client_etags:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    response['ETag'] = etag
+    # Per-user content: browsers may keep it but must revalidate, shared caches must not store it
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -106,6 +106,29 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing (see accounts/hashers.py)
+# PASSWORD_HASHER picks the hasher for new passwords: 'argon2' (needs argon2-cffi), 'bcrypt'
+# (needs bcrypt) or 'pbkdf2'. The others stay listed so existing hashes still verify; they are
+# upgraded to the preferred hasher on the next successful login.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+_PASSWORD_HASHER_PATHS = {
+    'argon2': 'accounts.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'accounts.hashers.TunedBCryptSHA256PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHER_PATHS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHER_PATHS.items() if name != PASSWORD_HASHER
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+# Cost parameters, and the thread pool the async login view hashes in
+PASSWORD_HASHING = {
+    'ARGON2_TIME_COST': 2,
+    'ARGON2_MEMORY_COST': 65536,
+    'ARGON2_PARALLELISM': 1,
+    'BCRYPT_ROUNDS': 12,
+    'MAX_WORKERS': 4,
+    'MAX_PENDING': 64,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -143,6 +166,13 @@ STATICFILES_FINDERS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Profile picture variants (see accounts/images.py), written to the default file storage
+PROFILE_PICTURES = {
+    'ASYNC': True,
+    'VARIANTS': {'small': (64, 64), 'medium': (256, 256), 'large': (1024, 1024)},
+    'QUALITY': 82,
+}
+
 # AWS S3 Configuration for file hosting (production storage solution)
 USE_S3 = os.environ.get('USE_S3', 'False').lower() in ['true', '1', 'yes']
 
@@ -183,20 +213,108 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'social_media_api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'social_media_api.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # Credential endpoints are throttled before any password is hashed (see accounts/throttles.py)
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_username': '10/min',
+        'register': '20/hour',
+    },
+}
+
+# Token -> user snapshot cache used by CachedTokenAuthentication
+# BACKEND: 'local' (per-process LRU) or 'cache' (the Django cache, shared between processes).
+# 'local' checks a revocation counter in the Django cache on every hit, so with several processes
+# it is only safe once REDIS_URL makes that cache shared; otherwise run a single process or use 'cache'
+TOKEN_AUTH_CACHE = {
+    'BACKEND': os.environ.get('TOKEN_AUTH_CACHE_BACKEND', 'local'),
+    'MAX_ENTRIES': 10000,
+    'TTL': 30,
+}
+
+# Local memory by default; set REDIS_URL to share the cache between processes (same cache API)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'social-media-api',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Cached post detail and profile responses (see social_media_api/response_cache.py)
+RESPONSE_CACHE = {
+    'TTL': 300,
+    'LOCK_TTL': 10,
+    'LOCK_WAIT': 2.0,
+}
+
+# Responses kept for replay to requests repeating an Idempotency-Key header (see social_media_api/idempotency.py)
+IDEMPOTENCY = {
+    'TTL': 300,
+    'LOCK_TTL': 30,
 }
 
+# Home feed configuration
+# 'timeline' reads the fan-out-on-write timeline table, 'query' filters posts by followed authors
+FEED_MODE = os.environ.get('FEED_MODE', 'timeline')
+# Authors with more followers than this are pulled at read time instead of fanned out
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+# Number of recent posts copied into a timeline when following someone
+FEED_BACKFILL_POSTS = 100
+# `manage.py trim_timelines` (run it periodically) cuts timelines down to their newest entries;
+# older posts are no longer reachable from the feed
+FEED_TIMELINE_MAX_ENTRIES = 1000
+# Fan new posts out on a background thread after the request commits
+FEED_FANOUT_ASYNC = True
+
+# Follow suggestions (see accounts/suggestions.py): whether the in-memory follow graph loads
+# on a background thread, suggestions kept per user, cache lifetime of each user's list and
+# how often the graph is reloaded. With PRECOMPUTED, web processes only read the cache, which
+# `manage.py precompute_follow_suggestions` fills (run it more often than CACHE_TTL)
+FOLLOW_SUGGESTIONS = {
+    'ASYNC': True,
+    'TOP_K': 20,
+    'CACHE_TTL': 3600,
+    'GRAPH_TTL': 3600,
+    'PRECOMPUTED': False,
+}
+
+# Notification delivery (see notifications/delivery.py)
+# BACKEND: 'local' (in-process worker thread), 'outbox' (database table drained by
+# `manage.py flush_notifications`) or 'sync' (written during the request)
+NOTIFICATION_QUEUE = {
+    'BACKEND': os.environ.get('NOTIFICATION_QUEUE_BACKEND', 'local'),
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+}
+
+# Server-Sent Events push (/api/stream/). The in-memory broker reaches clients of this process only,
+# so the Procfile's separate web and stream processes need Redis, used whenever a URL is configured
+REALTIME_REDIS_URL = os.environ.get('REALTIME_REDIS_URL', os.environ.get('REDIS_URL'))
+REALTIME_BROKER = os.environ.get(
+    'REALTIME_BROKER',
+    'notifications.realtime.RedisBroker' if REALTIME_REDIS_URL else 'notifications.realtime.InMemoryBroker',
+)
+
 # Security settings for production
 SECURE_BROWSER_XSS_FILTER = True
 X_FRAME_OPTIONS = 'DENY'
@@ -230,5 +348,12 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Writers wait for each other instead of failing with "database is locked"
+            'OPTIONS': {'timeout': 20},
+            # A file rather than shared-cache memory, so concurrent tests get real locking
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
+
+# The test suite runs background work inline (see social_media_api/test_runner.py)
+TEST_RUNNER = 'social_media_api.test_runner.InlineBackgroundWorkRunner'
@@ -0,0 +1,27 @@
+"""Test runner that does the project's background work inline."""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class InlineBackgroundWorkRunner(DiscoverRunner):
+    """
+    Runs notification delivery, feed fan-out, profile picture resizing and
+    follow graph loading during the request, so no worker thread writes to the
+    database after the test that queued the work has finished. Test classes
+    exercising the background paths override these settings again.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.inline_settings = override_settings(
+            NOTIFICATION_QUEUE={**settings.NOTIFICATION_QUEUE, 'BACKEND': 'sync', 'FLUSH_INTERVAL': None},
+            PROFILE_PICTURES={**settings.PROFILE_PICTURES, 'ASYNC': False},
+            FEED_FANOUT_ASYNC=False,
+            FOLLOW_SUGGESTIONS={**settings.FOLLOW_SUGGESTIONS, 'ASYNC': False},
+        )
+        self.inline_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.inline_settings.disable()
+        super().teardown_test_environment(**kwargs)